@@ -1,18 +1,34 @@
 """EMS Pool application entry point."""
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 
 from flask import Blueprint, Flask, abort, g
 
 from app import APP_NAME, APP_VERSION, VERSION_DATE
 from app.achievement_routes import register_achievement_routes
+from app.backup import register_backups, start_backups
+from app.badges import register_badge_helpers
 from app.database import DatabaseManager, db
+from app.fragment_cache import MemoryFragmentBackend, register_fragment_cache
 from app.game_routes import register_game_routes
+from app.local_replica import prepare_local_replica, start_local_replica
 from app.main_routes import register_main_routes
 from app.models import get_data_file_path, get_all_sessions, init_data
+from app.online_migrations import register_online_migrations, start_online_migrations
+from app.org_archive import register_archive_routes
+from app.org_purge import resume_pending_purges
 from app.organization_routes import register_organization_routes
+from app.page_cache import PageCache
 from app.player_routes import register_player_routes
 from app.security import register_security_globals, register_security_routes
+from app.startup import StartupReport
 from app.tournament_routes import register_tournament_routes
+from app.warmup import register_warmup, start_warmup
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 
 def _install_tenant_resolution(tenant):
@@ -34,40 +50,109 @@ def _install_tenant_resolution(tenant):
 
 def create_app(test_config=None):
     """Build the Flask application, optionally targeting an isolated test database."""
-    application = Flask(__name__)
-    application.config.from_mapping(
-        SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key_for_testing'),
-        PERMANENT_SESSION_LIFETIME=604800,
-    )
-    if test_config:
-        application.config.update(test_config)
-
-    database = DatabaseManager(application.config.get('DATABASE_PATH'))
-    application.extensions['database'] = database
-    with application.app_context():
-        init_data()
-
-    tenant = Blueprint('tenant', __name__, url_prefix='/o/<org_slug>')
-    _install_tenant_resolution(tenant)
-    register_main_routes(tenant)
-    register_game_routes(tenant)
-    register_player_routes(tenant)
-    register_achievement_routes(tenant)
-    register_tournament_routes(tenant)
-    register_security_routes(tenant)
-    application.register_blueprint(tenant)
-
-    register_organization_routes(application)
-    register_security_globals(application)
+    report = StartupReport(_IMPORT_SECONDS)
+    with report.phase('config'):
+        application = Flask(__name__)
+        application.config.from_mapping(
+            SECRET_KEY=os.environ.get('SECRET_KEY', 'dev_secret_key_for_testing'),
+            PERMANENT_SESSION_LIFETIME=604800,
+        )
+        if test_config:
+            application.config.update(test_config)
+        application.extensions['startup'] = report
+
+    with report.phase('database'):
+        db_path = application.config.get('DATABASE_PATH')
+        # 设置 LOCAL_DB_DIR 时在本地磁盘运行数据库，定时同步回持久化路径
+        replica = prepare_local_replica(application, db_path or DatabaseManager.default_path())
+        database = DatabaseManager(replica.local_path if replica else db_path)
+    with report.phase('caches'):
+        cache_enabled = application.config.get('QUERY_CACHE_ENABLED')
+        if cache_enabled is None:
+            # 测试默认关闭读缓存，可用 QUERY_CACHE_ENABLED=true 让整套测试经过缓存路径
+            default = 'false' if application.testing else 'true'
+            cache_enabled = os.environ.get('QUERY_CACHE_ENABLED', default).lower() == 'true'
+        database.query_cache.configure(
+            enabled=cache_enabled,
+            max_entries=application.config.get('QUERY_CACHE_MAX_ENTRIES'),
+            default_ttl=application.config.get('QUERY_CACHE_TTL'),
+            shared_path=application.config.get('QUERY_CACHE_SHARED_PATH',
+                                               os.environ.get('QUERY_CACHE_SHARED_PATH')),
+        )
+        application.extensions['database'] = database
+        page_cache_enabled = application.config.get('PAGE_CACHE_ENABLED')
+        if page_cache_enabled is None:
+            # 页面缓存会返回陈旧内容，测试默认关闭
+            default = 'false' if application.testing else 'true'
+            page_cache_enabled = os.environ.get('PAGE_CACHE_ENABLED', default).lower() == 'true'
+        application.extensions['page_cache'] = PageCache(enabled=page_cache_enabled)
+        fragment_backend = application.config.get('FRAGMENT_CACHE_BACKEND')
+        if fragment_backend is None and not application.testing:
+            fragment_backend = MemoryFragmentBackend(application.config.get('FRAGMENT_CACHE_MAX_BYTES')
+                                                     or int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024)))
+        register_fragment_cache(application, fragment_backend,
+                                application.config.get('JINJA_BYTECODE_CACHE_DIR',
+                                                       os.environ.get('JINJA_BYTECODE_CACHE_DIR')))
+        register_badge_helpers(application)
+
+    with report.phase('init_data'), application.app_context():
+        # 场次/玩家计数需要全表读取，只在 STARTUP_DIAGNOSTICS 开启时打印
+        diagnostics = application.config.get('STARTUP_DIAGNOSTICS')
+        if diagnostics is None:
+            diagnostics = os.environ.get('STARTUP_DIAGNOSTICS', 'false').lower() == 'true'
+        init_data(diagnostics=diagnostics)
+
+    with report.phase('routes'):
+        tenant = Blueprint('tenant', __name__, url_prefix='/o/<org_slug>')
+        _install_tenant_resolution(tenant)
+        register_main_routes(tenant)
+        register_game_routes(tenant)
+        register_player_routes(tenant)
+        register_achievement_routes(tenant)
+        register_tournament_routes(tenant)
+        register_security_routes(tenant)
+        register_archive_routes(tenant)
+        application.register_blueprint(tenant)
+
+        register_organization_routes(application)
+        register_security_globals(application)
+        register_warmup(application)
+        register_online_migrations(application)
+        register_backups(application)
+    application.logger.info('启动耗时: %s', report.summary())
     return application
 
 
-# Production WSGI globals.
-application = create_app()
-app = application
+_application = None
+
+
+def get_application():
+    """Production WSGI application, created on first use and then warmed in the background."""
+    global _application
+    if _application is None:
+        _application = create_app()
+        # 后台预热模板与活跃组织的缓存，完成前 /ready 返回 503
+        start_warmup(_application)
+        # 重建类结构变更在后台分块回填，不阻塞启动与计分写入
+        start_online_migrations(_application)
+        # 继续上次中断的组织清除
+        resume_pending_purges(_application)
+        # 设置了 BACKUP_DIR 时定时生成在线备份快照
+        start_backups(_application)
+        # 本地工作副本定时并在退出时同步回持久化路径
+        start_local_replica(_application)
+    return _application
+
+
+def __getattr__(name):
+    # WSGI 服务器按 app:app / app:application 取用时才创建应用，只导入本模块（如测试）不触发启动
+    if name in ('app', 'application'):
+        return get_application()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 if __name__ == '__main__':
+    app = get_application()
     data_file = get_data_file_path()
     is_azure = os.environ.get('WEBSITE_SITE_NAME') is not None
     database = app.extensions['database']
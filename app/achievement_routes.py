@@ -2,297 +2,118 @@
 成就系统路由模块 - 处理所有成就相关的路由
 """
 from flask import g, render_template, request, redirect, url_for, flash
+from .achievement_rules import TIERS
+from .page_cache import stale_while_revalidate
 from .models import (get_achievement_players, get_achievement_records,
                      get_achievement_stats, get_achievement_master_players,
+                     get_achievement_approaching_players,
                      get_negative_achievement_players, get_negative_achievement_records,
                      get_best_buddy_stats, get_duo_loser_stats,
                      get_honor_roll_stats)
 from . import APP_VERSION
 
+# 特殊记录目录：首页卡片与详情页配置。view 决定详情页的数据来源：
+#   earners  - 规则台账中的获得者 + 最近 50 条记录
+#   tier     - 门槛成就（达人/传奇），门槛取自 achievement_rules.TIERS
+#   negative - 负面成就，附带"被谁痛击最多"
+#   其余为自定义视图，由下方独立路由处理。
+# 新增一项基于规则台账的成就只需在此声明一项并提供同名模板。
+ACHIEVEMENTS = (
+    {'id': 'small_gold', 'name': '小金玩家', 'icon': '🥉', 'category': 'basic', 'view': 'earners',
+     'description': '获得过至少一次小金胜利的玩家', 'count_key': 'small_gold_players',
+     'detail': {'description': '获得过至少一次小金胜利的玩家。小金是台球游戏中的特殊得分方式，代表着精准的技术和运气的结合。',
+                'rule': '在任意场次中获得一次小金胜利', 'difficulty': '入门', 'color_theme': 'bronze'}},
+    {'id': 'big_gold', 'name': '大金玩家', 'icon': '🥇', 'category': 'basic', 'view': 'earners',
+     'description': '获得过至少一次大金胜利的玩家', 'count_key': 'big_gold_players',
+     'detail': {'description': '获得过至少一次大金胜利的玩家。大金是台球游戏中最高级别的得分方式，需要极高的技术水平和完美的时机把握。',
+                'rule': '在任意场次中获得一次大金胜利', 'difficulty': '困难', 'color_theme': 'gold'}},
+    {'id': 'small_gold_master', 'name': '小金达人', 'icon': '🏆', 'category': 'master', 'view': 'tier',
+     'description': '获得10次或以上小金胜利的玩家', 'count_key': 'small_gold_masters',
+     'detail': {'description': '获得10次或以上小金胜利的玩家。这代表着对小金技巧的深度掌握和持续的优秀表现。',
+                'rule': '累计获得10次或以上小金胜利', 'difficulty': '专家', 'color_theme': 'trophy'}},
+    {'id': 'small_gold_legend', 'name': '小金传奇', 'icon': '🏛️', 'category': 'legend', 'view': 'tier',
+     'description': '获得20次或以上小金胜利的玩家', 'count_key': 'small_gold_legends',
+     'detail': {'description': '获得20次或以上小金胜利的玩家。小金路上的终极里程碑。',
+                'rule': '累计获得20次或以上小金胜利', 'color_theme': 'legend'}},
+    {'id': 'big_gold_master', 'name': '大金达人', 'icon': '👑', 'category': 'master', 'view': 'tier',
+     'description': '获得5次或以上大金胜利的玩家', 'count_key': 'big_gold_masters',
+     'detail': {'description': '获得5次或以上大金胜利的玩家。这是台球游戏中的最高荣誉，代表着绝对的技术统治力。',
+                'rule': '累计获得5次或以上大金胜利', 'difficulty': '传奇', 'color_theme': 'crown'}},
+    {'id': 'big_gold_legend', 'name': '大金传奇', 'icon': '🏛️', 'category': 'legend', 'view': 'tier',
+     'description': '获得10次或以上大金胜利的玩家', 'count_key': 'big_gold_legends',
+     'detail': {'description': '获得10次或以上大金胜利的玩家。真正的台球传奇，技术和经验的完美结合。',
+                'rule': '累计获得10次或以上大金胜利', 'color_theme': 'legend'}},
+    {'id': 'gold_loser', 'name': '大吃一金', 'icon': '🙈', 'category': 'negative', 'view': 'negative',
+     'description': '被大小金痛击过的玩家', 'count_key': 'gold_loser_players',
+     'detail': {'description': '被大小金痛击过的玩家。虽然失败，但这也是成长的一部分。',
+                'rule': '在任意场次中被大金或小金击败', 'difficulty': '经历', 'color_theme': 'negative'}},
+    {'id': 'best_buddy', 'name': '好兄弟', 'icon': '🤝', 'category': 'fun', 'view': 'best_buddy',
+     'description': '给谁送了最多1分？'},
+    {'id': 'duo_loser', 'name': '有难同当', 'icon': '🫂', 'category': 'fun', 'view': 'duo_loser',
+     'description': '一起被大金/双吃的组合'},
+    {'id': 'honor_roll', 'name': '榜上有名', 'icon': '📜', 'category': 'fun', 'view': 'honor_roll',
+     'description': '有的人靠实力上榜，有的人靠……坚持。'},
+)
+_ACHIEVEMENTS_BY_ID = {achievement['id']: achievement for achievement in ACHIEVEMENTS}
+
 
 def _org_id():
     return g.organization['org_id']
 
 
+def _achievement_config(achievement):
+    """详情页模板使用的成就配置"""
+    config = {'id': achievement['id'], 'name': achievement['name'], 'icon': achievement['icon'],
+              **achievement['detail']}
+    if achievement['id'] in TIERS:
+        config['requirement_count'] = TIERS[achievement['id']][1]
+    return config
+
+
 def register_achievement_routes(bp):
     """注册成就系统路由"""
 
     @bp.route('/achievements')
+    @stale_while_revalidate(max_staleness=30)
     def achievements():
         """成就系统主页"""
-        # 获取成就统计信息
+        # 所有计数都来自成就台账的一次读取
         stats = get_achievement_stats(_org_id())
-
-        # 获取好兄弟数据（用于计数）
-        buddy_stats = get_best_buddy_stats(_org_id())
-
-        # 准备成就列表数据
         achievements_data = [
-            {
-                'id': 'small_gold',
-                'name': '小金玩家',
-                'description': '获得过至少一次小金胜利的玩家',
-                'icon': '🥉',
-                'count': stats['small_gold_players'],
-                'category': 'basic'
-            },
-            {
-                'id': 'big_gold',
-                'name': '大金玩家',
-                'description': '获得过至少一次大金胜利的玩家',
-                'icon': '🥇',
-                'count': stats['big_gold_players'],
-                'category': 'basic'
-            },
-            {
-                'id': 'small_gold_master',
-                'name': '小金达人',
-                'description': '获得10次或以上小金胜利的玩家',
-                'icon': '🏆',
-                'count': stats['small_gold_masters'],
-                'category': 'master'
-            },
-            {
-                'id': 'small_gold_legend',
-                'name': '小金传奇',
-                'description': '获得20次或以上小金胜利的玩家',
-                'icon': '🏛️',
-                'count': stats['small_gold_legends'],
-                'category': 'legend'
-            },
-            {
-                'id': 'big_gold_master',
-                'name': '大金达人',
-                'description': '获得5次或以上大金胜利的玩家',
-                'icon': '👑',
-                'count': stats['big_gold_masters'],
-                'category': 'master'
-            },
-            {
-                'id': 'big_gold_legend',
-                'name': '大金传奇',
-                'description': '获得10次或以上大金胜利的玩家',
-                'icon': '🏛️',
-                'count': stats['big_gold_legends'],
-                'category': 'legend'
-            },
-            {
-                'id': 'gold_loser',
-                'name': '大吃一金',
-                'description': '被大小金痛击过的玩家',
-                'icon': '🙈',
-                'count': stats['gold_loser_players'],
-                'category': 'negative'
-            },
-            {
-                'id': 'best_buddy',
-                'name': '好兄弟',
-                'description': '给谁送了最多1分？',
-                'icon': '🤝',
-                'count': None,
-                'category': 'fun'
-            },
-            {
-                'id': 'duo_loser',
-                'name': '有难同当',
-                'description': '一起被大金/双吃的组合',
-                'icon': '🫂',
-                'count': None,
-                'category': 'fun'
-            },
-            {
-                'id': 'honor_roll',
-                'name': '榜上有名',
-                'description': '有的人靠实力上榜，有的人靠……坚持。',
-                'icon': '📜',
-                'count': None,
-                'category': 'fun'
-            }
+            {'id': a['id'], 'name': a['name'], 'description': a['description'], 'icon': a['icon'],
+             'count': stats[a['count_key']] if 'count_key' in a else None, 'category': a['category']}
+            for a in ACHIEVEMENTS
         ]
 
         return render_template('achievements/index.html',
                              achievements=achievements_data,
                              app_version=APP_VERSION)
 
-    @bp.route('/achievement/small_gold')
-    def achievement_small_gold():
-        """小金玩家成就详情"""
-        # 获取小金玩家
-        achievement_players = get_achievement_players(_org_id(), 'small_gold')
-
-        # 获取小金记录（最近50条）
-        achievement_records = get_achievement_records(_org_id(), 'small_gold')[:50]
-
-        # 成就配置
-        achievement_config = {
-            'id': 'small_gold',
-            'name': '小金玩家',
-            'description': '获得过至少一次小金胜利的玩家。小金是台球游戏中的特殊得分方式，代表着精准的技术和运气的结合。',
-            'icon': '🥉',
-            'rule': '在任意场次中获得一次小金胜利',
-            'difficulty': '入门',
-            'color_theme': 'bronze'
-        }
-
-        return render_template('achievements/small_gold.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             achievement_records=achievement_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/big_gold')
-    def achievement_big_gold():
-        """大金玩家成就详情"""
-        # 获取大金玩家
-        achievement_players = get_achievement_players(_org_id(), 'big_gold')
-
-        # 获取大金记录（最近50条）
-        achievement_records = get_achievement_records(_org_id(), 'big_gold')[:50]
-
-        # 成就配置
-        achievement_config = {
-            'id': 'big_gold',
-            'name': '大金玩家',
-            'description': '获得过至少一次大金胜利的玩家。大金是台球游戏中最高级别的得分方式，需要极高的技术水平和完美的时机把握。',
-            'icon': '🥇',
-            'rule': '在任意场次中获得一次大金胜利',
-            'difficulty': '困难',
-            'color_theme': 'gold'
-        }
-
-        return render_template('achievements/big_gold.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             achievement_records=achievement_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/small_gold_master')
-    def achievement_small_gold_master():
-        """小金达人成就详情"""
-        # 获取小金达人玩家
-        achievement_players = get_achievement_master_players(_org_id(), 'small_gold_master')
-
-        # 获取小金记录（用于展示总记录）
-        all_small_gold_records = get_achievement_records(_org_id(), 'small_gold')
-
-        # 成就配置
-        achievement_config = {
-            'id': 'small_gold_master',
-            'name': '小金达人',
-            'description': '获得10次或以上小金胜利的玩家。这代表着对小金技巧的深度掌握和持续的优秀表现。',
-            'icon': '🏆',
-            'rule': '累计获得10次或以上小金胜利',
-            'difficulty': '专家',
-            'color_theme': 'trophy',
-            'requirement_count': 10
-        }
-
-        return render_template('achievements/small_gold_master.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             all_records=all_small_gold_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/big_gold_master')
-    def achievement_big_gold_master():
-        """大金达人成就详情"""
-        # 获取大金达人玩家
-        achievement_players = get_achievement_master_players(_org_id(), 'big_gold_master')
-
-        # 获取大金记录（用于展示总记录）
-        all_big_gold_records = get_achievement_records(_org_id(), 'big_gold')
-
-        # 成就配置
-        achievement_config = {
-            'id': 'big_gold_master',
-            'name': '大金达人',
-            'description': '获得5次或以上大金胜利的玩家。这是台球游戏中的最高荣誉，代表着绝对的技术统治力。',
-            'icon': '👑',
-            'rule': '累计获得5次或以上大金胜利',
-            'difficulty': '传奇',
-            'color_theme': 'crown',
-            'requirement_count': 5
-        }
-
-        return render_template('achievements/big_gold_master.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             all_records=all_big_gold_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/big_gold_legend')
-    def achievement_big_gold_legend():
-        """大金传奇成就详情"""
-        # 获取大金传奇玩家
-        achievement_players = get_achievement_master_players(_org_id(), 'big_gold_legend')
-
-        # 获取大金记录（用于展示总记录）
-        all_big_gold_records = get_achievement_records(_org_id(), 'big_gold')
-
-        # 成就配置
-        achievement_config = {
-            'id': 'big_gold_legend',
-            'name': '大金传奇',
-            'description': '获得10次或以上大金胜利的玩家。真正的台球传奇，技术和经验的完美结合。',
-            'icon': '🏛️',
-            'rule': '累计获得10次或以上大金胜利',
-            'color_theme': 'legend',
-            'requirement_count': 10
-        }
-
-        return render_template('achievements/big_gold_legend.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             all_records=all_big_gold_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/small_gold_legend')
-    def achievement_small_gold_legend():
-        """小金传奇详情"""
-        achievement_players = get_achievement_master_players(_org_id(), 'small_gold_legend')
-        all_small_gold_records = get_achievement_records(_org_id(), 'small_gold')
-
-        achievement_config = {
-            'id': 'small_gold_legend',
-            'name': '小金传奇',
-            'description': '获得20次或以上小金胜利的玩家。小金路上的终极里程碑。',
-            'icon': '🏛️',
-            'rule': '累计获得20次或以上小金胜利',
-            'color_theme': 'legend',
-            'requirement_count': 20
-        }
-
-        return render_template('achievements/small_gold_legend.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             all_records=all_small_gold_records,
-                             app_version=APP_VERSION)
-
-    @bp.route('/achievement/gold_loser')
-    def achievement_gold_loser():
-        """大吃一金负面成就详情"""
-        # 获取大吃一金玩家
-        achievement_players = get_negative_achievement_players(_org_id(), 'gold_loser')
-
-        # 获取被大小金痛击的记录（最近50条）
-        achievement_records = get_negative_achievement_records(_org_id(), 'gold_loser')[:50]
-
-        # 成就配置
-        achievement_config = {
-            'id': 'gold_loser',
-            'name': '大吃一金',
-            'description': '被大小金痛击过的玩家。虽然失败，但这也是成长的一部分。',
-            'icon': '🙈',
-            'rule': '在任意场次中被大金或小金击败',
-            'difficulty': '经历',
-            'color_theme': 'negative'
-        }
-
-        return render_template('achievements/gold_loser.html',
-                             achievement=achievement_config,
-                             achievement_players=achievement_players,
-                             achievement_records=achievement_records,
-                             app_version=APP_VERSION)
+    @bp.route('/achievement/<achievement_id>')
+    def achievement_detail(achievement_id):
+        """规则台账成就的详情页（获得者、门槛、负面三类视图）"""
+        achievement = _ACHIEVEMENTS_BY_ID.get(achievement_id)
+        if not achievement or 'detail' not in achievement:
+            flash(f'成就 "{achievement_id}" 不存在或尚未实现', 'error')
+            return redirect(url_for('tenant.achievements'))
+
+        context = {'achievement': _achievement_config(achievement)}
+        view = achievement['view']
+        if view == 'earners':
+            context['achievement_players'] = get_achievement_players(_org_id(), achievement_id)
+            context['achievement_records'] = get_achievement_records(_org_id(), achievement_id)[:50]
+        elif view == 'tier':
+            kind, _ = TIERS[achievement_id]
+            context['achievement_players'] = get_achievement_master_players(_org_id(), achievement_id)
+            # 记录总数与距离门槛最近的玩家同样来自成就台账
+            context['total_records'] = get_achievement_stats(_org_id())[f'{kind}_records']
+            context['approaching_players'] = get_achievement_approaching_players(_org_id(), achievement_id)
+        else:
+            context['achievement_players'] = get_negative_achievement_players(_org_id(), achievement_id)
+            context['achievement_records'] = get_negative_achievement_records(_org_id(), achievement_id)[:50]
+
+        return render_template(f'achievements/{achievement_id}.html',
+                             app_version=APP_VERSION, **context)
 
     @bp.route('/achievement/best_buddy')
     def achievement_best_buddy():
@@ -335,6 +156,7 @@ def register_achievement_routes(bp):
                              app_version=APP_VERSION)
 
     @bp.route('/achievement/honor_roll')
+    @stale_while_revalidate(max_staleness=30)
     def achievement_honor_roll():
         """榜上有名详情页：冠军榜 + 必吃榜"""
         stats = get_honor_roll_stats(_org_id(), top_n=10)
@@ -354,9 +176,3 @@ def register_achievement_routes(bp):
                              champions=stats['champions'],
                              losers=stats['losers'],
                              app_version=APP_VERSION)
-
-    @bp.route('/achievement/<achievement_id>')
-    def achievement_fallback(achievement_id):
-        """未定义成就的后备路由"""
-        flash(f'成就 "{achievement_id}" 不存在或尚未实现', 'error')
-        return redirect(url_for('tenant.achievements'))
@@ -0,0 +1,160 @@
+"""
+成就规则引擎 - 以声明式规则维护 player_achievement_counts 台账
+
+每条规则声明一个谓词（哪些特殊分记录计入）和获得者角色（记录中哪些玩家计入），
+累加器统一为 (次数, 首次达成时间, 最近达成时间)。同一组规则用于两条路径：
+- 回填：按时间对 game_records 做一次流式扫描，所有规则在同一遍中求值
+- 写路径：对单条新增/删除的记录求值，增量更新台账
+
+规则是数据而非手写查询，因此也能编译成 SQL 条件，供记录列表和删除后的
+时间边界重算复用。新增一项基于对局记录的成就只需在 RULES 中声明一条规则，
+达人/传奇类门槛在 TIERS 中声明。
+
+玩家组合类统计（好兄弟、有难同当等）由 player_pair_stats 维护：每条记录对
+规范化的玩家对 (a, b)（a 的整数主键较小）累加 PAIR_COUNTERS 中的计数器，
+同样支持一次流式回填和逐条增量。
+"""
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+GOLD_SCORES = ('小金', '大金')
+
+# 规则：台账类别 -> 谓词（计入的特殊分）与获得者（计入的玩家主键列）
+RULES = {
+    'small_gold': {'special_scores': ('小金',), 'roles': ('winner_pk',)},
+    'big_gold': {'special_scores': ('大金',), 'roles': ('winner_pk',)},
+    'gold_loser': {'special_scores': GOLD_SCORES, 'roles': ('loser_pk', 'loser2_pk')},
+}
+
+# 门槛成就：成就 id -> (台账类别, 最低次数)
+TIERS = {
+    'small_gold_master': ('small_gold', 10),
+    'small_gold_legend': ('small_gold', 20),
+    'big_gold_master': ('big_gold', 5),
+    'big_gold_legend': ('big_gold', 10),
+}
+
+# 规则与组合计数器求值需要的记录列（流式回填按此顺序读取）
+RECORD_COLUMNS = ('org_id', 'created_at', 'special_score', 'score',
+                  'winner_pk', 'winner2_pk', 'loser_pk', 'loser2_pk')
+
+# 组合计数器（player_pair_stats 的列，a/b 指规范化后的两位玩家）：
+#   gifts_to_a/gifts_to_b - 1 分局中 a/b 从对方手里赢到的 1 分
+#   shared_losses/shared_wins - 同一局中一起作为败者/赢家
+#   a_wins/b_wins - 交手记录（多人局按每对赢家-败者分别计入）
+PAIR_COUNTERS = ('gifts_to_a', 'gifts_to_b', 'shared_losses', 'shared_wins', 'a_wins', 'b_wins')
+_COUNTER_INDEX = {name: index for index, name in enumerate(PAIR_COUNTERS)}
+
+
+def earned(record) -> Iterator[Tuple[str, int]]:
+    """对单条记录运行全部规则，产出 (台账类别, 玩家主键)。"""
+    for kind, rule in RULES.items():
+        if record['special_score'] in rule['special_scores']:
+            for role in rule['roles']:
+                if record[role] is not None:
+                    yield kind, record[role]
+
+
+def accumulate(records: Iterable, ledger: Dict = None) -> Dict[Tuple[str, str, int], List]:
+    """把记录折叠进 {(org_id, 类别, 玩家主键): [次数, 首次时间, 最近时间]}。"""
+    ledger = {} if ledger is None else ledger
+    for record in records:
+        at = record['created_at']
+        for kind, player_pk in earned(record):
+            key = (record['org_id'], kind, player_pk)
+            entry = ledger.get(key)
+            if entry is None:
+                ledger[key] = [1, at, at]
+            else:
+                entry[0] += 1
+                entry[1] = min(entry[1], at)
+                entry[2] = max(entry[2], at)
+    return ledger
+
+
+def _bump_pair(pairs, org_id, x, y, counter_for_x, counter_for_y=None):
+    """给玩家对 (x, y) 的计数器加一；x 规范化为 a 时用 counter_for_x，否则用 counter_for_y。
+    同一玩家不构成玩家对（历史数据中可能出现重复的败者/赢家），直接跳过。"""
+    if x == y:
+        return
+    a, b = (x, y) if x < y else (y, x)
+    entry = pairs.setdefault((org_id, a, b), [0] * len(PAIR_COUNTERS))
+    counter = counter_for_x if a == x or counter_for_y is None else counter_for_y
+    entry[_COUNTER_INDEX[counter]] += 1
+
+
+def pair_counts(records: Iterable, pairs: Dict = None) -> Dict[Tuple[str, int, int], List[int]]:
+    """把记录折叠进 {(org_id, a, b): [计数器...]}，顺序同 PAIR_COUNTERS。"""
+    pairs = {} if pairs is None else pairs
+    for record in records:
+        org_id = record['org_id']
+        winners = [pk for pk in (record['winner_pk'], record['winner2_pk']) if pk is not None]
+        losers = [pk for pk in (record['loser_pk'], record['loser2_pk']) if pk is not None]
+        for winner in winners:
+            for loser in losers:
+                _bump_pair(pairs, org_id, winner, loser, 'a_wins', 'b_wins')
+        if record['score'] == 1:
+            _bump_pair(pairs, org_id, record['winner_pk'], record['loser_pk'], 'gifts_to_a', 'gifts_to_b')
+        if len(winners) == 2:
+            _bump_pair(pairs, org_id, *winners, 'shared_wins')
+        if len(losers) == 2:
+            _bump_pair(pairs, org_id, *losers, 'shared_losses')
+    return pairs
+
+
+def rule_filter(kind: str, alias: str = '') -> Tuple[str, list, Tuple[str, ...]]:
+    """把规则编译为 SQL，返回 (谓词条件, 参数, 获得者列)。"""
+    rule = RULES[kind]
+    prefix = f'{alias}.' if alias else ''
+    marks = ','.join('?' * len(rule['special_scores']))
+    return (f'{prefix}special_score IN ({marks})', list(rule['special_scores']),
+            tuple(prefix + role for role in rule['roles']))
+
+
+def _stream_records(cursor: sqlite3.Cursor, where: str, params: list, batch_size: int):
+    """按时间顺序分批读取对局记录，每批产出一组 {列名: 值} 字典。"""
+    reader = cursor.connection.cursor()
+    reader.execute(f"SELECT {', '.join(RECORD_COLUMNS)} FROM game_records WHERE {where} "
+                   "ORDER BY created_epoch, record_id", params)
+    while True:
+        rows = reader.fetchmany(batch_size)
+        if not rows:
+            return
+        yield [dict(zip(RECORD_COLUMNS, row)) for row in rows]
+
+
+def rebuild_achievement_counts(cursor: sqlite3.Cursor, org_id: str = None,
+                               batch_size: int = 5000) -> None:
+    """按时间对 game_records 流式扫描一遍，用全部规则重建成就台账。
+
+    只读取任一规则可能命中的特殊分记录；传入 org_id 时只重建该组织。
+    """
+    scores = sorted({score for rule in RULES.values() for score in rule['special_scores']})
+    where, params = [f"special_score IN ({','.join('?' * len(scores))})"], list(scores)
+    if org_id:
+        where.append('org_id = ?')
+        params.append(org_id)
+    cursor.execute('DELETE FROM player_achievement_counts' + (' WHERE org_id = ?' if org_id else ''),
+                   (org_id,) if org_id else ())
+    ledger = {}
+    for records in _stream_records(cursor, ' AND '.join(where), params, batch_size):
+        accumulate(records, ledger)
+    cursor.executemany(
+        '''INSERT INTO player_achievement_counts (org_id, kind, player_pk, count, first_at, last_at)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        [(*key, *entry) for key, entry in ledger.items()])
+
+
+def rebuild_pair_stats(cursor: sqlite3.Cursor, org_id: str = None,
+                       batch_size: int = 5000) -> None:
+    """流式扫描 game_records 一遍，重建 player_pair_stats；传入 org_id 时只重建该组织。"""
+    cursor.execute('DELETE FROM player_pair_stats' + (' WHERE org_id = ?' if org_id else ''),
+                   (org_id,) if org_id else ())
+    pairs = {}
+    for records in _stream_records(cursor, 'org_id = ?' if org_id else '1', [org_id] if org_id else [],
+                                   batch_size):
+        pair_counts(records, pairs)
+    cursor.executemany(
+        f"INSERT INTO player_pair_stats (org_id, player_a_pk, player_b_pk, {', '.join(PAIR_COUNTERS)}) "
+        f"VALUES (?, ?, ?, {', '.join('?' * len(PAIR_COUNTERS))})",
+        [(*key, *counters) for key, counters in pairs.items()])
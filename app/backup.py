@@ -0,0 +1,318 @@
+"""
+在线备份 - 用 SQLite 在线备份 API 定时生成压缩快照，校验、保留与恢复
+
+直接复制数据库文件在有写入时可能得到损坏的副本，在 Azure 共享盘上也很慢。备份改为：
+- sqlite3.Connection.backup 每步复制 pages 页，步与步之间暂停 pause 秒，每步只短暂
+  持有读锁，写入不会被饿死；复制期间源库被其他连接修改时，SQLite 会自动重新开始
+- 副本先写到本地目录的临时文件，PRAGMA integrity_check 通过后压缩为
+  <库名>-<UTC 时间>.db.gz，原子改名后才算一个快照
+- 保留规则：最近 keep_last 个快照，另外每天保留最后一个快照直至 keep_daily 天
+
+BackupScheduler 在后台线程中按 interval 执行；多个 worker 共用一个备份目录时，用目录
+中的文件锁保证同一时刻只有一个在备份。BACKUP_DIR 未设置时不启用。
+
+命令行用法（恢复前先停止应用）：
+
+    python -m app.backup create --dir backups [--database path/to/db]
+    python -m app.backup list --dir backups
+    python -m app.backup prune --dir backups [--keep-last 24] [--keep-daily 14]
+    python -m app.backup restore backups/<快照>.db.gz [--database path/to/db]
+"""
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发机：不做跨进程互斥
+    fcntl = None
+
+DEFAULT_PAGES = 256
+DEFAULT_PAUSE = 0.01
+DEFAULT_INTERVAL = 3600.0
+DEFAULT_KEEP_LAST = 24
+DEFAULT_KEEP_DAILY = 14
+_STAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+_SNAPSHOT_RE = re.compile(r'^(?P<name>.+)-(?P<stamp>\d{8}T\d{6}Z)\.db\.gz$')
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def online_copy(source_path: str, target_path: str, pages: int = DEFAULT_PAGES, pause: float = DEFAULT_PAUSE,
+                progress: Callable[[int, int], None] = None) -> None:
+    """用在线备份 API 把 source_path 复制到 target_path，每步 pages 页，步间暂停 pause 秒。"""
+    def step(status, remaining, total):
+        if progress:
+            progress(remaining, total)
+        if pause and remaining:
+            time.sleep(pause)
+
+    source = sqlite3.connect(source_path)
+    try:
+        source.execute('PRAGMA busy_timeout = 5000')
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=pages, progress=step)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def check_integrity(path: str) -> None:
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise BackupError(f'完整性检查失败: {path}: {result[:5]}')
+
+
+def _snapshot_name(db_path: str, moment: datetime) -> str:
+    base = os.path.splitext(os.path.basename(db_path))[0]
+    return f'{base}-{moment.strftime(_STAMP_FORMAT)}.db.gz'
+
+
+def create_backup(db_path: str, directory: str, pages: int = DEFAULT_PAGES, pause: float = DEFAULT_PAUSE) -> Dict:
+    """生成一个经过完整性校验的压缩快照，返回 {'path', 'bytes', 'seconds'}。"""
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    name = _snapshot_name(db_path, datetime.now(timezone.utc))
+    path = os.path.join(directory, name)
+    copy_path, partial_path = f'{path}.copy', f'{path}.partial'
+    try:
+        online_copy(db_path, copy_path, pages, pause)
+        check_integrity(copy_path)
+        with open(copy_path, 'rb') as source, gzip.open(partial_path, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(partial_path, path)
+    finally:
+        for leftover in (copy_path, partial_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {'path': path, 'bytes': os.path.getsize(path), 'seconds': round(time.perf_counter() - started, 3)}
+
+
+def list_backups(directory: str) -> List[Dict]:
+    """目录中的快照，按时间从新到旧。"""
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        match = _SNAPSHOT_RE.match(name)
+        if match:
+            taken_at = datetime.strptime(match.group('stamp'), _STAMP_FORMAT).replace(tzinfo=timezone.utc)
+            path = os.path.join(directory, name)
+            snapshots.append({'path': path, 'name': name, 'taken_at': taken_at, 'bytes': os.path.getsize(path)})
+    return sorted(snapshots, key=lambda snapshot: snapshot['taken_at'], reverse=True)
+
+
+def prune_backups(directory: str, keep_last: int = DEFAULT_KEEP_LAST, keep_daily: int = DEFAULT_KEEP_DAILY,
+                  now: datetime = None) -> List[str]:
+    """按保留规则删除旧快照，返回被删除的路径。"""
+    now = now or datetime.now(timezone.utc)
+    snapshots = list_backups(directory)
+    keep = {snapshot['path'] for snapshot in snapshots[:keep_last]}
+    days = set()
+    for snapshot in snapshots:
+        day = snapshot['taken_at'].date()
+        if (now.date() - day).days < keep_daily and day not in days:
+            days.add(day)
+            keep.add(snapshot['path'])
+    removed = [snapshot['path'] for snapshot in snapshots if snapshot['path'] not in keep]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def restore_backup(snapshot_path: str, db_path: str) -> Optional[str]:
+    """用快照替换 db_path（应用须已停止）；原库连同日志文件改名保留，返回其路径。"""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    restored = os.path.join(directory, os.path.basename(db_path) + '.restoring')
+    try:
+        with gzip.open(snapshot_path, 'rb') as source, open(restored, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        check_integrity(restored)
+        previous = None
+        if os.path.exists(db_path):
+            previous = f"{db_path}.pre-restore-{datetime.now(timezone.utc).strftime(_STAMP_FORMAT)}"
+            os.replace(db_path, previous)
+        # 已提交但尚未检查点的页只在 -wal 中，热日志也要跟随原库，打开保留的副本时才能恢复
+        for suffix in ('-journal', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                if previous:
+                    os.replace(db_path + suffix, previous + suffix)
+                else:
+                    os.remove(db_path + suffix)
+        os.replace(restored, db_path)
+    finally:
+        if os.path.exists(restored):
+            os.remove(restored)
+    return previous
+
+
+@contextmanager
+def _directory_lock(directory: str):
+    """非阻塞地取得备份目录锁；其他进程正在备份时产出 False。"""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.backup.lock'), 'a') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class BackupScheduler:
+    """后台定时备份的状态：idle / running / stopped / disabled。"""
+
+    def __init__(self, db_path: str, directory: Optional[str], interval: float = DEFAULT_INTERVAL,
+                 keep_last: int = DEFAULT_KEEP_LAST, keep_daily: int = DEFAULT_KEEP_DAILY,
+                 pages: int = DEFAULT_PAGES, pause: float = DEFAULT_PAUSE):
+        self.db_path = db_path
+        self.directory = directory
+        self.interval = interval
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.pages = pages
+        self.pause = pause
+        self.status = 'idle' if directory else 'disabled'
+        self.last = None
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, logger=None) -> Optional[Dict]:
+        """执行一次备份与清理；其他进程持有目录锁时跳过并返回 None。"""
+        with _directory_lock(self.directory) as acquired:
+            if not acquired:
+                return None
+            try:
+                result = create_backup(self.db_path, self.directory, self.pages, self.pause)
+                result['pruned'] = len(prune_backups(self.directory, self.keep_last, self.keep_daily))
+            except Exception as error:
+                self.error = str(error)
+                if logger:
+                    logger.exception('数据库备份失败')
+                return None
+        self.last, self.error = result, None
+        if logger:
+            logger.info('数据库备份完成: %s (%d 字节, %.1fs)', result['path'], result['bytes'], result['seconds'])
+        return result
+
+    def _loop(self, logger) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once(logger)
+
+    def start(self, logger=None) -> None:
+        if self.directory is None or self._thread is not None:
+            return
+        self.status = 'running'
+        self._thread = threading.Thread(target=self._loop, args=(logger,), name='db-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.directory:
+            self.status = 'stopped'
+
+    def report(self) -> Dict:
+        last = None if self.last is None else {key: self.last[key] for key in ('path', 'bytes', 'seconds')}
+        return {'status': self.status, 'directory': self.directory, 'interval': self.interval,
+                'last': last, 'error': self.error}
+
+
+def register_backups(app) -> BackupScheduler:
+    scheduler = BackupScheduler(
+        app.extensions['database'].db_path,
+        app.config.get('BACKUP_DIR') or os.environ.get('BACKUP_DIR'),
+        float(app.config.get('BACKUP_INTERVAL_SECONDS') or os.environ.get('BACKUP_INTERVAL_SECONDS', DEFAULT_INTERVAL)),
+        int(app.config.get('BACKUP_KEEP_LAST') or os.environ.get('BACKUP_KEEP_LAST', DEFAULT_KEEP_LAST)),
+        int(app.config.get('BACKUP_KEEP_DAILY') or os.environ.get('BACKUP_KEEP_DAILY', DEFAULT_KEEP_DAILY)),
+        int(app.config.get('BACKUP_PAGES_PER_STEP') or os.environ.get('BACKUP_PAGES_PER_STEP', DEFAULT_PAGES)),
+        float(app.config.get('BACKUP_STEP_PAUSE_SECONDS')
+              or os.environ.get('BACKUP_STEP_PAUSE_SECONDS', DEFAULT_PAUSE)),
+    )
+    app.extensions['backups'] = scheduler
+    return scheduler
+
+
+def start_backups(app) -> BackupScheduler:
+    """启动定时备份；未设置 BACKUP_DIR 或 BACKUP_ENABLED 关闭时（测试默认关闭）不执行。"""
+    scheduler = app.extensions['backups']
+    enabled = app.config.get('BACKUP_ENABLED')
+    if enabled is None:
+        default = 'false' if app.testing else 'true'
+        enabled = os.environ.get('BACKUP_ENABLED', default).lower() == 'true'
+    if enabled:
+        scheduler.start(app.logger)
+    elif scheduler.directory:
+        scheduler.status = 'disabled'
+    return scheduler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='SQLite 在线备份、清理与恢复')
+    parser.add_argument('--database', help='SQLite 数据库路径（默认同应用：DATABASE_PATH 或内置位置）')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create_parser = commands.add_parser('create', help='生成一个快照')
+    create_parser.add_argument('--dir', default=os.environ.get('BACKUP_DIR'), required='BACKUP_DIR' not in os.environ)
+    create_parser.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    create_parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE)
+    list_parser = commands.add_parser('list', help='列出快照')
+    list_parser.add_argument('--dir', default=os.environ.get('BACKUP_DIR'), required='BACKUP_DIR' not in os.environ)
+    prune_parser = commands.add_parser('prune', help='按保留规则删除旧快照')
+    prune_parser.add_argument('--dir', default=os.environ.get('BACKUP_DIR'), required='BACKUP_DIR' not in os.environ)
+    prune_parser.add_argument('--keep-last', type=int, default=DEFAULT_KEEP_LAST)
+    prune_parser.add_argument('--keep-daily', type=int, default=DEFAULT_KEEP_DAILY)
+    restore_parser = commands.add_parser('restore', help='用快照替换数据库（先停止应用）')
+    restore_parser.add_argument('snapshot')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for snapshot in list_backups(args.dir):
+            print(f"{snapshot['name']}\t{snapshot['bytes']}")
+        return 0
+    if args.command == 'prune':
+        removed = prune_backups(args.dir, args.keep_last, args.keep_daily)
+        print(f'已删除 {len(removed)} 个快照')
+        return 0
+
+    from .database import DatabaseManager
+
+    # DatabaseManager 只用于解析默认路径；恢复时不能先打开（并迁移）目标库
+    db_path = args.database or DatabaseManager.default_path()
+    try:
+        if args.command == 'create':
+            result = create_backup(db_path, args.dir, args.pages, args.pause)
+            print(f"已备份到 {result['path']}（{result['bytes']} 字节，{result['seconds']:.2f}s）")
+        else:
+            previous = restore_backup(args.snapshot, db_path)
+            print(f'已恢复 {db_path}' + (f'，原库保留为 {previous}' if previous else ''))
+    except (BackupError, OSError, sqlite3.Error) as exc:
+        print(f'失败: {exc}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+玩家徽章服务 - 小金/大金光环、退役标记与达人/传奇等级的组织级徽章表
+
+徽章表按组织懒加载：退役标记来自玩家目录，小金/大金与等级来自成就台账
+（player_achievement_counts 由写路径逐条增量维护），一次主键范围查询即可得到
+整个组织的徽章，不再按页面上的玩家 id 拼 IN 列表查询 game_records。台账只按
+第一赢家计数，反向双人局的第二赢家另由一次特殊分部分索引上的聚合补上光环。
+
+徽章表记住加载时的 (players_version, badges_version)：台账上的触发器只在
+小金/大金条目变化时推进 badges_version，普通对局写入不会使徽章表失效；退役、
+复出经由 players_version 同样可见于所有 worker。
+
+模板通过 badge_class(player_id) 取得链接的 CSS 类，通过 player_badges(player_id)
+取得完整徽章，路由不再逐个修改玩家字典。
+"""
+import threading
+from typing import Dict, Optional
+
+from flask import current_app, g
+
+from .achievement_rules import TIERS
+
+SMALL_GOLD = 1
+BIG_GOLD = 2
+RETIRED = 4
+_GOLD_FLAGS = {'small_gold': SMALL_GOLD, 'big_gold': BIG_GOLD}
+_GOLD_SCORES = {'小金': 'small_gold', '大金': 'big_gold'}
+
+
+class OrgBadges:
+    """一个组织的徽章快照：{player_id: 标志位} 与 {player_id: 最高等级成就 id}。"""
+
+    __slots__ = ('versions', 'flags', 'ranks')
+
+    def __init__(self, versions, directory, ledger_rows, co_winner_rows=()):
+        self.versions = versions
+        self.flags: Dict[str, int] = {pid: RETIRED for pid in directory.retired_ids}
+        self.ranks: Dict[str, str] = {}
+        player_ids = {entry.player_pk: pid for pid, entry in directory.by_id.items()}
+        counts = {}
+        for row in ledger_rows:
+            player_id = player_ids.get(row['player_pk'])
+            if player_id is None:
+                continue
+            self.flags[player_id] = self.flags.get(player_id, 0) | _GOLD_FLAGS[row['kind']]
+            counts[row['kind'], player_id] = row['count']
+        # 第二赢家只点亮光环，不计入达人/传奇等级
+        for row in co_winner_rows:
+            player_id = player_ids.get(row['player_pk'])
+            if player_id is not None:
+                self.flags[player_id] = self.flags.get(player_id, 0) | _GOLD_FLAGS[row['kind']]
+        # 等级取 TIERS 中声明顺序最靠后的已达成门槛
+        for tier, (kind, minimum) in TIERS.items():
+            for (counted_kind, player_id), count in counts.items():
+                if counted_kind == kind and count >= minimum:
+                    self.ranks[player_id] = tier
+
+    def of(self, player_id: str) -> Dict:
+        flags = self.flags.get(player_id, 0)
+        return {'has_small_gold': bool(flags & SMALL_GOLD), 'has_big_gold': bool(flags & BIG_GOLD),
+                'is_retired': bool(flags & RETIRED), 'rank': self.ranks.get(player_id)}
+
+    def css_class(self, player_id: str) -> str:
+        """玩家链接的附加 CSS 类（带前导空格）：退役优先，其次大金、小金。"""
+        flags = self.flags.get(player_id, 0)
+        if flags & RETIRED:
+            return ' retired'
+        if flags & BIG_GOLD:
+            return ' has-big-gold'
+        if flags & SMALL_GOLD:
+            return ' has-small-gold'
+        return ''
+
+
+class BadgeService:
+    """按组织缓存 OrgBadges；manager 提供 org_versions()、player_directory 与 get_connection()。"""
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._orgs: Dict[str, OrgBadges] = {}
+        self._lock = threading.Lock()
+
+    def get(self, org_id: str) -> OrgBadges:
+        versions = self._manager.org_versions(org_id)[1:]
+        badges = self._orgs.get(org_id)
+        if badges is not None and badges.versions == versions:
+            return badges
+        directory = self._manager.player_directory.get(org_id)
+        with self._manager.get_connection() as conn:
+            rows = conn.execute('''SELECT kind, player_pk, count FROM player_achievement_counts
+                                   WHERE org_id = ? AND kind IN (?, ?)''',
+                                (org_id, *_GOLD_FLAGS)).fetchall()
+            # 金类记录增删都会经第一赢家的台账行推进 badges_version，此聚合随徽章表一起失效
+            co_winners = conn.execute('''SELECT DISTINCT special_score, winner2_pk AS player_pk FROM game_records
+                                         WHERE org_id = ? AND special_score IN (?, ?) AND winner2_pk IS NOT NULL''',
+                                      (org_id, *_GOLD_SCORES)).fetchall()
+        badges = OrgBadges(versions, directory, rows,
+                           [{'kind': _GOLD_SCORES[row['special_score']], 'player_pk': row['player_pk']}
+                            for row in co_winners])
+        with self._lock:
+            self._orgs[org_id] = badges
+        return badges
+
+    def invalidate(self, org_id: str = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._orgs.clear()
+            else:
+                self._orgs.pop(org_id, None)
+
+
+def _current_badges() -> Optional[OrgBadges]:
+    organization = getattr(g, 'organization', None)
+    if organization is None:
+        return None
+    return current_app.extensions['database'].badges.get(organization['org_id'])
+
+
+def register_badge_helpers(app) -> None:
+    """注册模板函数 badge_class(player_id) 与 player_badges(player_id)。"""
+    @app.template_global()
+    def badge_class(player_id) -> str:
+        badges = _current_badges()
+        return badges.css_class(player_id) if badges is not None and player_id else ''
+
+    @app.template_global()
+    def player_badges(player_id) -> Dict:
+        badges = _current_badges()
+        if badges is None or not player_id:
+            return {'has_small_gold': False, 'has_big_gold': False, 'is_retired': False, 'rank': None}
+        return badges.of(player_id)
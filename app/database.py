@@ -6,10 +6,15 @@ import sqlite3
 import uuid
 import os
 import json
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from contextlib import contextmanager
-from flask import current_app, has_app_context
-from .utils import get_utc_timestamp
+from flask import current_app, g, has_app_context, has_request_context
+from .utils import get_utc_timestamp, timestamp_to_epoch
+from .badges import BadgeService
+from .json_import import SECTIONS, JsonImporter
+from .player_directory import PlayerDirectory
+from .query_cache import QueryCache, cached_query, invalidates_org
+from .achievement_rules import PAIR_COUNTERS, RECORD_COLUMNS, RULES, TIERS, accumulate, pair_counts, rule_filter
 from .tenancy import (
     EMS_ORG_ID,
     generate_organization_slug,
@@ -24,8 +29,17 @@ class DatabaseManager:
 
     def __init__(self, db_path: str = None):
         """初始化数据库连接"""
-        if db_path is None:
-            db_path = os.environ.get('DATABASE_PATH')
+        self.db_path = db_path or self.default_path()
+        # 读穿缓存默认关闭，由 create_app 按配置开启
+        self.query_cache = QueryCache()
+        self.player_directory = PlayerDirectory(self)
+        self.badges = BadgeService(self)
+        self.init_database()
+
+    @staticmethod
+    def default_path() -> str:
+        """未指定路径时的数据库位置：DATABASE_PATH，Azure 持久化目录，或当前目录。"""
+        db_path = os.environ.get('DATABASE_PATH')
         if db_path is None:
             # 检测是否在Azure环境
             if os.environ.get('WEBSITE_SITE_NAME'):
@@ -40,9 +54,7 @@ class DatabaseManager:
             else:
                 # 本地开发环境
                 db_path = 'ems_pool_gamble.db'
-
-        self.db_path = db_path
-        self.init_database()
+        return db_path
 
     @contextmanager
     def get_connection(self):
@@ -56,208 +68,35 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def init_database(self):
-        """初始化目标租户结构，或原子升级旧版单组织数据库。"""
-        initialize_database(self.db_path)
-        print(f"数据库初始化完成: {self.db_path}")
-
-    def upgrade_to_multi_loser_support(self):
-        """升级数据库以支持多败者记录"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-
-            # 检查是否已经有 loser_id2 列
-            cursor.execute("PRAGMA table_info(game_records)")
-            columns = [column[1] for column in cursor.fetchall()]
-
-            if 'loser_id2' in columns and 'special_score' in columns:
-                print("数据库已支持多败者记录")
-                return
-
-            print("开始升级数据库以支持多败者记录...")
-
-            # 添加新列
-            if 'loser_id2' not in columns:
-                cursor.execute('ALTER TABLE game_records ADD COLUMN loser_id2 TEXT')
-                print("添加了 loser_id2 列")
-
-            if 'special_score' not in columns:
-                cursor.execute('ALTER TABLE game_records ADD COLUMN special_score TEXT')
-                print("添加了 special_score 列")
-
-            # 如果有 special_score_part 列，进行数据迁移
-            if 'special_score_part' in columns:
-                print("开始迁移数据...")
-
-                # 获取所有记录
-                cursor.execute('''
-                    SELECT record_id, session_id, winner_id, loser_id, score,
-                           created_at, special_score_part
-                    FROM game_records
-                    ORDER BY session_id, created_at
-                ''')
-                all_records = cursor.fetchall()
-
-                # 分析并合并记录
-                records_to_delete = []
-                records_to_update = []
-
-                i = 0
-                while i < len(all_records):
-                    record = all_records[i]
-                    special_part = record[6]  # special_score_part
-
-                    # 检查是否是特殊分数的第一条记录
-                    if special_part and '1/2 (总分' in special_part:
-                        # 提取总分数
-                        total_score = int(special_part.split('总分')[1].split(')')[0])
-
-                        # 寻找对应的第二条记录
-                        if i + 1 < len(all_records):
-                            next_record = all_records[i + 1]
-                            next_special_part = next_record[6]
-
-                            if (next_special_part and
-                                f'2/2 (总分{total_score})' in next_special_part and
-                                next_record[1] == record[1] and  # 同一场次
-                                next_record[2] == record[2]):    # 同一胜者
-
-                                # 合并两条记录为一条
-                                special_score = "大金" if total_score == 20 else "双吃"
-
-                                records_to_update.append({
-                                    'record_id': record[0],
-                                    'loser_id2': next_record[3],  # 第二个败者
-                                    'total_score': total_score,
-                                    'special_score': special_score
-                                })
-
-                                # 标记第二条记录待删除
-                                records_to_delete.append(next_record[0])
-
-                                i += 2  # 跳过下一条记录
-                                continue
-
-                    # 处理普通记录
-                    special_score = None
-                    if record[4] >= 7:  # score >= 7
-                        special_score = "小金"
-
-                    records_to_update.append({
-                        'record_id': record[0],
-                        'loser_id2': None,
-                        'total_score': record[4],
-                        'special_score': special_score
-                    })
-
-                    i += 1
-
-                # 执行更新
-                for update in records_to_update:
-                    cursor.execute('''
-                        UPDATE game_records
-                        SET loser_id2 = ?, score = ?, special_score = ?
-                        WHERE record_id = ?
-                    ''', (update['loser_id2'], update['total_score'],
-                          update['special_score'], update['record_id']))
-
-                # 删除重复记录
-                for record_id in records_to_delete:
-                    cursor.execute('DELETE FROM game_records WHERE record_id = ?', (record_id,))
-
-                print(f"更新了 {len(records_to_update)} 条记录")
-                print(f"删除了 {len(records_to_delete)} 条重复记录")
-
-                # 删除旧列
-                cursor.execute('''
-                    CREATE TABLE game_records_new (
-                        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        session_id TEXT NOT NULL,
-                        winner_id TEXT NOT NULL,
-                        loser_id TEXT NOT NULL,
-                        loser_id2 TEXT,
-                        score INTEGER NOT NULL,
-                        created_at TEXT NOT NULL,
-                        special_score TEXT,
-                        FOREIGN KEY (session_id) REFERENCES sessions (session_id),
-                        FOREIGN KEY (winner_id) REFERENCES players (player_id),
-                        FOREIGN KEY (loser_id) REFERENCES players (player_id),
-                        FOREIGN KEY (loser_id2) REFERENCES players (player_id)
-                    )
-                ''')
+    # ===== 读缓存版本 =====
 
-                cursor.execute('''
-                    INSERT INTO game_records_new
-                    (record_id, session_id, winner_id, loser_id, loser_id2, score, created_at, special_score)
-                    SELECT record_id, session_id, winner_id, loser_id, loser_id2, score, created_at, special_score
-                    FROM game_records
-                ''')
+    def org_versions(self, org_id: str) -> Tuple[int, int, int]:
+        """组织的 (缓存版本, 玩家版本, 徽章版本)，由触发器在写入时推进，请求内只读取一次。"""
+        memo = g.setdefault('org_cache_versions', {}) if has_request_context() else {}
+        if org_id not in memo:
+            with self.get_connection() as conn:
+                row = conn.execute('SELECT version, players_version, badges_version FROM org_cache_versions WHERE org_id = ?',
+                                   (org_id,)).fetchone()
+            memo[org_id] = tuple(row) if row else (0, 0, 0)
+        return memo[org_id]
 
-                cursor.execute('DROP TABLE game_records')
-                cursor.execute('ALTER TABLE game_records_new RENAME TO game_records')
+    def org_version(self, org_id: str) -> int:
+        return self.org_versions(org_id)[0]
 
-                # 重建索引
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_game_records_session ON game_records (session_id)')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_game_records_players ON game_records (winner_id, loser_id)')
+    def forget_org_version(self, org_id: str) -> None:
+        """写入后丢弃本请求记住的版本，使请求内随后的读取看到这次写入。"""
+        if has_request_context():
+            g.get('org_cache_versions', {}).pop(org_id, None)
 
-            conn.commit()
-            print("数据库升级完成！")
+    def cached_call(self, name: str, org_id: str, key_args: tuple, compute, ttl: float = None):
+        if not self.query_cache.enabled:
+            return compute()
+        return self.query_cache.fetch(name, org_id, self.org_version(org_id), key_args, compute, ttl)
 
-    def upgrade_to_multi_winner_support(self):
-        """升级数据库以支持多赢家记录（反向双吃：1输2赢）"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-
-            cursor.execute("PRAGMA table_info(game_records)")
-            columns = [column[1] for column in cursor.fetchall()]
-
-            if 'winner_id2' in columns:
-                return
-
-            print("开始升级数据库以支持多赢家记录...")
-            cursor.execute('ALTER TABLE game_records ADD COLUMN winner_id2 TEXT')
-            conn.commit()
-            print("添加了 winner_id2 列")
-
-    def _upgrade_player_retirement(self):
-        """升级 players 表以支持退役状态"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(players)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'is_retired' in columns:
-                return
-            print("添加 is_retired 列...")
-            cursor.execute('ALTER TABLE players ADD COLUMN is_retired INTEGER DEFAULT 0')
-            conn.commit()
-            print("添加了 is_retired 列")
-
-    def _migrate_round_names(self):
-        """将旧版轮次名 '1/8 决赛' → '16进8'，'1/4 决赛' → '8进4'。"""
-        renames = {
-            '1/8 决赛': '16进8',
-            '1/4 决赛': '8进4',
-        }
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            for old, new in renames.items():
-                cursor.execute(
-                    'UPDATE tournament_rounds SET round_name = ? WHERE round_name = ?',
-                    (new, old))
-                if cursor.rowcount > 0:
-                    print(f'轮次名迁移："{old}" → "{new}"（{cursor.rowcount} 条）')
-            conn.commit()
-
-    def _migrate_match_video_columns(self):
-        """tournament_matches 加 video_url 列（v1.9.3，存 B 站等视频链接）。"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(tournament_matches)")
-            columns = {row[1] for row in cursor.fetchall()}
-            if 'video_url' not in columns:
-                cursor.execute('ALTER TABLE tournament_matches ADD COLUMN video_url TEXT')
-                print('tournament_matches 加列：video_url')
-            conn.commit()
+    def init_database(self):
+        """初始化目标租户结构，或原子升级旧版单组织数据库。"""
+        initialize_database(self.db_path)
+        print(f"数据库初始化完成: {self.db_path}")
 
     # ===== 组织相关操作 =====
 
@@ -268,10 +107,13 @@ class DatabaseManager:
             ).fetchone()
             return dict(row) if row else None
 
+    # 正在清除的组织不再解析，其数据由 org_purge 分批删除
+    _NOT_PURGING = 'AND org_id NOT IN (SELECT org_id FROM org_purges)'
+
     def get_organization_by_slug(self, slug: str) -> Optional[Dict]:
         with self.get_connection() as conn:
             row = conn.execute(
-                'SELECT * FROM organizations WHERE slug = ?',
+                f'SELECT * FROM organizations WHERE slug = ? {self._NOT_PURGING}',
                 ((slug or '').strip().lower(),),
             ).fetchone()
             return dict(row) if row else None
@@ -282,14 +124,17 @@ class DatabaseManager:
             return None
         with self.get_connection() as conn:
             row = conn.execute(
-                '''SELECT * FROM organizations
-                   WHERE slug = ? OR name_key = ?''',
+                f'''SELECT * FROM organizations
+                   WHERE (slug = ? OR name_key = ?) {self._NOT_PURGING}''',
                 (lookup, lookup),
             ).fetchone()
             return dict(row) if row else None
 
     def organization_slug_exists(self, slug: str) -> bool:
-        return self.get_organization_by_slug(slug) is not None
+        # 清除完成前 slug 仍被占用
+        with self.get_connection() as conn:
+            return conn.execute('SELECT 1 FROM organizations WHERE slug = ?',
+                                ((slug or '').strip().lower(),)).fetchone() is not None
 
     def create_organization(self, name: str, admin_password_hash: str) -> Dict:
         """创建组织；调用方必须提供已哈希的非空管理员密码。"""
@@ -331,6 +176,7 @@ class DatabaseManager:
 
     # ===== 玩家相关操作 =====
 
+    @invalidates_org
     def create_player(self, org_id: str, name: str) -> str:
         player_id, now = str(uuid.uuid4()), get_utc_timestamp()
         with self.get_connection() as conn:
@@ -340,25 +186,34 @@ class DatabaseManager:
             conn.commit()
         return player_id
 
+    # 身份查找经由进程内玩家目录，请求内只需一次版本读取
     def get_player_by_name(self, org_id: str, name: str) -> Optional[str]:
-        with self.get_connection() as conn:
-            row = conn.execute('SELECT player_id FROM players WHERE org_id = ? AND name_key = ?',
-                               (org_id, normalize_name(name))).fetchone()
-            return row['player_id'] if row else None
+        entry = self.player_directory.get(org_id).by_key.get(normalize_name(name))
+        return entry.player_id if entry else None
+
+    def get_player_ids_by_names(self, org_id: str, names: List[str]) -> Dict[str, Optional[str]]:
+        """按姓名批量查找玩家 id，返回 {传入姓名: player_id 或 None}。"""
+        by_key = self.player_directory.get(org_id).by_key
+        entries = {name: by_key.get(normalize_name(name)) for name in names}
+        return {name: entry.player_id if entry else None for name, entry in entries.items()}
+
+    def get_player_names(self, org_id: str, player_ids: List[str]) -> Dict[str, str]:
+        """按 id 批量查找玩家姓名，不存在的 id 不出现在结果中。"""
+        by_id = self.player_directory.get(org_id).by_id
+        return {pid: by_id[pid].name for pid in player_ids if pid in by_id}
 
     def get_or_create_player(self, org_id: str, name: str) -> str:
         return self.get_player_by_name(org_id, name) or self.create_player(org_id, name)
 
     def get_player_by_id(self, org_id: str, player_id: str) -> Optional[Dict]:
-        with self.get_connection() as conn:
-            row = conn.execute('SELECT * FROM players WHERE org_id = ? AND player_id = ?',
-                               (org_id, player_id)).fetchone()
-            return dict(row) if row else None
+        entry = self.player_directory.find(org_id, player_id)
+        return entry.as_dict(org_id) if entry else None
 
     def get_player_name(self, org_id: str, player_id: str) -> str:
-        player = self.get_player_by_id(org_id, player_id)
-        return player['name'] if player else 'Unknown Player'
+        entry = self.player_directory.find(org_id, player_id)
+        return entry.name if entry else 'Unknown Player'
 
+    @invalidates_org
     def update_player_name(self, org_id: str, player_id: str, new_name: str) -> bool:
         with self.get_connection() as conn:
             cursor = conn.execute('''UPDATE players SET name = ?, name_key = ?, updated_at = ?
@@ -389,11 +244,13 @@ class DatabaseManager:
 
     # ===== 场次相关操作 =====
 
+    @invalidates_org
     def create_session(self, org_id: str, name: str) -> str:
         session_id, now = str(uuid.uuid4()), get_utc_timestamp()
         with self.get_connection() as conn:
-            conn.execute('''INSERT INTO sessions (session_id, org_id, name, active, created_at, updated_at)
-                            VALUES (?, ?, ?, 1, ?, ?)''', (session_id, org_id, name, now, now))
+            conn.execute('''INSERT INTO sessions (session_id, org_id, name, active, created_at, updated_at, created_epoch)
+                            VALUES (?, ?, ?, 1, ?, ?, ?)''', (session_id, org_id, name, now, now, timestamp_to_epoch(now)))
+            self._bump_month_activity(conn, org_id, now[:7], {}, sessions=1)
             conn.commit()
         return session_id
 
@@ -418,6 +275,13 @@ class DatabaseManager:
         session['records'] = self.get_session_records(org_id, session_id)
         return session
 
+    def get_recently_active_org_ids(self, limit: int = 20) -> List[str]:
+        """按最近有场次的月份、再按累计对局数排序的组织 id（启动预热用）。"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''SELECT org_id FROM org_month_activity WHERE session_count > 0 GROUP BY org_id
+                                   ORDER BY MAX(month) DESC, SUM(game_count) DESC LIMIT ?''', (limit,)).fetchall()
+        return [r['org_id'] for r in rows]
+
     def get_active_sessions(self, org_id: str) -> List[Dict]:
         with self.get_connection() as conn:
             return [dict(r) for r in conn.execute('''SELECT * FROM sessions WHERE org_id = ? AND active = 1
@@ -429,11 +293,20 @@ class DatabaseManager:
                                                      ORDER BY end_time DESC, updated_at DESC LIMIT ?''',
                                                   (org_id, limit)).fetchall()]
 
-    def get_all_sessions(self, org_id: str) -> List[Dict]:
+    def get_all_sessions(self, org_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        clause, params = self._epoch_range_clause('created_epoch', start_date, end_date)
+        with self.get_connection() as conn:
+            return [dict(r) for r in conn.execute(f'''SELECT * FROM sessions WHERE org_id = ?{clause}
+                                                      ORDER BY created_epoch DESC, created_at DESC''',
+                                                  [org_id] + params).fetchall()]
+
+    def get_earliest_session_date(self, org_id: str) -> Optional[str]:
         with self.get_connection() as conn:
-            return [dict(r) for r in conn.execute('SELECT * FROM sessions WHERE org_id = ? ORDER BY created_at DESC',
-                                                  (org_id,)).fetchall()]
+            row = conn.execute('''SELECT created_at FROM sessions WHERE org_id = ?
+                                  ORDER BY created_epoch LIMIT 1''', (org_id,)).fetchone()
+        return row['created_at'][:10] if row and row['created_at'] else None
 
+    @invalidates_org
     def end_session(self, org_id: str, session_id: str) -> bool:
         now = get_utc_timestamp()
         with self.get_connection() as conn:
@@ -442,18 +315,131 @@ class DatabaseManager:
             conn.commit()
             return cursor.rowcount > 0
 
+    @invalidates_org
     def delete_session(self, org_id: str, session_id: str) -> bool:
         with self.get_connection() as conn:
-            if not conn.execute('SELECT 1 FROM sessions WHERE org_id = ? AND session_id = ?',
-                                (org_id, session_id)).fetchone():
+            session_key = self._session_key(conn, org_id, session_id)
+            if session_key is None:
                 return False
-            for table in ('game_records', 'session_players', 'sessions'):
+            session_pk, month = session_key
+            participants, games = self._session_participation(conn, session_pk)
+            self._bump_month_activity(conn, org_id, month,
+                                      {pid: (-1, -count) for pid, count in participants.items()},
+                                      sessions=-1, games=-games)
+            records = conn.execute(f"SELECT {', '.join(RECORD_COLUMNS)} FROM game_records WHERE session_pk = ?",
+                                   (session_pk,)).fetchall()
+            conn.execute('DELETE FROM game_records WHERE session_pk = ?', (session_pk,))
+            self._bump_achievement_counts(conn, org_id, records, -1)
+            self._bump_pair_stats(conn, records, -1)
+            for table in ('session_players', 'sessions'):
                 conn.execute(f'DELETE FROM {table} WHERE org_id = ? AND session_id = ?', (org_id, session_id))
             conn.commit()
             return True
 
+    # ===== 月度活跃索引（月份下拉框） =====
+
+    @staticmethod
+    def _session_key(conn, org_id, session_id) -> Optional[Tuple[int, str]]:
+        """返回场次的 (session_pk, 所属月份 YYYY-MM)，场次不存在时返回 None。"""
+        row = conn.execute('SELECT session_pk, substr(created_at, 1, 7) FROM sessions WHERE org_id = ? AND session_id = ?',
+                           (org_id, session_id)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    @staticmethod
+    def _session_participation(conn, session_pk) -> Tuple[Dict[str, int], int]:
+        """返回 ({player_id: 参与记录数}, 场次记录总数)。"""
+        counts, games = {}, 0
+        for row in conn.execute('''SELECT winner_id, winner_id2, loser_id, loser_id2 FROM game_records
+                                    WHERE session_pk = ?''', (session_pk,)):
+            games += 1
+            for player_id in set(row) - {None}:
+                counts[player_id] = counts.get(player_id, 0) + 1
+        return counts, games
+
+    @staticmethod
+    def _played_in_session(conn, session_pk, player_pks: Dict[str, int]) -> Set[str]:
+        """返回给定玩家（{player_id: player_pk}）中在该场次仍有对局记录的 player_id。
+
+        只检查变更记录涉及的至多四名玩家，每人一次走 session_pk 索引、命中即停的 EXISTS。
+        """
+        return {player_id for player_id, player_pk in player_pks.items()
+                if conn.execute('''SELECT EXISTS (SELECT 1 FROM game_records WHERE session_pk = ?
+                                     AND ? IN (winner_pk, winner2_pk, loser_pk, loser2_pk))''',
+                                (session_pk, player_pk)).fetchone()[0]}
+
+    @staticmethod
+    def _bump_month_activity(conn, org_id, month, player_deltas, sessions=0, games=0):
+        """增量维护 org_month_activity / player_month_activity。
+
+        player_deltas: {player_id: (场次数增量, 对局数增量)}。计数归零的行会被删除。
+        """
+        conn.execute('''INSERT INTO org_month_activity (org_id, month, session_count, game_count)
+            VALUES (?, ?, ?, ?) ON CONFLICT (org_id, month) DO UPDATE SET
+                session_count = session_count + excluded.session_count,
+                game_count = game_count + excluded.game_count''', (org_id, month, sessions, games))
+        conn.executemany('''INSERT INTO player_month_activity (org_id, player_id, month, session_count, game_count)
+            VALUES (?, ?, ?, ?, ?) ON CONFLICT (org_id, player_id, month) DO UPDATE SET
+                session_count = session_count + excluded.session_count,
+                game_count = game_count + excluded.game_count''',
+            [(org_id, pid, month, ds, dg) for pid, (ds, dg) in player_deltas.items()])
+        conn.execute('DELETE FROM org_month_activity WHERE org_id = ? AND month = ? AND session_count <= 0',
+                     (org_id, month))
+        conn.execute('DELETE FROM player_month_activity WHERE org_id = ? AND month = ? AND session_count <= 0',
+                     (org_id, month))
+
+    # ===== 成就台账（player_achievement_counts） =====
+
+    @staticmethod
+    def _bump_achievement_counts(conn, org_id, records, sign):
+        """按成就规则增量维护台账。
+
+        records: 新增（sign=1）或已删除（sign=-1）的对局行，需含 achievement_rules.RECORD_COLUMNS。
+        删除时若移走了最早或最近一次，只按该玩家的整数主键索引重算时间边界。
+        """
+        for (_, kind, player_pk), (count, first, last) in accumulate(records).items():
+            key = (org_id, kind, player_pk)
+            if sign > 0:
+                conn.execute('''INSERT INTO player_achievement_counts (org_id, kind, player_pk, count, first_at, last_at)
+                    VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (org_id, kind, player_pk) DO UPDATE SET
+                        count = count + excluded.count,
+                        first_at = MIN(first_at, excluded.first_at),
+                        last_at = MAX(last_at, excluded.last_at)''', (*key, count, first, last))
+                continue
+            conn.execute('''UPDATE player_achievement_counts SET count = count - ?
+                            WHERE org_id = ? AND kind = ? AND player_pk = ?''', (count, *key))
+            row = conn.execute('''SELECT count, first_at, last_at FROM player_achievement_counts
+                                  WHERE org_id = ? AND kind = ? AND player_pk = ?''', key).fetchone()
+            if not row:
+                continue
+            if row['count'] <= 0:
+                conn.execute('DELETE FROM player_achievement_counts WHERE org_id = ? AND kind = ? AND player_pk = ?', key)
+            elif first <= row['first_at'] or last >= row['last_at']:
+                condition, params, roles = rule_filter(kind)
+                bounds = conn.execute(f'''SELECT MIN(created_at), MAX(created_at) FROM game_records
+                    WHERE ({' OR '.join(f'{role} = ?' for role in roles)}) AND {condition}''',
+                    (*[player_pk] * len(roles), *params)).fetchone()
+                conn.execute('''UPDATE player_achievement_counts SET first_at = ?, last_at = ?
+                                WHERE org_id = ? AND kind = ? AND player_pk = ?''', (*bounds, *key))
+
+    @staticmethod
+    def _bump_pair_stats(conn, records, sign):
+        """增量维护 player_pair_stats（规范化玩家对），计数器全部归零的玩家对会被删除。"""
+        pairs = pair_counts(records)
+        if not pairs:
+            return
+        columns = ', '.join(PAIR_COUNTERS)
+        conn.executemany(f'''INSERT INTO player_pair_stats (org_id, player_a_pk, player_b_pk, {columns})
+            VALUES (?, ?, ?, {', '.join('?' * len(PAIR_COUNTERS))})
+            ON CONFLICT (org_id, player_a_pk, player_b_pk) DO UPDATE SET
+                {', '.join(f'{c} = {c} + excluded.{c}' for c in PAIR_COUNTERS)}''',
+            [(*key, *(sign * n for n in counters)) for key, counters in pairs.items()])
+        if sign < 0:
+            conn.executemany(f'''DELETE FROM player_pair_stats WHERE org_id = ? AND player_a_pk = ? AND player_b_pk = ?
+                                  AND {' AND '.join(f'{c} <= 0' for c in PAIR_COUNTERS)}''', list(pairs))
+
     # ===== 玩家-场次关联操作 =====
 
+    @invalidates_org
     def add_player_to_session(self, org_id: str, session_id: str, player_id: str,
                               initial_score: int = 0) -> bool:
         with self.get_connection() as conn:
@@ -468,6 +454,7 @@ class DatabaseManager:
             except sqlite3.IntegrityError:
                 return False
 
+    @invalidates_org
     def update_player_score(self, org_id: str, session_id: str, player_id: str, score_change: int) -> bool:
         with self.get_connection() as conn:
             cursor = conn.execute('''UPDATE session_players SET score = score + ?
@@ -486,25 +473,40 @@ class DatabaseManager:
 
     # ===== 计分记录操作 =====
 
+    @invalidates_org
     def add_game_record(self, org_id: str, session_id: str, winner_id: str, loser_id: str,
                         score: int, special_score: str = None, loser_id2: str = None,
                         winner_id2: str = None) -> Optional[int]:
-        participant_ids = {winner_id, loser_id, *([loser_id2] if loser_id2 else []),
-                           *([winner_id2] if winner_id2 else [])}
+        participants = [winner_id, loser_id, *([loser_id2] if loser_id2 else []),
+                        *([winner_id2] if winner_id2 else [])]
+        participant_ids = set(participants)
+        if len(participant_ids) != len(participants):
+            return None
         placeholders = ','.join('?' * len(participant_ids))
+        now = get_utc_timestamp()
         with self.get_connection() as conn:
-            valid_session = conn.execute('SELECT 1 FROM sessions WHERE org_id = ? AND session_id = ?',
-                                         (org_id, session_id)).fetchone()
-            members = conn.execute(f'''SELECT player_id FROM session_players WHERE org_id = ?
-                                        AND session_id = ? AND player_id IN ({placeholders})''',
+            session_key = self._session_key(conn, org_id, session_id)
+            members = conn.execute(f'''SELECT sp.player_id, p.player_pk FROM session_players sp
+                                        JOIN players p ON p.org_id = sp.org_id AND p.player_id = sp.player_id
+                                        WHERE sp.org_id = ? AND sp.session_id = ? AND sp.player_id IN ({placeholders})''',
                                    (org_id, session_id, *participant_ids)).fetchall()
-            if not valid_session or {r['player_id'] for r in members} != participant_ids:
+            player_pks = {r['player_id']: r['player_pk'] for r in members}
+            if not session_key or set(player_pks) != participant_ids:
                 return None
+            session_pk, month = session_key
+            already_played = self._played_in_session(conn, session_pk, player_pks)
             cursor = conn.execute('''INSERT INTO game_records
-                (org_id, session_id, winner_id, winner_id2, loser_id, loser_id2, score, created_at, special_score)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (org_id, session_id, winner_id, winner_id2, loser_id, loser_id2, score, created_at,
+                 special_score, created_epoch, session_pk, winner_pk, winner2_pk, loser_pk, loser2_pk)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                 (org_id, session_id, winner_id, winner_id2, loser_id, loser_id2, score,
-                 get_utc_timestamp(), special_score))
+                 now, special_score, timestamp_to_epoch(now), session_pk, player_pks[winner_id],
+                 player_pks.get(winner_id2), player_pks[loser_id], player_pks.get(loser_id2)))
+            record = {'org_id': org_id, 'created_at': now, 'special_score': special_score, 'score': score,
+                      'winner_pk': player_pks[winner_id], 'winner2_pk': player_pks.get(winner_id2),
+                      'loser_pk': player_pks[loser_id], 'loser2_pk': player_pks.get(loser_id2)}
+            self._bump_achievement_counts(conn, org_id, [record], 1)
+            self._bump_pair_stats(conn, [record], 1)
             if winner_id2:
                 changes = ((winner_id, score // 2), (winner_id2, score // 2), (loser_id, -score))
             elif loser_id2:
@@ -515,6 +517,9 @@ class DatabaseManager:
                 conn.execute('''UPDATE session_players SET score = score + ?
                                 WHERE org_id = ? AND session_id = ? AND player_id = ?''',
                              (change, org_id, session_id, player_id))
+            self._bump_month_activity(
+                conn, org_id, month,
+                {pid: (0 if pid in already_played else 1, 1) for pid in participant_ids}, games=1)
             conn.commit()
             return cursor.lastrowid
 
@@ -523,11 +528,12 @@ class DatabaseManager:
             rows = conn.execute('''SELECT gr.*, pw.name AS winner_name, pw2.name AS winner2_name,
                                           pl1.name AS loser_name, pl2.name AS loser2_name
                 FROM game_records gr
-                JOIN players pw ON pw.org_id = gr.org_id AND pw.player_id = gr.winner_id
-                LEFT JOIN players pw2 ON pw2.org_id = gr.org_id AND pw2.player_id = gr.winner_id2
-                JOIN players pl1 ON pl1.org_id = gr.org_id AND pl1.player_id = gr.loser_id
-                LEFT JOIN players pl2 ON pl2.org_id = gr.org_id AND pl2.player_id = gr.loser_id2
-                WHERE gr.org_id = ? AND gr.session_id = ? ORDER BY gr.record_id DESC''',
+                JOIN players pw ON pw.player_pk = gr.winner_pk
+                LEFT JOIN players pw2 ON pw2.player_pk = gr.winner2_pk
+                JOIN players pl1 ON pl1.player_pk = gr.loser_pk
+                LEFT JOIN players pl2 ON pl2.player_pk = gr.loser2_pk
+                WHERE gr.session_pk = (SELECT session_pk FROM sessions WHERE org_id = ? AND session_id = ?)
+                ORDER BY gr.record_id DESC''',
                                 (org_id, session_id)).fetchall()
         records = []
         for row in rows:
@@ -545,6 +551,7 @@ class DatabaseManager:
             records.append(r)
         return records
 
+    @invalidates_org
     def delete_game_record(self, org_id: str, record_id: int) -> Optional[Dict]:
         with self.get_connection() as conn:
             row = conn.execute('SELECT * FROM game_records WHERE org_id = ? AND record_id = ?',
@@ -566,50 +573,183 @@ class DatabaseManager:
                                 WHERE org_id = ? AND session_id = ? AND player_id = ?''',
                              (change, org_id, record['session_id'], player_id))
             conn.execute('DELETE FROM game_records WHERE org_id = ? AND record_id = ?', (org_id, record_id))
+            self._bump_achievement_counts(conn, org_id, [record], -1)
+            self._bump_pair_stats(conn, [record], -1)
+            player_pks = {record[id_column]: record[pk_column] for id_column, pk_column in
+                          (('winner_id', 'winner_pk'), ('winner_id2', 'winner2_pk'),
+                           ('loser_id', 'loser_pk'), ('loser_id2', 'loser2_pk')) if record[id_column]}
+            remaining = self._played_in_session(conn, record['session_pk'], player_pks)
+            self._bump_month_activity(
+                conn, org_id, self._session_key(conn, org_id, record['session_id'])[1],
+                {pid: (0 if pid in remaining else -1, -1) for pid in player_pks}, games=-1)
             conn.commit()
             return record
 
-    def get_player_records(self, org_id: str, player_id: str, start_date: str = None,
-                           end_date: str = None) -> List[Dict]:
+    @staticmethod
+    def _epoch_range_clause(column, start_date=None, end_date=None) -> Tuple[str, list]:
+        """把起止时间字符串转换为整数 epoch 列上的闭区间条件。
+
+        只有日期（YYYY-MM-DD）的结束值包含当天全天；无法解析的值不参与筛选。
+        """
+        sql, params = '', []
+        start = timestamp_to_epoch(start_date)
+        if start is not None:
+            sql, params = f' AND {column} >= ?', [start]
+        end = timestamp_to_epoch(end_date)
+        if end is not None:
+            if len(end_date.strip()) == 10:
+                end += 86399
+            sql, params = sql + f' AND {column} <= ?', params + [end]
+        return sql, params
+
+    @staticmethod
+    def _player_pk(conn, org_id, player_id) -> Optional[int]:
+        row = conn.execute('SELECT player_pk FROM players WHERE org_id = ? AND player_id = ?',
+                           (org_id, player_id)).fetchone()
+        return row[0] if row else None
+
+    # 玩家整数主键只在所属组织内解析得到，因此按主键过滤的查询不再附加 org_id 条件——
+    # 否则查询规划器会改走 (org_id, created_epoch) 索引扫描整个组织。
+
+    def _player_records_query(self, player_pk, start_date=None, end_date=None):
         sql = '''SELECT gr.*, s.name AS session_name, pw.name AS winner_name, pw2.name AS winner2_name,
                         pl1.name AS loser1_name, pl2.name AS loser2_name FROM game_records gr
-                 JOIN sessions s ON s.org_id = gr.org_id AND s.session_id = gr.session_id
-                 JOIN players pw ON pw.org_id = gr.org_id AND pw.player_id = gr.winner_id
-                 LEFT JOIN players pw2 ON pw2.org_id = gr.org_id AND pw2.player_id = gr.winner_id2
-                 JOIN players pl1 ON pl1.org_id = gr.org_id AND pl1.player_id = gr.loser_id
-                 LEFT JOIN players pl2 ON pl2.org_id = gr.org_id AND pl2.player_id = gr.loser_id2
-                 WHERE gr.org_id = ? AND (gr.winner_id = ? OR gr.winner_id2 = ?
-                     OR gr.loser_id = ? OR gr.loser_id2 = ?)'''
-        params = [org_id, player_id, player_id, player_id, player_id]
-        if start_date: sql, params = sql + ' AND gr.created_at >= ?', params + [start_date]
-        if end_date: sql, params = sql + ' AND gr.created_at <= ?', params + [end_date]
+                 JOIN sessions s ON s.session_pk = gr.session_pk
+                 JOIN players pw ON pw.player_pk = gr.winner_pk
+                 LEFT JOIN players pw2 ON pw2.player_pk = gr.winner2_pk
+                 JOIN players pl1 ON pl1.player_pk = gr.loser_pk
+                 LEFT JOIN players pl2 ON pl2.player_pk = gr.loser2_pk
+                 WHERE (gr.winner_pk = ? OR gr.winner2_pk = ? OR gr.loser_pk = ? OR gr.loser2_pk = ?)'''
+        clause, params = self._epoch_range_clause('gr.created_epoch', start_date, end_date)
+        return sql + clause, [player_pk, player_pk, player_pk, player_pk] + params
+
+    @staticmethod
+    def _player_record_from_row(player_id, row) -> Dict:
+        r, winner = dict(row), row['winner_id'] == player_id or row['winner_id2'] == player_id
+        r['is_winner'] = winner
+        if winner:
+            if r['winner_id2']: r['score'] //= 2
+            opponents = [(r['loser_id'], r['loser1_name'])] + ([(r['loser_id2'], r['loser2_name'])] if r['loser2_name'] else [])
+        else:
+            if r['loser_id2']: r['score'] //= 2
+            opponents = [(r['winner_id'], r['winner_name'])] + ([(r['winner_id2'], r['winner2_name'])] if r['winner2_name'] else [])
+        r['opponent_name'] = ' + '.join(x[1] for x in opponents)
+        r['opponent_id'] = opponents[0][0] if len(opponents) == 1 else [x[0] for x in opponents]
+        r['opponent_names'] = None if len(opponents) == 1 else [{'id': x[0], 'name': x[1]} for x in opponents]
+        r['timestamp'] = r['created_at']
+        return r
+
+    def get_player_records(self, org_id: str, player_id: str, start_date: str = None,
+                           end_date: str = None) -> List[Dict]:
         with self.get_connection() as conn:
+            sql, params = self._player_records_query(self._player_pk(conn, org_id, player_id),
+                                                     start_date, end_date)
             rows = conn.execute(sql + ' ORDER BY gr.created_at DESC', params).fetchall()
-        results = []
-        for row in rows:
-            r, winner = dict(row), row['winner_id'] == player_id or row['winner_id2'] == player_id
-            r['is_winner'] = winner
-            if winner:
-                if r['winner_id2']: r['score'] //= 2
-                opponents = [(r['loser_id'], r['loser1_name'])] + ([(r['loser_id2'], r['loser2_name'])] if r['loser2_name'] else [])
-            else:
-                if r['loser_id2']: r['score'] //= 2
-                opponents = [(r['winner_id'], r['winner_name'])] + ([(r['winner_id2'], r['winner2_name'])] if r['winner2_name'] else [])
-            r['opponent_name'] = ' + '.join(x[1] for x in opponents)
-            r['opponent_id'] = opponents[0][0] if len(opponents) == 1 else [x[0] for x in opponents]
-            r['opponent_names'] = None if len(opponents) == 1 else [{'id': x[0], 'name': x[1]} for x in opponents]
-            r['timestamp'] = r['created_at']; results.append(r)
-        return results
+        return [self._player_record_from_row(player_id, row) for row in rows]
+
+    def get_player_records_page(self, org_id: str, player_id: str, start_date: str = None,
+                                end_date: str = None, before: Tuple[str, int] = None,
+                                limit: int = 50) -> Tuple[List[Dict], Optional[Tuple[str, int]]]:
+        """Keyset page of a player's records, newest first.
+
+        ``before`` is the ``(created_at, record_id)`` of the last record already shown; the
+        returned cursor is the same pair for the last record of this page, or None at the end.
+        """
+        records = []
+        with self.get_connection() as conn:
+            sql, params = self._player_records_query(self._player_pk(conn, org_id, player_id),
+                                                     start_date, end_date)
+            if before:
+                sql += ' AND (gr.created_at < ? OR (gr.created_at = ? AND gr.record_id < ?))'
+                params += [before[0], before[0], before[1]]
+            sql += ' ORDER BY gr.created_at DESC, gr.record_id DESC LIMIT ?'
+            params.append(limit + 1)
+            for row in conn.execute(sql, params):
+                if len(records) == limit:
+                    last = records[-1]
+                    return records, (last['created_at'], last['record_id'])
+                records.append(self._player_record_from_row(player_id, row))
+        return records, None
+
+    def _player_share_cte(self, player_pk, start_date=None, end_date=None):
+        """CTE ``mine``: one row per record with the player's own side, share and opponents."""
+        sql = '''WITH mine AS (
+                 SELECT record_id, session_pk, created_at, special_score, won,
+                        CASE WHEN (won AND winner_id2 IS NOT NULL) OR (NOT won AND loser_id2 IS NOT NULL)
+                             THEN score / 2 ELSE score END AS my_score,
+                        CASE WHEN won THEN loser_id ELSE winner_id END AS opponent_id,
+                        CASE WHEN won THEN loser_id2 ELSE winner_id2 END AS opponent_id2,
+                        CASE WHEN won THEN loser_pk ELSE winner_pk END AS opponent_pk,
+                        CASE WHEN won THEN loser2_pk ELSE winner2_pk END AS opponent_pk2
+                 FROM (SELECT gr.*, (gr.winner_pk = ? OR IFNULL(gr.winner2_pk = ?, 0)) AS won FROM game_records gr
+                       WHERE (gr.winner_pk = ? OR gr.winner2_pk = ? OR gr.loser_pk = ? OR gr.loser2_pk = ?)'''
+        clause, params = self._epoch_range_clause('gr.created_epoch', start_date, end_date)
+        return sql + clause + '))', [player_pk] * 6 + params
+
+    def get_player_record_summary(self, org_id: str, player_id: str, start_date: str = None,
+                                  end_date: str = None) -> Dict:
+        """Roll up a player's records in SQL: totals, 1-point split, gold counts and per-opponent stats."""
+        with self.get_connection() as conn:
+            cte, params = self._player_share_cte(self._player_pk(conn, org_id, player_id),
+                                                 start_date, end_date)
+            totals = conn.execute(cte + '''
+                SELECT COUNT(*) AS total_games, IFNULL(SUM(won), 0) AS wins,
+                       IFNULL(SUM(CASE WHEN won THEN my_score ELSE -my_score END), 0) AS total_score,
+                       IFNULL(SUM(my_score != 1), 0) AS competitive_games,
+                       IFNULL(SUM(won AND my_score != 1), 0) AS competitive_wins,
+                       IFNULL(SUM(won AND my_score = 1), 0) AS one_point_received,
+                       IFNULL(SUM(NOT won AND my_score = 1), 0) AS one_point_given,
+                       IFNULL(SUM(won AND special_score = '小金'), 0) AS small_gold_count,
+                       IFNULL(SUM(won AND special_score = '大金'), 0) AS big_gold_count
+                FROM mine''', params).fetchone()
+            opponents = conn.execute(cte + '''
+                SELECT o.opponent_id AS id, COALESCE(p.name, 'Unknown Player') AS name,
+                       SUM(o.my_score != 1 AND o.won) AS wins, SUM(o.my_score != 1 AND NOT o.won) AS losses,
+                       SUM(CASE WHEN o.won THEN o.share ELSE -o.share END) AS total_score
+                FROM (SELECT opponent_id, opponent_pk, won, my_score,
+                             CASE WHEN opponent_id2 IS NULL THEN my_score ELSE my_score / 2 END AS share FROM mine
+                      UNION ALL
+                      SELECT opponent_id2, opponent_pk2, won, my_score, my_score / 2 FROM mine
+                      WHERE opponent_id2 IS NOT NULL) o
+                LEFT JOIN players p ON p.player_pk = o.opponent_pk
+                GROUP BY o.opponent_id''', params).fetchall()
+        summary = dict(totals)
+        summary['losses'] = summary['total_games'] - summary['wins']
+        summary['competitive_losses'] = summary['competitive_games'] - summary['competitive_wins']
+        summary['opponents'] = [dict(r) for r in opponents]
+        return summary
+
+    def get_player_score_trend(self, org_id: str, player_id: str, start_date: str = None,
+                               end_date: str = None) -> List[Dict]:
+        """Cumulative score points for the trend chart, oldest first, without building full records."""
+        sql = '''
+            SELECT m.created_at AS timestamp, s.name AS session_name, m.won AS is_winner,
+                   m.my_score AS record_score,
+                   SUM(CASE WHEN m.won THEN m.my_score ELSE -m.my_score END)
+                       OVER (ORDER BY m.created_at, m.record_id) AS score,
+                   o1.name || IFNULL(' + ' || o2.name, '') AS opponent_name
+            FROM mine m
+            JOIN sessions s ON s.session_pk = m.session_pk
+            JOIN players o1 ON o1.player_pk = m.opponent_pk
+            LEFT JOIN players o2 ON o2.player_pk = m.opponent_pk2
+            ORDER BY m.created_at, m.record_id'''
+        trend = []
+        with self.get_connection() as conn:
+            cte, params = self._player_share_cte(self._player_pk(conn, org_id, player_id),
+                                                 start_date, end_date)
+            for index, row in enumerate(conn.execute(cte + sql, params), start=1):
+                point = dict(row)
+                point['game_index'], point['is_winner'] = index, bool(point['is_winner'])
+                trend.append(point)
+        return trend
 
     # ===== 统计查询 =====
 
-    def _player_record_rows(self, conn, org_id, player_id, start_date=None, end_date=None):
+    def _player_record_rows(self, conn, player_pk, start_date=None, end_date=None):
         sql = '''SELECT winner_id, winner_id2, loser_id, loser_id2, score FROM game_records
-                 WHERE org_id = ? AND (winner_id = ? OR winner_id2 = ? OR loser_id = ? OR loser_id2 = ?)'''
-        params = [org_id, player_id, player_id, player_id, player_id]
-        if start_date: sql, params = sql + ' AND DATE(created_at) >= ?', params + [start_date]
-        if end_date: sql, params = sql + ' AND DATE(created_at) <= ?', params + [end_date]
-        return conn.execute(sql, params).fetchall()
+                 WHERE (winner_pk = ? OR winner2_pk = ? OR loser_pk = ? OR loser2_pk = ?)'''
+        clause, params = self._epoch_range_clause('created_epoch', start_date, end_date)
+        return conn.execute(sql + clause, [player_pk] * 4 + params).fetchall()
 
     @staticmethod
     def _stats_from_rows(player_id, rows):
@@ -626,193 +766,91 @@ class DatabaseManager:
         return stats
 
     def get_player_stats(self, org_id: str, player_id: str) -> Dict:
-        with self.get_connection() as conn: stats = self._stats_from_rows(player_id, self._player_record_rows(conn, org_id, player_id))
+        with self.get_connection() as conn: stats = self._stats_from_rows(player_id, self._player_record_rows(conn, self._player_pk(conn, org_id, player_id)))
         return {k: stats[k] for k in ('total_games', 'wins', 'losses', 'total_score')}
 
+    @cached_query(ttl=120)
     def get_global_leaderboard(self, org_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
         with self.get_connection() as conn:
-            players = conn.execute('SELECT player_id, name FROM players WHERE org_id = ?', (org_id,)).fetchall()
+            players = conn.execute('SELECT player_pk, player_id, name FROM players WHERE org_id = ?', (org_id,)).fetchall()
             board = []
             for p in players:
-                stats = self._stats_from_rows(p['player_id'], self._player_record_rows(conn, org_id, p['player_id'], start_date, end_date))
+                stats = self._stats_from_rows(p['player_id'], self._player_record_rows(conn, p['player_pk'], start_date, end_date))
                 if stats['total_games']:
                     stats.update(player_id=p['player_id'], id=p['player_id'], name=p['name'], score=stats['total_score'],
                                  win_rate=(stats['effective_wins'] / stats['effective_games'] * 100 if stats['effective_games'] else 0))
                     board.append(stats)
         return sorted(board, key=lambda x: x['total_score'], reverse=True)
 
+    @staticmethod
+    def _month_options(rows) -> List[Dict]:
+        return [{'key': r['month'], 'name': f"{int(r['month'][:4])}年{int(r['month'][5:7])}月",
+                 'count': r['session_count']} for r in rows]
+
     def get_available_months(self, org_id: str) -> List[Dict]:
         with self.get_connection() as conn:
-            rows = conn.execute('''SELECT strftime('%Y-%m', created_at) AS key, CAST(strftime('%Y', created_at) AS INTEGER) AS year,
-                CAST(strftime('%m', created_at) AS INTEGER) AS month, COUNT(DISTINCT session_id) AS count
-                FROM sessions WHERE org_id = ? GROUP BY key ORDER BY key DESC''', (org_id,)).fetchall()
-        return [{'key': r['key'], 'name': f"{r['year']}年{r['month']}月", 'count': r['count']} for r in rows]
+            rows = conn.execute('''SELECT month, session_count FROM org_month_activity
+                                   WHERE org_id = ? ORDER BY month DESC''', (org_id,)).fetchall()
+        return self._month_options(rows)
 
     def get_available_months_for_player(self, org_id: str, player_id: str) -> List[Dict]:
         with self.get_connection() as conn:
-            rows = conn.execute('''SELECT strftime('%Y-%m', s.created_at) AS key, CAST(strftime('%Y', s.created_at) AS INTEGER) AS year,
-                CAST(strftime('%m', s.created_at) AS INTEGER) AS month, COUNT(DISTINCT s.session_id) AS count FROM sessions s
-                WHERE s.org_id = ? AND EXISTS (SELECT 1 FROM game_records gr WHERE gr.org_id = s.org_id AND gr.session_id = s.session_id
-                    AND (gr.winner_id = ? OR gr.winner_id2 = ? OR gr.loser_id = ? OR gr.loser_id2 = ?)) GROUP BY key ORDER BY key DESC''',
-                (org_id, player_id, player_id, player_id, player_id)).fetchall()
-        return [{'key': r['key'], 'name': f"{r['year']}年{r['month']}月", 'count': r['count']} for r in rows]
+            rows = conn.execute('''SELECT month, session_count FROM player_month_activity
+                                   WHERE org_id = ? AND player_id = ? ORDER BY month DESC''',
+                                (org_id, player_id)).fetchall()
+        return self._month_options(rows)
 
     def get_player_effective_win_rate(self, org_id: str, player_id: str) -> Optional[float]:
-        with self.get_connection() as conn: stats = self._stats_from_rows(player_id, self._player_record_rows(conn, org_id, player_id))
+        with self.get_connection() as conn: stats = self._stats_from_rows(player_id, self._player_record_rows(conn, self._player_pk(conn, org_id, player_id)))
         return round(stats['effective_wins'] / stats['effective_games'] * 100, 1) if stats['effective_games'] else None
 
     # ===== 数据迁移工具 =====
 
-    def migrate_from_json(self, json_data: Dict, org_id: str = EMS_ORG_ID):
+    def migrate_from_json(self, json_data: Dict, org_id: str = EMS_ORG_ID) -> Dict:
         """Import the historical JSON format without changing score semantics."""
-        with self.get_connection() as conn:
-            for player_id, data in json_data.get('players', {}).items():
-                conn.execute(
-                    '''INSERT OR REPLACE INTO players
-                       (player_id, org_id, name, name_key, created_at, updated_at, is_retired)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (
-                        player_id, org_id, data['name'], normalize_name(data['name']),
-                        data['created_at'], data['updated_at'], data.get('is_retired', 0),
-                    ),
-                )
-
-            for session_id, data in json_data.get('sessions', {}).items():
-                conn.execute(
-                    '''INSERT OR REPLACE INTO sessions
-                       (session_id, org_id, name, active, created_at, updated_at, end_time)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (
-                        session_id, org_id, data['name'], int(data.get('active', True)),
-                        data['timestamp'], data['timestamp'], data.get('end_time'),
-                    ),
-                )
-                player_ids = data.get('player_ids') or [
-                    row['player_id']
-                    for name in data.get('players', [])
-                    for row in conn.execute(
-                        '''SELECT player_id FROM players
-                           WHERE org_id = ? AND name_key = ?''',
-                        (org_id, normalize_name(name)),
-                    ).fetchall()
-                ]
-                for player_id in player_ids:
-                    conn.execute(
-                        '''INSERT OR REPLACE INTO session_players
-                           (org_id, session_id, player_id, score)
-                           VALUES (?, ?, ?, 0)''',
-                        (org_id, session_id, player_id),
-                    )
-
-                records = data.get('records', [])
-                normalized_records = []
-                index = 0
-                while index < len(records):
-                    record = dict(records[index])
-                    part = record.get('special_score_part')
-                    if part and '1/2 (总分' in part and index + 1 < len(records):
-                        try:
-                            total_score = int(part.split('总分', 1)[1].split(')', 1)[0])
-                        except (ValueError, IndexError):
-                            total_score = None
-                        next_record = records[index + 1]
-                        next_part = next_record.get('special_score_part')
-                        if (
-                            total_score is not None
-                            and next_part
-                            and f'2/2 (总分{total_score})' in next_part
-                            and next_record.get('winner_id') == record.get('winner_id')
-                        ):
-                            record['loser_id2'] = next_record.get('loser_id')
-                            record['score'] = total_score
-                            record['special_score'] = '大金' if total_score == 20 else '双吃'
-                            index += 1
-                    if not record.get('special_score') and part in {'小金', '大金', '双吃'}:
-                        record['special_score'] = part
-                    normalized_records.append(record)
-                    index += 1
-
-                for record in normalized_records:
-                    winner_id = record.get('winner_id')
-                    winner_id2 = record.get('winner_id2')
-                    loser_id = record.get('loser_id')
-                    loser_id2 = record.get('loser_id2')
-                    score = record['score']
-                    conn.execute(
-                        '''INSERT INTO game_records
-                           (org_id, session_id, winner_id, winner_id2, loser_id,
-                            loser_id2, score, created_at, special_score,
-                            special_score_part)
-                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                        (
-                            org_id, session_id, winner_id, winner_id2, loser_id,
-                            loser_id2, score, record['timestamp'],
-                            record.get('special_score'),
-                            record.get('special_score_part'),
-                        ),
-                    )
-                    if winner_id2:
-                        changes = (
-                            (winner_id, score // 2),
-                            (winner_id2, score // 2),
-                            (loser_id, -score),
-                        )
-                    elif loser_id2:
-                        changes = (
-                            (winner_id, score),
-                            (loser_id, -(score // 2)),
-                            (loser_id2, -(score // 2)),
-                        )
-                    else:
-                        changes = ((winner_id, score), (loser_id, -score))
-                    for player_id, delta in changes:
-                        conn.execute(
-                            '''UPDATE session_players SET score = score + ?
-                               WHERE org_id = ? AND session_id = ? AND player_id = ?''',
-                            (delta, org_id, session_id, player_id),
-                        )
-            conn.commit()
+        entries = ((section, key, data) for section in SECTIONS for key, data in json_data.get(section, {}).items())
+        return JsonImporter(self, org_id).run(entries)
 
     # ===== 成就相关 =====
 
+    # 小金/大金光环来自徽章服务（成就台账），不再扫描 game_records
     def get_player_special_wins(self, org_id: str, player_id: str) -> Dict[str, bool]:
-        with self.get_connection() as conn:
-            rows = conn.execute('''SELECT DISTINCT special_score FROM game_records WHERE org_id = ?
-                AND (winner_id = ? OR winner_id2 = ?) AND special_score IS NOT NULL''', (org_id, player_id, player_id)).fetchall()
-        scores = {r['special_score'] for r in rows}; return {'has_small_gold': '小金' in scores, 'has_big_gold': '大金' in scores}
+        return self.get_players_special_wins_batch(org_id, [player_id])[player_id]
 
     def get_players_special_wins_batch(self, org_id: str, player_ids: List[str]) -> Dict[str, Dict[str, bool]]:
-        result = {pid: {'has_small_gold': False, 'has_big_gold': False} for pid in player_ids}
-        if not player_ids: return result
-        marks = ','.join('?' * len(player_ids))
-        with self.get_connection() as conn:
-            rows = conn.execute(f'''SELECT winner_id, winner_id2, special_score FROM game_records WHERE org_id = ?
-                AND (winner_id IN ({marks}) OR winner_id2 IN ({marks})) AND special_score IS NOT NULL''', [org_id, *player_ids, *player_ids]).fetchall()
-        for r in rows:
-            for pid in (r['winner_id'], r['winner_id2']):
-                if pid in result: result[pid]['has_small_gold' if r['special_score'] == '小金' else 'has_big_gold'] = True
-        return result
+        badges = self.badges.get(org_id)
+        return {pid: {key: value for key, value in badges.of(pid).items() if key.startswith('has_')} for pid in player_ids}
+
+    def get_player_badge_classes(self, org_id: str, player_ids) -> Dict[str, str]:
+        badges = self.badges.get(org_id); classes = {pid: badges.css_class(pid) for pid in player_ids}
+        return {pid: css for pid, css in classes.items() if css}
 
-    def _achievement_score(self, kind): return {'small_gold': '小金', 'big_gold': '大金'}.get(kind)
+    # 按组织内 UUID 解析玩家整数主键的标量子查询（参数: org_id, player_id）
+    _PLAYER_PK = '(SELECT player_pk FROM players WHERE org_id = ? AND player_id = ?)'
 
+    def _ledger_players(self, org_id, kind, minimum=1, below=None) -> List[Dict]:
+        """从成就台账读取 [minimum, below) 次数区间的玩家，按次数降序、首次达成升序。"""
+        sql = '''SELECT p.player_id, p.name, c.count AS achievement_count, c.first_at AS first_achievement_date, c.last_at AS latest_achievement_date
+                 FROM player_achievement_counts c JOIN players p ON p.player_pk = c.player_pk
+                 WHERE c.org_id = ? AND c.kind = ? AND c.count >= ?'''; params = [org_id, kind, minimum]
+        if below is not None: sql, params = sql + ' AND c.count < ?', params + [below]
+        with self.get_connection() as conn: return [dict(r) for r in conn.execute(sql + ' ORDER BY c.count DESC, c.first_at ASC', params).fetchall()]
+
+    @cached_query()
     def get_achievement_players(self, org_id: str, achievement_type: str) -> List[Dict]:
-        score = self._achievement_score(achievement_type)
-        if not score: return []
-        with self.get_connection() as conn:
-            rows = conn.execute('''SELECT p.player_id, p.name, COUNT(gr.record_id) AS achievement_count, MIN(gr.created_at) AS first_achievement_date, MAX(gr.created_at) AS latest_achievement_date
-                FROM players p JOIN game_records gr ON p.org_id = gr.org_id AND p.player_id = gr.winner_id WHERE p.org_id = ? AND gr.special_score = ?
-                GROUP BY p.player_id, p.name ORDER BY achievement_count DESC, first_achievement_date ASC''', (org_id, score)).fetchall()
-            return [dict(r) for r in rows]
+        return self._ledger_players(org_id, achievement_type) if achievement_type in RULES else []
 
+    @cached_query()
     def get_achievement_records(self, org_id: str, achievement_type: str, player_id: str = None) -> List[Dict]:
-        score = self._achievement_score(achievement_type)
-        if not score: return []
+        if achievement_type not in RULES: return []
+        condition, params, roles = rule_filter(achievement_type, 'gr')
         sql = '''SELECT gr.record_id, gr.session_id, gr.created_at, gr.score, gr.special_score, winner.name AS winner_name, loser.name AS loser_name,
                  loser2.name AS loser2_name, gr.loser_id, gr.loser_id2, s.name AS session_name FROM game_records gr
-                 JOIN players winner ON winner.org_id = gr.org_id AND winner.player_id = gr.winner_id JOIN players loser ON loser.org_id = gr.org_id AND loser.player_id = gr.loser_id
-                 LEFT JOIN players loser2 ON loser2.org_id = gr.org_id AND loser2.player_id = gr.loser_id2 JOIN sessions s ON s.org_id = gr.org_id AND s.session_id = gr.session_id
-                 WHERE gr.org_id = ? AND gr.special_score = ?'''; params = [org_id, score]
-        if player_id: sql, params = sql + ' AND gr.winner_id = ?', params + [player_id]
+                 JOIN players winner ON winner.player_pk = gr.winner_pk JOIN players loser ON loser.player_pk = gr.loser_pk
+                 LEFT JOIN players loser2 ON loser2.player_pk = gr.loser2_pk JOIN sessions s ON s.session_pk = gr.session_pk
+                 WHERE gr.org_id = ? AND ''' + condition; params = [org_id, *params]
+        if player_id:
+            sql += f" AND ({' OR '.join(f'{role} = {self._PLAYER_PK}' for role in roles)})"; params += [org_id, player_id] * len(roles)
         with self.get_connection() as conn: rows = conn.execute(sql + ' ORDER BY gr.created_at DESC', params).fetchall()
         out = []
         for row in rows:
@@ -821,72 +859,81 @@ class DatabaseManager:
             out.append(r)
         return out
 
+    @cached_query()
     def get_achievement_stats(self, org_id: str) -> Dict:
         with self.get_connection() as conn:
-            result = {}
-            for key, score in [('small_gold_players', '小金'), ('big_gold_players', '大金')]:
-                result[key] = conn.execute('SELECT COUNT(DISTINCT winner_id) AS n FROM game_records WHERE org_id = ? AND special_score = ?', (org_id, score)).fetchone()['n']
-            for key, score, minimum in [('small_gold_masters', '小金', 10), ('big_gold_masters', '大金', 5), ('big_gold_legends', '大金', 10), ('small_gold_legends', '小金', 20)]:
-                result[key] = conn.execute('''SELECT COUNT(*) AS n FROM (SELECT winner_id FROM game_records WHERE org_id = ? AND special_score = ? GROUP BY winner_id HAVING COUNT(*) >= ?)''', (org_id, score, minimum)).fetchone()['n']
-            result['gold_loser_players'] = conn.execute('''SELECT COUNT(DISTINCT player_id) AS n FROM (SELECT loser_id AS player_id FROM game_records WHERE org_id = ? AND special_score IN ('小金', '大金') UNION SELECT loser_id2 AS player_id FROM game_records WHERE org_id = ? AND special_score IN ('小金', '大金'))''', (org_id, org_id)).fetchone()['n']
+            rows = conn.execute('SELECT kind, count FROM player_achievement_counts WHERE org_id = ?', (org_id,)).fetchall()
+        counts = {kind: [r['count'] for r in rows if r['kind'] == kind] for kind in RULES}
+        result = {f'{kind}_players': len(values) for kind, values in counts.items()}
+        result.update({f'{kind}_records': sum(values) for kind, values in counts.items()})
+        for tier, (kind, minimum) in TIERS.items():
+            result[tier + 's'] = sum(1 for n in counts[kind] if n >= minimum)
         return result
 
+    @cached_query()
     def get_achievement_master_players(self, org_id: str, achievement_type: str) -> List[Dict]:
-        options = {'small_gold_master': ('小金', 10), 'small_gold_legend': ('小金', 20), 'big_gold_master': ('大金', 5), 'big_gold_legend': ('大金', 10)}
-        if achievement_type not in options: return []
-        score, minimum = options[achievement_type]
-        with self.get_connection() as conn:
-            rows = conn.execute('''SELECT p.player_id, p.name, COUNT(gr.record_id) AS achievement_count, MIN(gr.created_at) AS first_achievement_date, MAX(gr.created_at) AS latest_achievement_date
-                FROM players p JOIN game_records gr ON p.org_id = gr.org_id AND p.player_id = gr.winner_id WHERE p.org_id = ? AND gr.special_score = ?
-                GROUP BY p.player_id, p.name HAVING COUNT(gr.record_id) >= ? ORDER BY achievement_count DESC, first_achievement_date ASC''', (org_id, score, minimum)).fetchall()
-            return [dict(r) for r in rows]
+        if achievement_type not in TIERS: return []
+        kind, minimum = TIERS[achievement_type]
+        return self._ledger_players(org_id, kind, minimum)
 
+    @cached_query()
+    def get_achievement_approaching_players(self, org_id: str, achievement_type: str) -> List[Dict]:
+        if achievement_type not in TIERS: return []
+        kind, minimum = TIERS[achievement_type]
+        return self._ledger_players(org_id, kind, below=minimum)
+
+    @cached_query()
     def get_negative_achievement_players(self, org_id: str, achievement_type: str) -> List[Dict]:
+        """大吃一金玩家及各自"被谁痛击最多"，一次聚合完成（并列时取最近一次痛击的对手）。"""
         if achievement_type != 'gold_loser': return []
-        with self.get_connection() as conn:
-            rows = conn.execute('''SELECT p.player_id, p.name, COUNT(gr.record_id) AS defeat_count, MIN(gr.created_at) AS first_defeat_date, MAX(gr.created_at) AS latest_defeat_date
-                FROM players p JOIN game_records gr ON p.org_id = gr.org_id AND (p.player_id = gr.loser_id OR p.player_id = gr.loser_id2)
-                WHERE p.org_id = ? AND gr.special_score IN ('小金', '大金') GROUP BY p.player_id, p.name ORDER BY defeat_count DESC, first_defeat_date ASC''', (org_id,)).fetchall()
-            return [dict(r) for r in rows]
+        condition, params, roles = rule_filter('gold_loser')
+        defeats = ' UNION ALL '.join(f'SELECT {role} AS player_pk, winner_pk, created_at FROM game_records '
+                                     f'WHERE org_id = ? AND {condition} AND {role} IS NOT NULL' for role in roles)
+        with self.get_connection() as conn:
+            rows = conn.execute(f'''WITH defeats AS ({defeats}),
+                ranked AS (
+                    SELECT player_pk, winner_pk, COUNT(*) AS n,
+                           ROW_NUMBER() OVER (PARTITION BY player_pk ORDER BY COUNT(*) DESC, MAX(created_at) DESC, winner_pk) AS rank
+                    FROM defeats GROUP BY player_pk, winner_pk),
+                top AS MATERIALIZED (SELECT player_pk, winner_pk, n FROM ranked WHERE rank = 1)
+                SELECT p.player_id, p.name, c.count AS defeat_count, c.first_at AS first_defeat_date, c.last_at AS latest_defeat_date,
+                       w.player_id AS most_defeated_by_id, w.name AS most_defeated_by, IFNULL(r.n, 0) AS most_defeated_count
+                FROM player_achievement_counts c JOIN players p ON p.player_pk = c.player_pk
+                LEFT JOIN top r ON r.player_pk = c.player_pk LEFT JOIN players w ON w.player_pk = r.winner_pk
+                WHERE c.org_id = ? AND c.kind = 'gold_loser' ORDER BY c.count DESC, c.first_at ASC''',
+                                [*([org_id, *params] * len(roles)), org_id]).fetchall()
+        return [dict(r) for r in rows]
 
     def get_negative_achievement_records(self, org_id: str, achievement_type: str, player_id: str = None) -> List[Dict]:
-        if achievement_type != 'gold_loser': return []
-        sql = '''SELECT gr.record_id, gr.session_id, gr.created_at, gr.score, gr.special_score, winner.name AS winner_name, loser.name AS loser_name, loser2.name AS loser2_name, gr.loser_id, gr.loser_id2, s.name AS session_name FROM game_records gr
-            JOIN players winner ON winner.org_id = gr.org_id AND winner.player_id = gr.winner_id JOIN players loser ON loser.org_id = gr.org_id AND loser.player_id = gr.loser_id
-            LEFT JOIN players loser2 ON loser2.org_id = gr.org_id AND loser2.player_id = gr.loser_id2 JOIN sessions s ON s.org_id = gr.org_id AND s.session_id = gr.session_id
-            WHERE gr.org_id = ? AND gr.special_score IN ('小金', '大金')'''; params = [org_id]
-        if player_id: sql, params = sql + ' AND (gr.loser_id = ? OR gr.loser_id2 = ?)', params + [player_id, player_id]
-        with self.get_connection() as conn: return [dict(r) for r in conn.execute(sql + ' ORDER BY gr.created_at DESC', params).fetchall()]
+        return self.get_achievement_records(org_id, achievement_type, player_id) if achievement_type == 'gold_loser' else []
 
+    @cached_query()
     def get_best_buddy_stats(self, org_id: str) -> List[Dict]:
-        with self.get_connection() as conn:
-            rows = conn.execute('''SELECT gr.winner_id, w.name AS winner_name, gr.loser_id, l.name AS loser_name, COUNT(*) AS gift_count FROM game_records gr
-                JOIN players w ON w.org_id = gr.org_id AND w.player_id = gr.winner_id JOIN players l ON l.org_id = gr.org_id AND l.player_id = gr.loser_id
-                WHERE gr.org_id = ? AND gr.score = 1 GROUP BY gr.winner_id, gr.loser_id''', (org_id,)).fetchall()
-        maxes = {}
-        for row in rows:
-            r = dict(row)
-            if r['winner_id'] not in maxes or r['gift_count'] > maxes[r['winner_id']]['gift_count']: maxes[r['winner_id']] = r
-        return sorted([{'player_id': r['winner_id'], 'player_name': r['winner_name'], 'buddy_id': r['loser_id'], 'buddy_name': r['loser_name'], 'gift_count': r['gift_count']} for r in maxes.values()], key=lambda r: r['gift_count'], reverse=True)
-
+        """每位玩家 1 分局里赢得最多的对手（好兄弟），读取 player_pair_stats。"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''WITH gifts AS (
+                    SELECT player_a_pk AS player_pk, player_b_pk AS buddy_pk, gifts_to_a AS n FROM player_pair_stats WHERE org_id = ? AND gifts_to_a > 0
+                    UNION ALL SELECT player_b_pk, player_a_pk, gifts_to_b FROM player_pair_stats WHERE org_id = ? AND gifts_to_b > 0),
+                ranked AS (SELECT player_pk, buddy_pk, n, ROW_NUMBER() OVER (PARTITION BY player_pk ORDER BY n DESC, buddy_pk) AS rank FROM gifts)
+                SELECT p.player_id, p.name AS player_name, b.player_id AS buddy_id, b.name AS buddy_name, r.n AS gift_count
+                FROM ranked r JOIN players p ON p.player_pk = r.player_pk JOIN players b ON b.player_pk = r.buddy_pk
+                WHERE r.rank = 1 ORDER BY gift_count DESC, p.name''', (org_id, org_id)).fetchall()
+        return [dict(r) for r in rows]
+
+    @cached_query()
     def get_duo_loser_stats(self, org_id: str) -> List[Dict]:
+        """一起作为败者的玩家组合（有难同当），读取 player_pair_stats。"""
         with self.get_connection() as conn:
-            rows = conn.execute('''SELECT gr.loser_id, l1.name AS loser1_name, gr.loser_id2, l2.name AS loser2_name, COUNT(*) AS duo_count FROM game_records gr
-                JOIN players l1 ON l1.org_id = gr.org_id AND l1.player_id = gr.loser_id JOIN players l2 ON l2.org_id = gr.org_id AND l2.player_id = gr.loser_id2
-                WHERE gr.org_id = ? AND gr.loser_id2 IS NOT NULL GROUP BY gr.loser_id, gr.loser_id2''', (org_id,)).fetchall()
-        pairs = {}
-        for row in rows:
-            r = dict(row); key = tuple(sorted((r['loser_id'], r['loser_id2'])))
-            if key not in pairs:
-                a, b = (r['loser_id'], r['loser1_name']), (r['loser_id2'], r['loser2_name'])
-                if a[0] != key[0]: a, b = b, a
-                pairs[key] = {'player1_id': a[0], 'player1_name': a[1], 'player2_id': b[0], 'player2_name': b[1], 'duo_count': 0}
-            pairs[key]['duo_count'] += r['duo_count']
-        return sorted(pairs.values(), key=lambda r: r['duo_count'], reverse=True)
+            rows = conn.execute('''SELECT a.player_id AS player1_id, a.name AS player1_name, b.player_id AS player2_id,
+                                          b.name AS player2_name, s.shared_losses AS duo_count
+                FROM player_pair_stats s JOIN players a ON a.player_pk = s.player_a_pk JOIN players b ON b.player_pk = s.player_b_pk
+                WHERE s.org_id = ? AND s.shared_losses > 0 ORDER BY duo_count DESC, a.name, b.name''', (org_id,)).fetchall()
+        return [dict(r) for r in rows]
 
+    @cached_query()
     def get_honor_roll_stats(self, org_id: str, top_n: int = 10) -> Dict[str, List[Dict]]:
         valid = '''SELECT sp.session_id, MAX(sp.score) AS high, MIN(sp.score) AS low FROM session_players sp JOIN sessions s ON s.org_id = sp.org_id AND s.session_id = sp.session_id
-                   WHERE sp.org_id = ? AND s.active = 0 AND EXISTS (SELECT 1 FROM game_records gr WHERE gr.org_id = sp.org_id AND gr.session_id = sp.session_id) GROUP BY sp.session_id'''
+                   WHERE sp.org_id = ? AND s.active = 0 AND EXISTS (SELECT 1 FROM game_records gr WHERE gr.session_pk = s.session_pk) GROUP BY sp.session_id'''
         with self.get_connection() as conn:
             champions = conn.execute(f'''SELECT p.player_id, p.name, COUNT(*) AS champion_count FROM session_players sp JOIN players p ON p.org_id = sp.org_id AND p.player_id = sp.player_id JOIN ({valid}) v ON v.session_id = sp.session_id WHERE sp.org_id = ? AND sp.score = v.high AND sp.score > 0 GROUP BY p.player_id, p.name ORDER BY champion_count DESC, p.name ASC LIMIT ?''', (org_id, org_id, top_n)).fetchall()
             losers = conn.execute(f'''SELECT p.player_id, p.name, COUNT(*) AS loser_count FROM session_players sp JOIN players p ON p.org_id = sp.org_id AND p.player_id = sp.player_id JOIN ({valid}) v ON v.session_id = sp.session_id WHERE sp.org_id = ? AND sp.score = v.low AND sp.score < 0 GROUP BY p.player_id, p.name ORDER BY loser_count DESC, p.name ASC LIMIT ?''', (org_id, org_id, top_n)).fetchall()
@@ -894,6 +941,7 @@ class DatabaseManager:
 
     # ===== 退役相关 =====
 
+    @invalidates_org
     def _set_retired(self, org_id: str, player_id: str, retired: bool) -> bool:
         with self.get_connection() as conn:
             cursor = conn.execute('UPDATE players SET is_retired = ? WHERE org_id = ? AND player_id = ?', (int(retired), org_id, player_id))
@@ -905,13 +953,10 @@ class DatabaseManager:
     def comeback_player(self, org_id: str, player_id: str) -> bool: return self._set_retired(org_id, player_id, False)
 
     def is_player_retired(self, org_id: str, player_id: str) -> bool:
-        with self.get_connection() as conn:
-            row = conn.execute('SELECT is_retired FROM players WHERE org_id = ? AND player_id = ?', (org_id, player_id)).fetchone()
-            return bool(row and row['is_retired'])
+        return player_id in self.player_directory.get(org_id).retired_ids
 
     def get_retired_player_ids(self, org_id: str) -> set:
-        with self.get_connection() as conn:
-            return {r['player_id'] for r in conn.execute('SELECT player_id FROM players WHERE org_id = ? AND is_retired = 1', (org_id,)).fetchall()}
+        return set(self.player_directory.get(org_id).retired_ids)
 
 
 class DatabaseProxy:
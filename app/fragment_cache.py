@@ -0,0 +1,121 @@
+"""
+模板片段缓存 - {% cache key, generation %} ... {% endcache %}
+
+片段的缓存键为 (模板名, key, generation)。模板中以 cache_generation() 作为
+generation，其值为 (组织 id, 组织缓存版本)：组织数据任何写入都会推进版本，
+旧片段不再命中，不同组织的同名片段也互不相同。generation 为 None 时（如不在
+组织页面中）直接渲染不缓存。
+
+片段内容只能依赖组织数据和 key 中列出的参数，不得包含当前用户相关的内容
+（管理员按钮、CSRF token 等）。
+
+后端可替换：实现 get(key) / set(key, value) 即可；默认后端按片段字节数约束
+总内存并做 LRU 淘汰。同时为 Jinja 配置磁盘字节码缓存，冷启动的 worker
+无需重新编译大模板。
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from flask import g
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from .database import get_db
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+class MemoryFragmentBackend:
+    """进程内片段缓存，按 UTF-8 字节数约束总大小。"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key: Hashable, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self._stats['evictions'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes, **self._stats}
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, generation %} 标签；后端为 environment.fragment_cache，为 None 时不缓存。"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        parser.stream.expect('comma')
+        args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args), [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, template_name, key, generation, caller):
+        backend = self.environment.fragment_cache
+        if backend is None or generation is None:
+            return caller()
+        cache_key = (template_name, key, generation)
+        value = backend.get(cache_key)
+        if value is None:
+            value = str(caller())
+            backend.set(cache_key, value)
+        return Markup(value)
+
+
+def cache_generation():
+    """当前组织的片段 generation：(组织 id, 组织缓存版本)。"""
+    organization = getattr(g, 'organization', None)
+    if organization is None:
+        return None
+    return organization['org_id'], get_db().org_version(organization['org_id'])
+
+
+def register_fragment_cache(app, backend=None, bytecode_dir: str = None) -> None:
+    """安装 {% cache %} 扩展、cache_generation() 与磁盘字节码缓存。"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = backend
+    app.jinja_env.globals['cache_generation'] = cache_generation
+    if bytecode_dir is None:
+        # 放在本地临时目录而不是 /home：Azure 的 /home 是网络存储
+        bytecode_dir = os.path.join(tempfile.gettempdir(), 'ems-pool-jinja-bytecode')
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
@@ -14,9 +14,8 @@ from .models import (save_data,
                      get_player_by_name, get_player_name, get_or_create_player, create_player,
                      get_available_players, get_session,
                      add_player_to_session, add_game_record, delete_game_record,
-                     end_session, delete_session, add_multi_loser_record,
-                     get_players_special_wins_batch,
-                     get_retired_player_ids)
+                     end_session, delete_session, add_multi_loser_record)
+from .loaders import request_loader
 from .utils import get_utc_timestamp, compute_pairwise_edges
 from .security import is_current_org_admin, require_admin_auth, require_csrf_protection
 from . import DEFAULT_SCORE_OPTIONS, APP_VERSION
@@ -39,11 +38,11 @@ def register_game_routes(bp):
         if not session_id:
             flash('请先选择一个场次', 'error')
             return redirect(url_for('tenant.index'))
-        if not get_session(_org_id(), session_id):
+        loader = request_loader()
+        game_session = loader.session(session_id)
+        if not game_session:
             abort(404)
 
-        game_session = get_session(_org_id(), session_id)
-
         # 检查场次是否已被结束
         if not game_session.get('active', True):
             flash('该场次已经结束，跳转到详情页面查看结果', 'info')
@@ -53,7 +52,7 @@ def register_game_routes(bp):
         # 构建包含player_id的玩家列表
         players_with_ids = []
         for player_name in game_session.get('players', set()):
-            player_id = get_player_by_name(_org_id(), player_name)
+            player_id = loader.player_id(player_name)
             score = game_session.get('scores', {}).get(player_name, 0)
             players_with_ids.append({
                 'name': player_name,
@@ -64,23 +63,14 @@ def register_game_routes(bp):
         # 按分数排序
         sorted_players = sorted(players_with_ids, key=lambda x: x['score'], reverse=True)
 
-        # 获取玩家的特殊胜利记录（小金、大金）
-        current_player_ids = [p['id'] for p in players_with_ids if p['id']]
-        special_wins = get_players_special_wins_batch(_org_id(), current_player_ids) if current_player_ids else {}
-
-        # 将特殊胜利记录添加到玩家信息中
-        for player in sorted_players:
-            if player['id'] and player['id'] in special_wins:
-                player.update(special_wins[player['id']])
-            else:
-                player.update({'has_small_gold': False, 'has_big_gold': False})
-
         # 为游戏记录添加必要的ID信息（用于链接跳转）
         if 'records' in game_session:
-            for record in game_session['records']:
+            missing = [record for record in game_session['records'] if 'winner_id' not in record and 'winner' in record]
+            # 先登记全部姓名，第一次 load 时合并为一次查询
+            loader.player_ids.defer(*(record['winner'] for record in missing))
+            for record in missing:
                 # 确保记录中有winner_id（用于链接）
-                if 'winner_id' not in record and 'winner' in record:
-                    record['winner_id'] = get_player_by_name(_org_id(), record['winner'])
+                record['winner_id'] = loader.player_id(record['winner'])
 
         # 准备可用玩家的信息（用于显示）
         available_player_data = get_available_players(_org_id(), exclude_session_id=session_id)
@@ -100,7 +90,6 @@ def register_game_routes(bp):
             score_options=DEFAULT_SCORE_OPTIONS,
             sorted_players=sorted_players,
             recent_players=available_player_data,
-            retired_player_ids=get_retired_player_ids(_org_id()),
             pairwise_nodes=pairwise_nodes,
             pairwise_edges=pairwise_edges,
             app_version=APP_VERSION
@@ -276,10 +265,8 @@ def register_game_routes(bp):
                 return redirect(url_for('tenant.game', session_id=session_id))
             return redirect(url_for('tenant.index') if status == 404 else url_for('tenant.game', session_id=session_id))
 
-        if not get_session(_org_id(), session_id):
-            return _resp(False, '场次不存在', 404)
-
-        game_session = get_session(_org_id(), session_id)
+        loader = request_loader()
+        game_session = loader.session(session_id)
         if not game_session:
             return _resp(False, '场次不存在', 404)
 
@@ -302,9 +289,8 @@ def register_game_routes(bp):
         if winner not in game_session.get('players', set()) or loser not in game_session.get('players', set()):
             return _resp(False, '选择的玩家不在当前场次中', 400)
 
-        # 获取玩家ID
-        winner_id = get_player_by_name(_org_id(), winner)
-        loser_id = get_player_by_name(_org_id(), loser)
+        # 获取玩家ID（场次内玩家已随场次预填）
+        winner_id, loser_id = loader.player_ids.load_many((winner, loser))
 
         # 添加计分记录（传递特殊分数类型）
         add_game_record(_org_id(), session_id, winner_id, loser_id, score, special_score)
@@ -354,6 +340,9 @@ def register_game_routes(bp):
         if len(losers) != 2:
             return _resp(False, '特殊分数需要选择两个败者', 400)
 
+        if losers[0] == losers[1]:
+            return _resp(False, '两个败者不能是同一人', 400)
+
         # 检查所有玩家是否存在
         all_players = [winner] + losers
         game_players = game_session.get('players', set())
@@ -409,6 +398,9 @@ def register_game_routes(bp):
         if len(winners) != 2:
             return _resp(False, '反向双吃需要选择两个赢家', 400)
 
+        if winners[0] == winners[1]:
+            return _resp(False, '两个赢家不能是同一人', 400)
+
         if loser in winners:
             return _resp(False, '输家不能同时是赢家', 400)
 
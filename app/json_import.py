@@ -0,0 +1,301 @@
+"""
+旧版 JSON 数据导入 - 流式解析、批量写入 data.json
+
+旧版 data.json 的结构为 {"players": {player_id: {...}}, "sessions": {session_id: {...}}}。
+导入器逐个解析 players / sessions 下的条目，不把整个文件读入内存：
+- 玩家、场次、场次玩家与对局记录分别攒批，用 executemany 批量写入
+- 缺少 player_ids 的场次按内存中的 name_key -> player_id 映射解析姓名；文件中 sessions
+  出现在 players 之前时，含未解析姓名的场次留到全部条目读完后再写入
+- 场次玩家得分在内存中按对局记录累计，随场次一次写入，不再逐条 UPDATE
+- 全部写入后一次性回填整数键与派生表（月活跃、成就台账、玩家对统计）
+
+整个导入在一个事务内完成，失败不会留下部分数据。命令行用法：
+
+    python -m app.json_import data.json --org ems [--database path/to/db]
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from .achievement_rules import rebuild_achievement_counts, rebuild_pair_stats
+from .tenancy import EMS_ORG_SLUG, fill_record_keys, normalize_name, rebuild_month_activity
+from .utils import timestamp_to_epoch
+
+DEFAULT_BATCH_SIZE = 500
+READ_CHUNK = 64 * 1024
+SECTIONS = ('players', 'sessions')
+
+
+class _JsonReader:
+    """按需从文本流读取的 JSON 解析器：对象键逐个产出，值用 raw_decode 整体解析。"""
+
+    def __init__(self, stream: TextIO, chunk_size: int = READ_CHUNK):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self.consumed = 0
+
+    def _fill(self, size: int) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self.consumed += self._pos
+        self._buffer, self._pos = self._buffer[self._pos:] + chunk, 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._chunk_size):
+                raise ValueError('JSON 数据意外结束')
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f'JSON 数据在第 {self.consumed + self._pos} 个字符处应为 {char!r}')
+        self._pos += 1
+
+    def value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # 缓冲区末尾的数字或字面量可能还没读完
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # 读取量随缓冲区翻倍，大条目的重试解析总量保持线性
+            if not self._fill(max(self._chunk_size, len(self._buffer) - self._pos)) and not self._buffer:
+                raise ValueError('JSON 数据意外结束')
+
+    def object_keys(self) -> Iterator[str]:
+        """逐个产出对象的键；调用方在取下一个键之前必须用 value() 或 object_keys() 消费对应的值。"""
+        self._expect('{')
+        first = True
+        while True:
+            if self._peek() == '}':
+                self._pos += 1
+                return
+            if not first:
+                self._expect(',')
+            first = False
+            if self._peek() != '"':
+                raise ValueError(f'JSON 数据在第 {self.consumed + self._pos} 个字符处应为键')
+            key = self.value()
+            self._expect(':')
+            yield key
+
+
+def iter_legacy_entries(stream: TextIO, chunk_size: int = READ_CHUNK) -> Iterator[Tuple[str, str, Dict]]:
+    """流式产出 ('players' | 'sessions', id, 条目)；其他顶层键被跳过。"""
+    reader = _JsonReader(stream, chunk_size)
+    for section in reader.object_keys():
+        if section in SECTIONS:
+            for key in reader.object_keys():
+                yield section, key, reader.value()
+        else:
+            reader.value()
+
+
+def normalize_legacy_records(records: List[Dict]) -> List[Dict]:
+    """合并旧版拆成两条的特殊记录（'1/2 (总分N)' + '2/2 (总分N)'），补齐 special_score。"""
+    normalized_records = []
+    index = 0
+    while index < len(records):
+        record = dict(records[index])
+        part = record.get('special_score_part')
+        if part and '1/2 (总分' in part and index + 1 < len(records):
+            try:
+                total_score = int(part.split('总分', 1)[1].split(')', 1)[0])
+            except (ValueError, IndexError):
+                total_score = None
+            next_record = records[index + 1]
+            next_part = next_record.get('special_score_part')
+            if (
+                total_score is not None
+                and next_part
+                and f'2/2 (总分{total_score})' in next_part
+                and next_record.get('winner_id') == record.get('winner_id')
+            ):
+                record['loser_id2'] = next_record.get('loser_id')
+                record['score'] = total_score
+                record['special_score'] = '大金' if total_score == 20 else '双吃'
+                index += 1
+        if not record.get('special_score') and part in {'小金', '大金', '双吃'}:
+            record['special_score'] = part
+        normalized_records.append(record)
+        index += 1
+    return normalized_records
+
+
+def score_changes(record: Dict) -> Tuple[Tuple[str, int], ...]:
+    """一条记录对场次得分的增减，与计分写路径一致。"""
+    winner_id, winner_id2 = record.get('winner_id'), record.get('winner_id2')
+    loser_id, loser_id2 = record.get('loser_id'), record.get('loser_id2')
+    score = record['score']
+    if winner_id2:
+        return (winner_id, score // 2), (winner_id2, score // 2), (loser_id, -score)
+    if loser_id2:
+        return (winner_id, score), (loser_id, -(score // 2)), (loser_id2, -(score // 2))
+    return (winner_id, score), (loser_id, -score)
+
+
+class JsonImporter:
+    """把旧版 JSON 条目批量导入一个组织；manager 提供 get_connection() 与 forget_org_version()。"""
+
+    def __init__(self, manager, org_id: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._manager = manager
+        self.org_id = org_id
+        self.batch_size = batch_size
+        self.counts = {'players': 0, 'sessions': 0, 'records': 0}
+        self._names: Dict[str, str] = {}
+        self._players: List[Tuple] = []
+        self._sessions: List[Tuple] = []
+        self._members: List[Tuple] = []
+        self._records: List[Tuple] = []
+        self._deferred: List[Tuple[str, Dict]] = []
+
+    def run(self, entries: Iterable[Tuple[str, str, Dict]], progress=None) -> Dict:
+        """导入 (section, id, 条目) 序列，返回计数与吞吐量。"""
+        started = time.perf_counter()
+        with self._manager.get_connection() as conn:
+            try:
+                # 文件中 sessions 可能在 players 之前：外键在提交时统一检查（该设置在事务结束时复位）
+                conn.execute('BEGIN')
+                conn.execute('PRAGMA defer_foreign_keys = ON')
+                self._names = {row['name_key']: row['player_id'] for row in conn.execute(
+                    'SELECT name_key, player_id FROM players WHERE org_id = ?', (self.org_id,))}
+                for section, key, data in entries:
+                    if section == 'players':
+                        self._add_player(key, data)
+                    elif section == 'sessions':
+                        if self._unresolved(data):
+                            self._deferred.append((key, data))
+                        else:
+                            self._add_session(key, data)
+                    if len(self._players) + len(self._sessions) + len(self._records) >= self.batch_size:
+                        self._flush(conn)
+                        if progress:
+                            progress(dict(self.counts))
+                # 全部玩家已读入；仍无法解析的姓名与逐条导入一样跳过
+                for key, data in self._deferred:
+                    self._add_session(key, data)
+                self._flush(conn)
+                cursor = conn.cursor()
+                fill_record_keys(cursor, self.org_id)
+                rebuild_month_activity(cursor, self.org_id)
+                rebuild_achievement_counts(cursor, self.org_id)
+                rebuild_pair_stats(cursor, self.org_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self._manager.forget_org_version(self.org_id)
+        seconds = time.perf_counter() - started
+        rows = sum(self.counts.values())
+        return dict(self.counts, seconds=round(seconds, 3),
+                    rows_per_second=round(rows / seconds) if seconds else None)
+
+    def _add_player(self, player_id: str, data: Dict) -> None:
+        name_key = normalize_name(data['name'])
+        self._names[name_key] = player_id
+        self._players.append((player_id, self.org_id, data['name'], name_key,
+                              data['created_at'], data['updated_at'], data.get('is_retired', 0)))
+        self.counts['players'] += 1
+
+    def _unresolved(self, data: Dict) -> bool:
+        return not data.get('player_ids') and any(
+            normalize_name(name) not in self._names for name in data.get('players', []))
+
+    def _add_session(self, session_id: str, data: Dict) -> None:
+        self._sessions.append((session_id, self.org_id, data['name'], int(data.get('active', True)),
+                               data['timestamp'], data['timestamp'], data.get('end_time'),
+                               timestamp_to_epoch(data['timestamp'])))
+        player_ids = data.get('player_ids') or [
+            self._names[key] for key in map(normalize_name, data.get('players', [])) if key in self._names]
+        scores = dict.fromkeys(player_ids, 0)
+        for record in normalize_legacy_records(data.get('records', [])):
+            self._records.append((
+                self.org_id, session_id, record.get('winner_id'), record.get('winner_id2'),
+                record.get('loser_id'), record.get('loser_id2'), record['score'], record['timestamp'],
+                record.get('special_score'), record.get('special_score_part'),
+                timestamp_to_epoch(record['timestamp']),
+            ))
+            # 不在场次玩家中的 id 没有得分行，与逐条 UPDATE 的结果一致
+            for player_id, delta in score_changes(record):
+                if player_id in scores:
+                    scores[player_id] += delta
+            self.counts['records'] += 1
+        self._members.extend((self.org_id, session_id, player_id, score) for player_id, score in scores.items())
+        self.counts['sessions'] += 1
+
+    def _flush(self, conn) -> None:
+        # 按外键依赖顺序写入：玩家、场次、场次玩家、对局记录
+        for rows, sql in (
+            (self._players, '''INSERT OR REPLACE INTO players
+                               (player_id, org_id, name, name_key, created_at, updated_at, is_retired)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)'''),
+            (self._sessions, '''INSERT OR REPLACE INTO sessions
+                                (session_id, org_id, name, active, created_at, updated_at, end_time, created_epoch)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''),
+            (self._members, '''INSERT OR REPLACE INTO session_players (org_id, session_id, player_id, score)
+                               VALUES (?, ?, ?, ?)'''),
+            (self._records, '''INSERT INTO game_records
+                               (org_id, session_id, winner_id, winner_id2, loser_id, loser_id2, score,
+                                created_at, special_score, special_score_part, created_epoch)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''),
+        ):
+            if rows:
+                conn.executemany(sql, rows)
+                rows.clear()
+
+
+def import_json_file(manager, path: str, org_id: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                     progress=None) -> Dict:
+    """流式导入一个旧版 JSON 文件到 org_id，返回计数、耗时与吞吐量。"""
+    with open(path, 'r', encoding='utf-8') as stream:
+        report = JsonImporter(manager, org_id, batch_size).run(iter_legacy_entries(stream), progress)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='把旧版 data.json 流式导入指定组织')
+    parser.add_argument('path', help='旧版 JSON 数据文件')
+    parser.add_argument('--org', default=EMS_ORG_SLUG, help='目标组织 slug（默认 ems）')
+    parser.add_argument('--database', help='SQLite 数据库路径（默认同应用：DATABASE_PATH 或内置位置）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from .database import DatabaseManager
+
+    manager = DatabaseManager(args.database)
+    organization = manager.get_organization_by_slug(args.org.lower())
+    if organization is None:
+        print(f'组织不存在: {args.org}', file=sys.stderr)
+        return 1
+
+    def progress(counts):
+        print(f"  已导入 {counts['players']} 个玩家, {counts['sessions']} 个场次, {counts['records']} 条记录",
+              file=sys.stderr)
+
+    report = import_json_file(manager, args.path, organization['org_id'], args.batch_size, progress)
+    print(f"导入完成: {report['players']} 个玩家, {report['sessions']} 个场次, {report['records']} 条记录, "
+          f"耗时 {report['seconds']:.2f}s ({report['rows_per_second']} 行/秒)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
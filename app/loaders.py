@@ -0,0 +1,120 @@
+"""
+请求级加载器 - 请求内记忆化模型调用，并把延迟的 id/姓名查找合并为一次 IN 查询
+
+路由通过 request_loader() 取得当前请求、当前组织的加载器：
+- session(session_id) / player(player_id)：同一请求内只查询一次
+- player_ids / player_names：DataLoader 风格的批量加载器。defer() 只登记键，
+  第一次 load() 时把所有已登记的键合并成一次查询；加载场次或玩家时顺带预填，
+  场次内玩家的姓名 <-> id 互查不再访问数据库
+
+加载器记住读取时的组织缓存版本；请求内发生写入后版本变化，记忆的结果全部丢弃，
+随后的读取看到这次写入。
+"""
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from flask import g
+
+from .database import get_db
+from .models import get_player_by_id, get_player_ids_by_names, get_player_names, get_session
+
+
+class BatchLoader:
+    """按键批量加载：batch_fn 接收键列表，返回 {键: 值}，缺失的键记为 None。"""
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Dict]):
+        self._batch_fn = batch_fn
+        self._values: Dict[Hashable, object] = {}
+        self._pending = set()
+        self.batches = 0
+
+    def defer(self, *keys: Hashable) -> None:
+        self._pending.update(key for key in keys if key is not None and key not in self._values)
+
+    def prime(self, key: Hashable, value) -> None:
+        self._values[key] = value
+        self._pending.discard(key)
+
+    def load(self, key: Hashable):
+        if key is None:
+            return None
+        if key not in self._values:
+            self._pending.add(key)
+            self._dispatch()
+        return self._values[key]
+
+    def load_many(self, keys: Iterable[Hashable]) -> List:
+        keys = list(keys)
+        self.defer(*keys)
+        return [self.load(key) for key in keys]
+
+    def _dispatch(self) -> None:
+        keys, self._pending = sorted(self._pending, key=str), set()
+        found = self._batch_fn(keys)
+        self.batches += 1
+        for key in keys:
+            self._values[key] = found.get(key)
+
+    def clear(self) -> None:
+        self._values.clear()
+        self._pending.clear()
+
+
+class RequestLoader:
+    """一个请求内、一个组织的模型查找。"""
+
+    def __init__(self, org_id: str):
+        self.org_id = org_id
+        self.player_ids = BatchLoader(lambda names: get_player_ids_by_names(org_id, names))
+        self.player_names = BatchLoader(lambda ids: get_player_names(org_id, ids))
+        self._memo: Dict[Hashable, object] = {}
+        self._version = None
+
+    def _fresh(self) -> None:
+        version = get_db().org_version(self.org_id)
+        if version != self._version:
+            self._memo.clear()
+            self.player_ids.clear()
+            self.player_names.clear()
+            self._version = version
+
+    def _prime_player(self, name: str, player_id: str) -> None:
+        if name and player_id:
+            self.player_ids.prime(name, player_id)
+            self.player_names.prime(player_id, name)
+
+    def session(self, session_id: str) -> Optional[Dict]:
+        """场次完整信息（get_session），并预填场次玩家的姓名 <-> id。"""
+        self._fresh()
+        key = ('session', session_id)
+        if key not in self._memo:
+            session_data = get_session(self.org_id, session_id)
+            self._memo[key] = session_data
+            for player in (session_data or {}).get('players_with_ids', []):
+                self._prime_player(player['name'], player['id'])
+        return self._memo[key]
+
+    def player(self, player_id: str) -> Optional[Dict]:
+        self._fresh()
+        key = ('player', player_id)
+        if key not in self._memo:
+            self._memo[key] = player = get_player_by_id(self.org_id, player_id)
+            if player:
+                self._prime_player(player['name'], player_id)
+        return self._memo[key]
+
+    def player_id(self, name: str) -> Optional[str]:
+        self._fresh()
+        return self.player_ids.load(name)
+
+    def player_name(self, player_id: str) -> Optional[str]:
+        self._fresh()
+        return self.player_names.load(player_id)
+
+
+def request_loader() -> RequestLoader:
+    """当前请求、当前组织的加载器。"""
+    org_id = g.organization['org_id']
+    loader = g.get('request_loader')
+    if loader is None or loader.org_id != org_id:
+        loader = g.request_loader = RequestLoader(org_id)
+    return loader
@@ -0,0 +1,267 @@
+"""
+本地工作副本 - 在本地磁盘运行数据库，定时用在线备份 API 同步到持久化共享目录
+
+Azure App Service 的 /home 是 SMB 共享盘，SQLite 的文件锁与 fsync 在上面非常慢，每次计分
+提交都要为此等待。设置 LOCAL_DB_DIR 后：
+1. 启动时把持久化数据库（DATABASE_PATH 或 /home/data/ems_pool_gamble.db）复制到
+   LOCAL_DB_DIR，应用读写这份本地副本
+2. 每 LOCAL_DB_SYNC_INTERVAL_SECONDS 秒检查本地库的文件修改计数，有新提交时先在本地
+   生成快照并做完整性检查，再用在线备份 API 写回持久化路径；写回在目标库的一个事务内
+   完成，中途崩溃时持久化库仍是上一次同步的内容
+3. 正常退出（atexit）时再同步一次
+
+同步间隔就是持久性窗口：实例崩溃或被回收时最多丢失这段时间内的提交。多个 worker 共用
+本地目录，启动准备与同步都在目录文件锁内进行；多个实例（横向扩展）不能使用本模式。
+
+本地副本旁的 <库名>.replica.json 记录上次同步时本地库的修改计数与持久化库的大小和
+修改时间，启动时据此决定：
+- 本地副本不存在或未同步过：从持久化库恢复
+- 持久化库被外部替换（例如用 app.backup 恢复）：从持久化库恢复，本地有未同步的提交时
+  先把本地副本改名保留
+- 本地有未同步的提交（上次没有正常退出）：先写回持久化库，再继续使用本地副本
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from .backup import check_integrity, online_copy
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发机：不做跨进程互斥
+    fcntl = None
+
+DEFAULT_INTERVAL = 30.0
+DEFAULT_PAGES = 256
+
+
+def change_counter(path: str) -> Optional[int]:
+    """SQLite 文件头中的修改计数（回滚日志模式下每次提交加一）；文件不存在时返回 None。"""
+    try:
+        with open(path, 'rb') as handle:
+            header = handle.read(28)
+    except FileNotFoundError:
+        return None
+    return int.from_bytes(header[24:28], 'big') if len(header) == 28 else None
+
+
+def _signature(path: str) -> Optional[list]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+_SIDECARS = ('-journal', '-wal', '-shm')
+
+
+def _remove_sidecars(path: str) -> None:
+    for suffix in _SIDECARS:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _set_aside(path: str, label: str) -> None:
+    """把库连同日志文件改名保留，打开保留的副本时 SQLite 仍能回滚热日志或重放 WAL。"""
+    target = f'{path}.{label}-{int(time.time())}'
+    os.replace(path, target)
+    for suffix in _SIDECARS:
+        if os.path.exists(path + suffix):
+            os.replace(path + suffix, target + suffix)
+
+
+@contextmanager
+def _file_lock(path: str):
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class LocalReplica:
+    """一个持久化数据库的本地工作副本及其同步状态：idle / running / stopped。"""
+
+    def __init__(self, durable_path: str, local_dir: str, interval: float = DEFAULT_INTERVAL,
+                 pages: int = DEFAULT_PAGES):
+        self.durable_path = durable_path
+        self.local_dir = local_dir
+        self.local_path = os.path.join(local_dir, os.path.basename(durable_path))
+        self.interval = interval
+        self.pages = pages
+        self.status = 'idle'
+        self.prepared = None
+        self.last = None
+        self.error = None
+        self.syncs = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def _state_path(self) -> str:
+        return self.local_path + '.replica.json'
+
+    def _read_state(self) -> Optional[Dict]:
+        try:
+            with open(self._state_path, 'r', encoding='utf-8') as handle:
+                return json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_state(self, counter: Optional[int]) -> None:
+        state = {'counter': counter, 'durable': _signature(self.durable_path),
+                 'synced_at': datetime.now(timezone.utc).isoformat()}
+        partial = self._state_path + '.partial'
+        with open(partial, 'w', encoding='utf-8') as handle:
+            json.dump(state, handle)
+        os.replace(partial, self._state_path)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, _file_lock(os.path.join(self.local_dir, '.replica.lock')):
+            yield
+
+    def _copy_to_durable(self, source: str) -> None:
+        """把本地快照写回持久化路径；写入在目标库的一个事务内完成。"""
+        online_copy(source, self.durable_path, self.pages, 0)
+
+    def _copy_from_durable(self, target: str) -> None:
+        online_copy(self.durable_path, target, self.pages, 0)
+
+    def _restore(self) -> None:
+        restoring = self.local_path + '.restoring'
+        try:
+            self._copy_from_durable(restoring)
+            check_integrity(restoring)
+            _remove_sidecars(self.local_path)
+            os.replace(restoring, self.local_path)
+        finally:
+            if os.path.exists(restoring):
+                os.remove(restoring)
+        self._write_state(change_counter(self.local_path))
+
+    def prepare(self) -> str:
+        """启动时准备本地副本，返回应用应当打开的路径。"""
+        os.makedirs(self.local_dir, exist_ok=True)
+        with self._locked():
+            state = self._read_state()
+            local_exists = os.path.exists(self.local_path)
+            durable_exists = os.path.exists(self.durable_path)
+            unsynced = local_exists and (state is None or change_counter(self.local_path) != state['counter'])
+            if not durable_exists:
+                self.prepared = 'local' if local_exists else 'new'
+            elif not local_exists or state is None:
+                if local_exists:
+                    _set_aside(self.local_path, 'orphan')
+                self._restore()
+                self.prepared = 'restored'
+            elif _signature(self.durable_path) != state['durable']:
+                if unsynced:
+                    _set_aside(self.local_path, 'conflict')
+                self._restore()
+                self.prepared = 'restored'
+            elif unsynced:
+                self._sync()
+                self.prepared = 'recovered'
+            else:
+                self.prepared = 'local'
+        return self.local_path
+
+    def _sync(self) -> Optional[Dict]:
+        counter = change_counter(self.local_path)
+        if counter is None:
+            return None
+        state = self._read_state()
+        if (state is not None and state['counter'] == counter
+                and _signature(self.durable_path) == state['durable']):
+            return None
+        started = time.perf_counter()
+        snapshot = self.local_path + '.sync'
+        try:
+            # 先在本地一步生成一致快照（分步复制会被并发提交不断打断重来），慢速写回期间不占用本地库的读锁
+            online_copy(self.local_path, snapshot, -1, 0)
+            check_integrity(snapshot)
+            self._copy_to_durable(snapshot)
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+        # 记录复制开始前的计数：复制期间的提交会在下一轮再同步一次
+        self._write_state(counter)
+        self.syncs += 1
+        return {'at': datetime.now(timezone.utc).isoformat(), 'seconds': round(time.perf_counter() - started, 3),
+                'bytes': os.path.getsize(self.durable_path)}
+
+    def sync(self, logger=None) -> Optional[Dict]:
+        """本地库有新提交时写回持久化路径，返回本次同步信息；无需同步或失败时返回 None。"""
+        try:
+            with self._locked():
+                result = self._sync()
+        except Exception as error:
+            self.error = str(error)
+            if logger:
+                logger.exception('本地数据库副本同步失败')
+            return None
+        if result is not None:
+            self.last, self.error = result, None
+        return result
+
+    def _loop(self, logger) -> None:
+        while not self._stop.wait(self.interval):
+            self.sync(logger)
+
+    def start(self, logger=None) -> None:
+        if self._thread is not None:
+            return
+        self.status = 'running'
+        self._thread = threading.Thread(target=self._loop, args=(logger,), name='db-replica-sync', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown, logger)
+
+    def shutdown(self, logger=None) -> Optional[Dict]:
+        """停止定时同步并做最后一次同步。"""
+        self._stop.set()
+        atexit.unregister(self.shutdown)
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        self.status = 'stopped'
+        return self.sync(logger)
+
+    def report(self) -> Dict:
+        return {'status': self.status, 'durable_path': self.durable_path, 'local_path': self.local_path,
+                'interval': self.interval, 'prepared': self.prepared, 'syncs': self.syncs,
+                'last': self.last, 'error': self.error}
+
+
+def prepare_local_replica(app, durable_path: str) -> Optional[LocalReplica]:
+    """设置了 LOCAL_DB_DIR 时准备本地工作副本并登记到 app.extensions['local_replica']。"""
+    local_dir = app.config.get('LOCAL_DB_DIR') or os.environ.get('LOCAL_DB_DIR')
+    if not local_dir:
+        return None
+    replica = LocalReplica(
+        durable_path, local_dir,
+        float(app.config.get('LOCAL_DB_SYNC_INTERVAL_SECONDS')
+              or os.environ.get('LOCAL_DB_SYNC_INTERVAL_SECONDS', DEFAULT_INTERVAL)),
+        int(app.config.get('LOCAL_DB_SYNC_PAGES') or os.environ.get('LOCAL_DB_SYNC_PAGES', DEFAULT_PAGES)),
+    )
+    replica.prepare()
+    app.extensions['local_replica'] = replica
+    return replica
+
+
+def start_local_replica(app) -> Optional[LocalReplica]:
+    """启动定时同步与退出时同步；未使用本地副本时不执行。"""
+    replica = app.extensions.get('local_replica')
+    if replica is not None:
+        replica.start(app.logger)
+    return replica
@@ -7,15 +7,17 @@
 import json
 import uuid
 from flask import Response, abort, g, render_template, request, redirect, url_for, flash, jsonify
-from .models import (save_data, get_player_by_name, get_player_name,
+from .models import (save_data, get_player_name,
                      create_session, get_active_sessions, get_ended_sessions,
                      get_all_sessions, delete_session, get_session,
-                     get_players_special_wins_batch, get_session_players,
+                     get_session_players, get_player_badge_classes,
                      get_achievement_players, get_achievement_records,
                      get_achievement_stats, get_achievement_master_players,
-                     get_earliest_session_date, get_available_months,
-                     get_retired_player_ids)
-from .utils import get_utc_timestamp, generate_session_name, compute_pairwise_edges
+                     get_earliest_session_date, get_available_months)
+from .utils import (get_utc_timestamp, generate_session_name, compute_pairwise_edges,
+                    resolve_date_range)
+from .loaders import request_loader
+from .page_cache import stale_while_revalidate
 from .security import require_admin_auth, require_csrf_protection
 from . import APP_VERSION, APP_NAME, VERSION_DATE
 
@@ -130,6 +132,7 @@ def register_main_routes(bp):
                              version_date=VERSION_DATE)
 
     @bp.route('/history')
+    @stale_while_revalidate(max_staleness=10)
     def history():
         # 展示所有场次和分数历史
         # 初始只加载前3个场次
@@ -164,103 +167,22 @@ def register_main_routes(bp):
         # 获取可用月份列表
         available_months = get_available_months(_org_id())
 
-        # 计算全时段总场次数
-        all_sessions_total = len(get_all_sessions(_org_id()))
+        # 计算全时段总场次数（每个场次只归属一个月，按月求和即为总数）
+        all_sessions_total = sum(m['count'] for m in available_months)
 
         # 默认选择第一个可用月份（最新月份）
         if not selected_month and available_months:
             selected_month = available_months[0]['key']
 
+        # 解析时间范围（月份或自定义区间），排行榜和场次列表共用同一区间
+        start_date, end_date = resolve_date_range(selected_month, custom_start_date, custom_end_date)
+
         # 计算全局玩家总分，支持月份筛选和自定义时间范围
         from .models import get_global_leaderboard
-        if selected_month == 'all':
-            # 全时段
-            sorted_total_scores = get_global_leaderboard(_org_id())
-        elif selected_month == 'custom' and custom_start_date and custom_end_date:
-            # 自定义时间范围
-            # 转换前端的 datetime-local 格式到数据库可用的格式
-            import datetime
-            try:
-                start_dt = datetime.datetime.fromisoformat(custom_start_date.replace('T', ' '))
-                end_dt = datetime.datetime.fromisoformat(custom_end_date.replace('T', ' '))
-                start_date_str = start_dt.strftime('%Y-%m-%d %H:%M:%S')
-                end_date_str = end_dt.strftime('%Y-%m-%d %H:%M:%S')
-                sorted_total_scores = get_global_leaderboard(_org_id(), start_date_str, end_date_str)
-            except ValueError:
-                # 时间格式错误，回退到全时段
-                sorted_total_scores = get_global_leaderboard(_org_id())
-        elif selected_month and '-' in selected_month:
-            # 按月份筛选（格式必须为 YYYY-MM）
-            try:
-                year, month = map(int, selected_month.split('-'))
-            except (ValueError, TypeError):
-                # 格式不合法，回退到全时段
-                sorted_total_scores = get_global_leaderboard(_org_id())
-                year = month = None
-
-            if year and month:
-                start_date = f"{selected_month}-01"
-                if month == 12:
-                    end_date = f"{year + 1}-01-01"
-                else:
-                    end_date = f"{year}-{month + 1:02d}-01"
-
-                # 使用 SQLite 的 date 函数来处理月末
-                import calendar
-                last_day = calendar.monthrange(year, month)[1]
-                end_date = f"{selected_month}-{last_day:02d}"
-
-                sorted_total_scores = get_global_leaderboard(_org_id(), start_date, end_date)
-        else:
-            # selected_month 为空或格式不对，回退到全时段
-            sorted_total_scores = get_global_leaderboard(_org_id())
+        sorted_total_scores = get_global_leaderboard(_org_id(), start_date, end_date)
 
-        # 收集所有玩家ID用于批量查询特殊胜利记录
-        all_player_ids = set()
-        for player in sorted_total_scores:
-            if player.get('player_id'):
-                all_player_ids.add(player['player_id'])
-
-        # 获取所有场次用于计算总数
-        all_sessions_list = get_all_sessions(_org_id())
-
-        # 按时间范围筛选场次
-        if selected_month and selected_month != 'all':
-            if selected_month == 'custom' and custom_start_date and custom_end_date:
-                # 自定义时间范围筛选
-                import datetime
-                try:
-                    start_dt = datetime.datetime.fromisoformat(custom_start_date.replace('T', ' '))
-                    end_dt = datetime.datetime.fromisoformat(custom_end_date.replace('T', ' '))
-
-                    filtered_sessions_by_time = []
-                    for session_data in all_sessions_list:
-                        session_date_str = session_data.get('created_at', '')
-                        if session_date_str:
-                            try:
-                                # 解析会话创建时间
-                                session_dt = datetime.datetime.fromisoformat(session_date_str.replace('Z', '+00:00'))
-                                # 转换为 UTC 时间进行比较
-                                session_dt_utc = session_dt.replace(tzinfo=None)
-                                if start_dt <= session_dt_utc <= end_dt:
-                                    filtered_sessions_by_time.append(session_data)
-                            except ValueError:
-                                continue
-                    all_sessions_list = filtered_sessions_by_time
-                except ValueError:
-                    # 时间格式错误，不进行筛选
-                    pass
-            else:
-                # 按月份筛选
-                filtered_sessions_by_month = []
-                for session_data in all_sessions_list:
-                    session_date = session_data.get('created_at', '')
-                    if session_date:
-                        # 提取日期的年月部分 (YYYY-MM)
-                        session_month = session_date[:7]  # 取前7个字符，如 "2024-07"
-                        if session_month == selected_month:
-                            filtered_sessions_by_month.append(session_data)
-                all_sessions_list = filtered_sessions_by_month
+        # 获取时间范围内的场次（由数据库按 created_epoch 区间筛选）
+        all_sessions_list = get_all_sessions(_org_id(), start_date, end_date)
 
         # 如果有搜索查询，进一步过滤场次
         if search_query:
@@ -296,31 +218,8 @@ def register_main_routes(bp):
             full_session = get_session(_org_id(), sid)
             if full_session:
                 sessions_with_player_ids[sid] = full_session
-                # 收集场次中的玩家ID
-                for player in full_session.get('players_with_ids', []):
-                    if player.get('id'):
-                        all_player_ids.add(player['id'])
-
-        # 批量获取所有玩家的特殊胜利记录
-        players_special_wins = get_players_special_wins_batch(_org_id(), list(all_player_ids)) if all_player_ids else {}
-
-        # 将特殊胜利记录添加到全局排行榜数据中
-        for player in sorted_total_scores:
-            player_id = player.get('player_id')
-            if player_id and player_id in players_special_wins:
-                player.update(players_special_wins[player_id])
-            else:
-                player.update({'has_small_gold': False, 'has_big_gold': False})
-
-        # 将特殊胜利记录添加到场次玩家数据中
-        for session in sessions_with_player_ids.values():
-            for player in session.get('players_with_ids', []):
-                player_id = player.get('id')
-                if player_id and player_id in players_special_wins:
-                    player.update(players_special_wins[player_id])
-                else:
-                    player.update({'has_small_gold': False, 'has_big_gold': False})
 
+        # 玩家徽章（小金/大金、退役）由模板通过 badge_class() 读取
         return render_template('history.html',
                               sessions=sessions_with_player_ids,
                               total_scores=sorted_total_scores,
@@ -336,8 +235,7 @@ def register_main_routes(bp):
                               display_start_date=display_start_date,
                               display_end_date=display_end_date,
                               default_start_date=default_start_date,
-                              default_end_date=default_end_date,
-                              retired_player_ids=get_retired_player_ids(_org_id()))
+                              default_end_date=default_end_date)
 
     @bp.route('/api/load_more_sessions')
     def load_more_sessions():
@@ -349,46 +247,9 @@ def register_main_routes(bp):
         offset = int(request.args.get('offset', 0))
         limit = 3  # 每次加载3个
 
-        # 获取所有场次
-        all_sessions_list = get_all_sessions(_org_id())
-
-        # 按时间范围筛选场次
-        if selected_month and selected_month != 'all':
-            if selected_month == 'custom' and custom_start_date and custom_end_date:
-                # 自定义时间范围筛选
-                import datetime
-                try:
-                    start_dt = datetime.datetime.fromisoformat(custom_start_date.replace('T', ' '))
-                    end_dt = datetime.datetime.fromisoformat(custom_end_date.replace('T', ' '))
-
-                    filtered_sessions_by_time = []
-                    for session_data in all_sessions_list:
-                        session_date_str = session_data.get('created_at', '')
-                        if session_date_str:
-                            try:
-                                # 解析会话创建时间
-                                session_dt = datetime.datetime.fromisoformat(session_date_str.replace('Z', '+00:00'))
-                                # 转换为 UTC 时间进行比较
-                                session_dt_utc = session_dt.replace(tzinfo=None)
-                                if start_dt <= session_dt_utc <= end_dt:
-                                    filtered_sessions_by_time.append(session_data)
-                            except ValueError:
-                                continue
-                    all_sessions_list = filtered_sessions_by_time
-                except ValueError:
-                    # 时间格式错误，不进行筛选
-                    pass
-            else:
-                # 按月份筛选
-                filtered_sessions_by_month = []
-                for session_data in all_sessions_list:
-                    session_date = session_data.get('created_at', '')
-                    if session_date:
-                        # 提取日期的年月部分 (YYYY-MM)
-                        session_month = session_date[:7]  # 取前7个字符，如 "2024-07"
-                        if session_month == selected_month:
-                            filtered_sessions_by_month.append(session_data)
-                all_sessions_list = filtered_sessions_by_month
+        # 获取时间范围内的场次（由数据库按 created_epoch 区间筛选）
+        start_date, end_date = resolve_date_range(selected_month, custom_start_date, custom_end_date)
+        all_sessions_list = get_all_sessions(_org_id(), start_date, end_date)
 
         # 如果有搜索查询，进一步过滤场次
         if search_query:
@@ -434,21 +295,10 @@ def register_main_routes(bp):
                     if player.get('id'):
                         all_player_ids.add(player['id'])
 
-        # 批量获取玩家的特殊胜利记录
-        players_special_wins = get_players_special_wins_batch(_org_id(), list(all_player_ids)) if all_player_ids else {}
-
-        # 将特殊胜利记录添加到场次玩家数据中
-        for session_info in sessions_data:
-            session = session_info['session_data']
-            for player in session.get('players_with_ids', []):
-                player_id = player.get('id')
-                if player_id and player_id in players_special_wins:
-                    player.update(players_special_wins[player_id])
-                else:
-                    player.update({'has_small_gold': False, 'has_big_gold': False})
-
+        # 本页玩家的链接徽章类（小金/大金、退役），前端按 id 查表
         return jsonify({
             'sessions': sessions_data,
+            'badge_classes': get_player_badge_classes(_org_id(), all_player_ids),
             'has_more': has_more,
             'total_sessions': total_sessions
         })
@@ -456,35 +306,21 @@ def register_main_routes(bp):
     @bp.route('/session_detail/<session_id>')
     def session_detail(session_id):
         # 显示场次详情页
-        if not get_session(_org_id(), session_id):
+        loader = request_loader()
+        session_data = loader.session(session_id)
+        if not session_data:
             abort(404)
 
-        session_data = get_session(_org_id(), session_id)
-
         # 构建包含player_id的玩家列表并按分数排序
         players_with_ids = []
-        player_ids = []
         for player_name in session_data.get('players', set()):
-            player_id = get_player_by_name(_org_id(), player_name)
+            player_id = loader.player_id(player_name)
             score = session_data.get('scores', {}).get(player_name, 0)
             players_with_ids.append({
                 'name': player_name,
                 'id': player_id,
                 'score': score
             })
-            if player_id:
-                player_ids.append(player_id)
-
-        # 获取玩家的特殊胜利记录
-        players_special_wins = get_players_special_wins_batch(_org_id(), player_ids) if player_ids else {}
-
-        # 将特殊胜利记录添加到玩家信息中
-        for player in players_with_ids:
-            player_id = player.get('id')
-            if player_id and player_id in players_special_wins:
-                player.update(players_special_wins[player_id])
-            else:
-                player.update({'has_small_gold': False, 'has_big_gold': False})
 
         # 按分数排序
         sorted_players = sorted(players_with_ids, key=lambda x: x['score'], reverse=True)
@@ -505,7 +341,6 @@ def register_main_routes(bp):
                              session_data=session_data,
                              sorted_players=sorted_players,
                              records=records_with_ids,
-                             retired_player_ids=get_retired_player_ids(_org_id()),
                              pairwise_nodes=pairwise_nodes,
                              pairwise_edges=pairwise_edges,
                              app_version=APP_VERSION)
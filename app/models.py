@@ -3,17 +3,20 @@
 提供数据一致性保证和线程安全访问
 """
 import os
-import json
 from typing import List, Dict, Optional
 
 from .database import db
+from .json_import import import_json_file
 from .tenancy import EMS_ORG_ID
 
 
 # ===== 兼容性接口 - 保持与原有代码的兼容性 =====
 
-def init_data():
-    """初始化 EMS 组织数据，并检查是否需要从旧 JSON 迁移。"""
+def init_data(diagnostics: bool = False):
+    """初始化 EMS 组织数据，并检查是否需要从旧 JSON 迁移。
+
+    diagnostics 为 True 时额外打印场次与玩家数量（需要全表读取，默认跳过以加快冷启动）。
+    """
     print("初始化数据库...")
 
     # 检查是否存在旧的JSON数据需要迁移
@@ -25,9 +28,10 @@ def init_data():
         players = db.get_all_players(EMS_ORG_ID)
         if not players:
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                    db.migrate_from_json(json_data, EMS_ORG_ID)
+                # 流式解析并批量写入，不把整个 JSON 文件读入内存
+                report = import_json_file(db, json_file, EMS_ORG_ID)
+                print(f"已导入 {report['players']} 个玩家, {report['sessions']} 个场次, {report['records']} 条记录, "
+                      f"耗时 {report['seconds']:.2f}s")
 
                 # 迁移完成后备份JSON文件
                 backup_file = json_file + '.backup'
@@ -36,7 +40,9 @@ def init_data():
             except Exception as e:
                 print(f"JSON数据迁移失败: {e}")
 
-    # 统计数据
+    if not diagnostics:
+        print("数据库初始化完成")
+        return
     players = db.get_all_players(EMS_ORG_ID)
     sessions = db.get_all_sessions(EMS_ORG_ID)
     print(f"数据库初始化完成: {len(sessions)} 个场次, {len(players)} 个玩家")
@@ -72,6 +78,16 @@ def get_player_by_name(org_id: str, name: str) -> Optional[str]:
     return db.get_player_by_name(org_id, name)
 
 
+def get_player_ids_by_names(org_id: str, names: List[str]) -> Dict[str, Optional[str]]:
+    """按名字批量查找玩家，返回 {名字: player_id 或 None}"""
+    return db.get_player_ids_by_names(org_id, names)
+
+
+def get_player_names(org_id: str, player_ids: List[str]) -> Dict[str, str]:
+    """按 id 批量获取玩家名字"""
+    return db.get_player_names(org_id, player_ids)
+
+
 def get_or_create_player(org_id: str, name: str) -> str:
     """获取或创建玩家，返回player_id"""
     return db.get_or_create_player(org_id, name)
@@ -119,9 +135,10 @@ def get_ended_sessions(org_id: str, limit: int = 3) -> List[Dict]:
     return db.get_ended_sessions(org_id, limit)
 
 
-def get_all_sessions(org_id: str) -> List[Dict]:
-    """获取所有场次"""
-    return db.get_all_sessions(org_id)
+def get_all_sessions(org_id: str, start_date: str = None,
+                     end_date: str = None) -> List[Dict]:
+    """获取所有场次，可选按创建时间范围过滤（闭区间）"""
+    return db.get_all_sessions(org_id, start_date, end_date)
 
 
 def end_session(org_id: str, session_id: str) -> bool:
@@ -182,6 +199,24 @@ def get_player_records(org_id: str, player_id: str, start_date: str = None,
     return db.get_player_records(org_id, player_id, start_date, end_date)
 
 
+def get_player_records_page(org_id: str, player_id: str, start_date: str = None,
+                            end_date: str = None, before=None, limit: int = 50):
+    """按 (created_at, record_id) 游标分页获取玩家对战记录，返回 (records, next_cursor)。"""
+    return db.get_player_records_page(org_id, player_id, start_date, end_date, before, limit)
+
+
+def get_player_record_summary(org_id: str, player_id: str, start_date: str = None,
+                              end_date: str = None) -> Dict:
+    """在数据库中汇总玩家统计（胜负、1分、大小金次数、对手统计）。"""
+    return db.get_player_record_summary(org_id, player_id, start_date, end_date)
+
+
+def get_player_score_trend(org_id: str, player_id: str, start_date: str = None,
+                           end_date: str = None) -> List[Dict]:
+    """获取玩家累计总分趋势数据（最早的在前）。"""
+    return db.get_player_score_trend(org_id, player_id, start_date, end_date)
+
+
 # ===== 统计查询 =====
 
 def get_player_stats(org_id: str, player_id: str) -> Dict:
@@ -213,19 +248,7 @@ def get_player_tournament_history(org_id: str, player_id: str) -> List[Dict]:
 
 def get_earliest_session_date(org_id: str) -> Optional[str]:
     """获取最早的会话日期（用于默认日期范围）"""
-    sessions = db.get_all_sessions(org_id)
-    if not sessions:
-        return None
-
-    # 会话已按创建时间降序排列，取最后一个
-    earliest_session = sessions[-1]
-    created_at = earliest_session.get('created_at', '')
-
-    if created_at:
-        # 提取日期部分 (YYYY-MM-DD)
-        return created_at[:10]
-
-    return None
+    return db.get_earliest_session_date(org_id)
 
 
 def get_player_by_id(org_id: str, player_id: str) -> Optional[Dict]:
@@ -245,6 +268,11 @@ def get_players_special_wins_batch(org_id: str, player_ids: List[str]) -> Dict:
     return db.get_players_special_wins_batch(org_id, player_ids)
 
 
+def get_player_badge_classes(org_id: str, player_ids) -> Dict[str, str]:
+    """批量获取玩家链接的徽章 CSS 类（退役、大金、小金），无徽章的玩家不出现在结果中"""
+    return db.get_player_badge_classes(org_id, player_ids)
+
+
 def get_achievement_players(org_id: str, achievement_type: str) -> List[Dict]:
     """获取达成指定成就的玩家列表"""
     return db.get_achievement_players(org_id, achievement_type)
@@ -267,33 +295,16 @@ def get_achievement_master_players(org_id: str,
     return db.get_achievement_master_players(org_id, achievement_type)
 
 
+def get_achievement_approaching_players(org_id: str,
+                                        achievement_type: str) -> List[Dict]:
+    """获取尚未达到达人/传奇门槛的玩家（距离门槛由近到远）"""
+    return db.get_achievement_approaching_players(org_id, achievement_type)
+
+
 def get_negative_achievement_players(org_id: str,
                                      achievement_type: str) -> List[Dict]:
-    """获取负面成就的玩家列表"""
-    players = db.get_negative_achievement_players(org_id, achievement_type)
-
-    if achievement_type == 'gold_loser':
-        records = db.get_negative_achievement_records(org_id, achievement_type)
-        # 为每个玩家计算被谁痛击最多
-        for player in players:
-            opponent_counts = {}
-            for record in records:
-                # 检查是否是这个玩家被痛击
-                if (record.get('loser_name') == player['name'] or
-                        record.get('loser2_name') == player['name']):
-                    winner = record['winner_name']
-                    opponent_counts[winner] = opponent_counts.get(winner, 0) + 1
-
-            # 找出痛击次数最多的对手
-            if opponent_counts:
-                most_defeated_by = max(opponent_counts.items(), key=lambda x: x[1])
-                player['most_defeated_by'] = most_defeated_by[0]
-                player['most_defeated_count'] = most_defeated_by[1]
-            else:
-                player['most_defeated_by'] = None
-                player['most_defeated_count'] = 0
-
-    return players
+    """获取负面成就的玩家列表（大吃一金附带被谁痛击最多）"""
+    return db.get_negative_achievement_players(org_id, achievement_type)
 
 
 def get_negative_achievement_records(org_id: str, achievement_type: str,
@@ -0,0 +1,300 @@
+"""
+在线迁移 - 分块回填、双写、原子切换的表重建，迁移期间不阻塞计分写入
+
+migrate_legacy_database 与 _SCHEMA_UPGRADES 中的重建在一个 BEGIN IMMEDIATE 事务里
+复制整张表，大库上会在整个复制期间挡住所有写入。重建类的结构变更（新台账、新列、
+代理键）改为声明一个 OnlineMigration，由后台线程分阶段执行：
+
+1. 准备：建影子表 <table>__online，在原表上安装双写触发器，记下当时的最大主键
+2. 回填：每个短事务按主键顺序复制 chunk_size 行，进度写入 online_migrations，
+   进程重启后从记录的主键继续；两块之间暂停，让计分写入插入进来
+3. 切换：一个事务内核对行数，删除原表并把影子表改名为原表，重建原表上的索引与
+   触发器（含缓存版本触发器），执行外键检查并记入 schema_migrations
+
+回填期间读写仍走原表，双写触发器让影子表同步看到新增、修改与删除。每一步都在
+BEGIN IMMEDIATE 内重新读取进度，多个 worker 同时运行时只会分担而不会重复工作。
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .utils import get_utc_timestamp
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_PAUSE = 0.05
+BUSY_TIMEOUT_MS = 5000
+
+
+class OnlineMigration:
+    """一次在线表重建。
+
+    create_sql 是影子表的 CREATE TABLE 语句，表名写作 {table}；columns 为影子表的列，
+    select 为对应的取值表达式（在原表上求值，默认与列同名）。key 是原表与影子表共有的
+    INTEGER PRIMARY KEY 列。dropped_indexes 中的原表索引切换后不再重建，indexes 为
+    切换后新建的索引。
+    """
+
+    def __init__(self, version: str, table: str, key: str, create_sql: str, columns: Sequence[str],
+                 select: Optional[Sequence[str]] = None, indexes: Sequence[str] = (), dropped_indexes: Sequence[str] = ()):
+        if select is not None and len(select) != len(columns):
+            raise ValueError('select 与 columns 的数量必须一致')
+        self.version = version
+        self.table = table
+        self.shadow = f'{table}__online'
+        self.create_sql = create_sql
+        self.columns = tuple(columns)
+        self.select = tuple(select or columns)
+        self.key = key
+        self.indexes = tuple(indexes)
+        self.dropped_indexes = frozenset(dropped_indexes)
+
+    @property
+    def triggers(self) -> Dict[str, str]:
+        column_list = ', '.join(self.columns)
+        copy_row = (f"INSERT OR REPLACE INTO {self.shadow} ({column_list}) "
+                    f"SELECT {', '.join(self.select)} FROM {self.table} WHERE {self.key} = NEW.{self.key};")
+        return {
+            'insert': copy_row,
+            # 主键变化时先删除旧键对应的影子行
+            'update': (f"DELETE FROM {self.shadow} WHERE {self.key} = OLD.{self.key} "
+                       f"AND OLD.{self.key} IS NOT NEW.{self.key}; {copy_row}"),
+            'delete': f"DELETE FROM {self.shadow} WHERE {self.key} = OLD.{self.key};",
+        }
+
+    def trigger_name(self, event: str) -> str:
+        return f'trg_{self.table}_{event}_online_copy'
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _ensure_progress_table(conn: sqlite3.Connection) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS online_migrations (
+        version TEXT PRIMARY KEY, table_name TEXT NOT NULL, status TEXT NOT NULL,
+        last_key INTEGER NOT NULL DEFAULT 0, high_key INTEGER NOT NULL DEFAULT 0,
+        copied INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0,
+        started_at TEXT NOT NULL, updated_at TEXT NOT NULL, finished_at TEXT
+    )''')
+
+
+def _progress(conn: sqlite3.Connection, migration: OnlineMigration) -> Optional[Dict]:
+    row = conn.execute('SELECT * FROM online_migrations WHERE version = ?', (migration.version,)).fetchone()
+    return dict(row) if row else None
+
+
+def _switched(conn: sqlite3.Connection, migration: OnlineMigration) -> bool:
+    return conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (migration.version,)).fetchone() is not None
+
+
+def prepare(conn: sqlite3.Connection, migration: OnlineMigration) -> Dict:
+    """建影子表并安装双写触发器；已准备或已切换时直接返回进度。"""
+    _ensure_progress_table(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        progress = _progress(conn, migration)
+        if progress is None:
+            conn.execute(migration.create_sql.format(table=migration.shadow))
+            for event, body in migration.triggers.items():
+                conn.execute(f'''CREATE TRIGGER {migration.trigger_name(event)}
+                                 AFTER {event.upper()} ON {migration.table}
+                                 BEGIN {body} END''')
+            # 此后插入的行由触发器写入影子表，回填只需覆盖到当前最大主键
+            high_key, total = conn.execute(f'SELECT COALESCE(MAX({migration.key}), 0), COUNT(*) '
+                                           f'FROM {migration.table}').fetchone()
+            now = get_utc_timestamp()
+            conn.execute('''INSERT INTO online_migrations
+                            (version, table_name, status, high_key, total, started_at, updated_at)
+                            VALUES (?, ?, 'backfilling', ?, ?, ?, ?)''',
+                         (migration.version, migration.table, high_key, total, now, now))
+            progress = _progress(conn, migration)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return progress
+
+
+def copy_chunk(conn: sqlite3.Connection, migration: OnlineMigration, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+    """在一个短事务内按主键顺序回填下一块，返回更新后的进度。"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        progress = _progress(conn, migration)
+        if progress['status'] == 'backfilling':
+            chunk = (f'SELECT {migration.key} FROM {migration.table} WHERE {migration.key} > ? '
+                     f'AND {migration.key} <= ? ORDER BY {migration.key} LIMIT ?')
+            params = (progress['last_key'], progress['high_key'], chunk_size)
+            last_key, rows = conn.execute(f'SELECT MAX({migration.key}), COUNT(*) FROM ({chunk})', params).fetchone()
+            if rows:
+                # 已由双写触发器写入的行更新，回填跳过它们
+                conn.execute(f'''INSERT INTO {migration.shadow} ({', '.join(migration.columns)})
+                                 SELECT {', '.join(migration.select)} FROM {migration.table}
+                                 WHERE {migration.key} IN ({chunk})
+                                 ON CONFLICT DO NOTHING''', params)
+            status = 'backfilled' if rows < chunk_size else 'backfilling'
+            conn.execute('''UPDATE online_migrations SET status = ?, last_key = COALESCE(?, last_key),
+                            copied = copied + ?, updated_at = ? WHERE version = ?''',
+                         (status, last_key, rows, get_utc_timestamp(), migration.version))
+            progress = _progress(conn, migration)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return progress
+
+
+def switch(conn: sqlite3.Connection, migration: OnlineMigration) -> Dict:
+    """核对行数后以影子表替换原表，恢复原表的索引与触发器。"""
+    # 删除并改名父表时外键在最后统一检查，与 _upgrade_integer_keys 相同
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        progress = _progress(conn, migration)
+        if progress['status'] == 'backfilled' and not _switched(conn, migration):
+            source, shadow = (conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+                              for name in (migration.table, migration.shadow))
+            if source != shadow:
+                raise RuntimeError(f'在线迁移 {migration.version} 行数不一致：{migration.table} {source} 行，'
+                                   f'{migration.shadow} {shadow} 行')
+            own_triggers = {migration.trigger_name(event) for event in migration.triggers}
+            kept = [row['sql'] for row in conn.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+                "AND sql IS NOT NULL ORDER BY type, name", (migration.table,))
+                if row['name'] not in own_triggers and row['name'] not in migration.dropped_indexes]
+            conn.execute(f'DROP TABLE {migration.table}')
+            conn.execute(f'ALTER TABLE {migration.shadow} RENAME TO {migration.table}')
+            for statement in list(kept) + list(migration.indexes):
+                conn.execute(statement)
+            violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+            if violations:
+                raise RuntimeError(f'在线迁移 {migration.version} 切换后的外键检查失败：{[tuple(v) for v in violations[:5]]}')
+            now = get_utc_timestamp()
+            conn.execute('INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)', (migration.version, now))
+            conn.execute("UPDATE online_migrations SET status = 'switched', updated_at = ?, finished_at = ? "
+                         "WHERE version = ?", (now, now, migration.version))
+            progress = _progress(conn, migration)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.execute('PRAGMA foreign_keys = ON')
+    return progress
+
+
+def run_online_migration(db_path: str, migration: OnlineMigration, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         pause: float = DEFAULT_PAUSE, on_progress: Callable[[Dict], None] = None,
+                         should_stop: Callable[[], bool] = None) -> Dict:
+    """执行（或继续）一次在线迁移直到切换完成；should_stop 返回真时在块之间停下。"""
+    conn = _connect(db_path)
+    try:
+        progress = prepare(conn, migration)
+        while progress['status'] == 'backfilling':
+            if should_stop and should_stop():
+                return progress
+            progress = copy_chunk(conn, migration, chunk_size)
+            if on_progress:
+                on_progress(progress)
+            if pause and progress['status'] == 'backfilling':
+                time.sleep(pause)
+        progress = switch(conn, migration)
+        if on_progress:
+            on_progress(progress)
+        return progress
+    finally:
+        conn.close()
+
+
+def migration_progress(db_path: str) -> List[Dict]:
+    conn = _connect(db_path)
+    try:
+        _ensure_progress_table(conn)
+        return [dict(row) for row in conn.execute('SELECT * FROM online_migrations ORDER BY started_at, version')]
+    finally:
+        conn.close()
+
+
+# 待执行的在线迁移，按声明顺序执行；只追加，已切换的条目保留以便新库也走同一路径
+ONLINE_MIGRATIONS: Sequence[OnlineMigration] = ()
+
+
+class OnlineMigrator:
+    """后台执行 ONLINE_MIGRATIONS 的状态：idle / running / done / stopped / failed / skipped。"""
+
+    def __init__(self, db_path: str, migrations: Sequence[OnlineMigration] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, pause: float = DEFAULT_PAUSE):
+        self.db_path = db_path
+        self.migrations = tuple(ONLINE_MIGRATIONS if migrations is None else migrations)
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.status = 'idle'
+        self.error = None
+        self.progress: Dict[str, Dict] = {}
+        self._stop = threading.Event()
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _record(self, progress: Dict) -> None:
+        self.progress[progress['version']] = {field: progress[field] for field in
+                                              ('table_name', 'status', 'copied', 'total', 'updated_at')}
+
+    def run(self, logger=None) -> None:
+        self.status = 'running'
+        try:
+            for migration in self.migrations:
+                progress = run_online_migration(self.db_path, migration, self.chunk_size, self.pause,
+                                                on_progress=self._record, should_stop=self._stop.is_set)
+                self._record(progress)
+                if progress['status'] != 'switched':
+                    self.status = 'stopped'
+                    return
+            self.status = 'done'
+        except Exception as error:
+            if logger:
+                logger.exception('在线迁移失败，下次启动时从已记录的进度继续')
+            self.status, self.error = 'failed', str(error)
+        finally:
+            self._done.set()
+
+    def report(self) -> Dict:
+        return {'status': self.status, 'error': self.error, 'migrations': dict(self.progress)}
+
+
+def register_online_migrations(app) -> OnlineMigrator:
+    migrator = OnlineMigrator(
+        app.extensions['database'].db_path,
+        app.config.get('ONLINE_MIGRATIONS'),
+        int(app.config.get('ONLINE_MIGRATION_CHUNK_SIZE')
+            or os.environ.get('ONLINE_MIGRATION_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+        float(app.config.get('ONLINE_MIGRATION_PAUSE_SECONDS')
+              or os.environ.get('ONLINE_MIGRATION_PAUSE_SECONDS', DEFAULT_PAUSE)),
+    )
+    app.extensions['online_migrations'] = migrator
+    return migrator
+
+
+def start_online_migrations(app, background: bool = True) -> OnlineMigrator:
+    """启动待执行的在线迁移；ONLINE_MIGRATIONS_ENABLED 关闭时（测试默认关闭）不执行。"""
+    migrator = app.extensions['online_migrations']
+    enabled = app.config.get('ONLINE_MIGRATIONS_ENABLED')
+    if enabled is None:
+        default = 'false' if app.testing else 'true'
+        enabled = os.environ.get('ONLINE_MIGRATIONS_ENABLED', default).lower() == 'true'
+    if not enabled or not migrator.migrations:
+        migrator.status = 'skipped'
+        migrator._done.set()
+    elif background:
+        threading.Thread(target=migrator.run, args=(app.logger,), name='online-migrations', daemon=True).start()
+    else:
+        migrator.run(app.logger)
+    return migrator
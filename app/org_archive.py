@@ -0,0 +1,381 @@
+"""
+组织数据导出/导入 - 把一个组织的全部数据打包为可迁移的归档
+
+导出覆盖组织的十张源数据表（玩家、退役记录、场次、场次玩家、对局记录与赛事各表），
+不含整数键、epoch 列与派生表，这些在导入时重新计算。两种格式：
+- gzip 压缩的 NDJSON：首行为头部（格式版本、组织信息、各表列名），之后每行一条
+  {"table": ..., "row": {...}}，末行为各表行数。按主键分块读取并边读边压缩，内存占用
+  恒定；每块是一次独立的短读取，不会在下载期间挡住写入。导出范围以开始时各表的
+  最大 rowid 为界，之后新增的行不在本次导出中
+- 独立的 SQLite 文件：ATTACH 目标文件后逐表 INSERT ... SELECT，在一个事务内完成，
+  得到一致的快照
+
+导入把归档载入一个新建组织：玩家、场次、赛事与比赛的 id 全部重新生成并按映射改写
+引用，各表按外键顺序用 executemany 批量写入，连同组织本身在一个事务内完成。
+
+命令行用法：
+
+    python -m app.org_archive export <slug> <输出文件> [--format ndjson|sqlite]
+    python -m app.org_archive import <归档文件> --name <新组织名称>
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import APP_VERSION
+from .achievement_rules import rebuild_achievement_counts, rebuild_pair_stats
+from .tenancy import (fill_record_keys, generate_organization_slug, normalize_name, rebuild_month_activity,
+                      validate_organization_name)
+from .utils import get_utc_timestamp
+
+ARCHIVE_FORMAT = 'ems-pool-organization'
+ARCHIVE_VERSION = 1
+CHUNK_ROWS = 500
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# 按外键顺序排列的源数据表，及其中需要在导入时改写的 id 列
+_ID_COLUMNS = {
+    'players': {'player_id': 'player'},
+    'player_retirement_log': {'player_id': 'player'},
+    'sessions': {'session_id': 'session'},
+    'session_players': {'session_id': 'session', 'player_id': 'player'},
+    'game_records': {'session_id': 'session', 'winner_id': 'player', 'winner_id2': 'player',
+                     'loser_id': 'player', 'loser_id2': 'player'},
+    'tournaments': {'tournament_id': 'tournament'},
+    'tournament_rounds': {'tournament_id': 'tournament'},
+    'tournament_participants': {'tournament_id': 'tournament', 'player_id': 'player'},
+    'tournament_matches': {'match_id': 'match', 'tournament_id': 'tournament', 'player1_id': 'player',
+                           'player2_id': 'player', 'winner_id': 'player'},
+    'tournament_match_games': {'match_id': 'match', 'winner_id': 'player'},
+}
+ARCHIVE_TABLES = tuple(_ID_COLUMNS)
+
+# 导入时由目标库生成或重新计算的列
+_DERIVED_COLUMNS = {'org_id', 'player_pk', 'session_pk', 'winner_pk', 'winner2_pk', 'loser_pk', 'loser2_pk',
+                    'created_epoch', 'finished_epoch'}
+_SURROGATE_IDS = {'session_players': 'id', 'game_records': 'record_id', 'player_retirement_log': 'id'}
+_EPOCH_COLUMNS = (('sessions', 'created_at', 'created_epoch'), ('game_records', 'created_at', 'created_epoch'),
+                  ('tournament_matches', 'finished_at', 'finished_epoch'))
+
+
+def _archive_columns(conn, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')
+            if row[1] not in _DERIVED_COLUMNS and row[1] != _SURROGATE_IDS.get(table)]
+
+
+def _header(conn, org_id: str) -> Dict:
+    organization = conn.execute('SELECT name, slug, created_at FROM organizations WHERE org_id = ?',
+                                (org_id,)).fetchone()
+    if organization is None:
+        raise ValueError('组织不存在')
+    return {'format': ARCHIVE_FORMAT, 'version': ARCHIVE_VERSION, 'app_version': APP_VERSION,
+            'exported_at': get_utc_timestamp(),
+            'organization': dict(zip(('name', 'slug', 'created_at'), organization)),
+            'tables': {table: _archive_columns(conn, table) for table in ARCHIVE_TABLES}}
+
+
+def _iter_table(conn, table: str, columns: List[str], where: str, params: Tuple,
+                high_rowid: Optional[int] = None) -> Iterator[Dict]:
+    """按 rowid 分块读取一张表；每块是一次独立查询，块与块之间不持有读锁。"""
+    column_list = ', '.join(columns)
+    last = 0
+    bound = '' if high_rowid is None else f' AND rowid <= {int(high_rowid)}'
+    while True:
+        rows = conn.execute(f'SELECT rowid, {column_list} FROM {table} WHERE {where} AND rowid > ?{bound} '
+                            f'ORDER BY rowid LIMIT {CHUNK_ROWS}', (*params, last)).fetchall()
+        for row in rows:
+            yield dict(zip(columns, row[1:]))
+        if len(rows) < CHUNK_ROWS:
+            return
+        last = rows[-1][0]
+
+
+def iter_organization_rows(manager, org_id: str) -> Iterator[Tuple[str, Dict]]:
+    """产出 ('header', 头部)、(表名, 行) ...、('end', 各表行数)。"""
+    conn = sqlite3.connect(manager.db_path)
+    try:
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute('BEGIN')
+        header = _header(conn, org_id)
+        # 以开始时各表的最大 rowid 为界，导出期间新增的行不进入本次导出
+        bounds = {table: conn.execute(f'SELECT MAX(rowid) FROM {table} WHERE org_id = ?', (org_id,)).fetchone()[0] or 0
+                  for table in ARCHIVE_TABLES}
+        conn.execute('COMMIT')
+        yield 'header', header
+        counts = {}
+        for table in ARCHIVE_TABLES:
+            counts[table] = 0
+            for row in _iter_table(conn, table, header['tables'][table], 'org_id = ?', (org_id,), bounds[table]):
+                counts[table] += 1
+                yield table, row
+        yield 'end', {'counts': counts}
+    finally:
+        conn.close()
+
+
+def export_organization(manager, org_id: str, level: int = 6) -> Iterator[bytes]:
+    """以 gzip 压缩的 NDJSON 流式导出组织，逐块产出压缩后的字节。"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    pending = []
+    for kind, payload in iter_organization_rows(manager, org_id):
+        if kind == 'header':
+            line = payload
+        elif kind == 'end':
+            line = {'end': True, **payload}
+        else:
+            line = {'table': kind, 'row': payload}
+        pending.append(json.dumps(line, ensure_ascii=False, separators=(',', ':')))
+        if len(pending) >= CHUNK_ROWS or kind == 'end':
+            data = compressor.compress(('\n'.join(pending) + '\n').encode('utf-8'))
+            pending.clear()
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+def export_organization_sqlite(manager, org_id: str, path: str) -> Dict:
+    """把组织导出为独立的 SQLite 文件（ATTACH + INSERT ... SELECT，单个事务内的一致快照）。"""
+    if os.path.exists(path):
+        raise ValueError(f'目标文件已存在: {path}')
+    conn = sqlite3.connect(manager.db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        conn.execute('BEGIN')
+        try:
+            header = _header(conn, org_id)
+            counts = {}
+            for table, columns in header['tables'].items():
+                column_list = ', '.join(columns)
+                conn.execute(f'CREATE TABLE archive.{table} AS SELECT {column_list} FROM main.{table} WHERE 0')
+                counts[table] = conn.execute(f'INSERT INTO archive.{table} ({column_list}) SELECT {column_list} '
+                                             f'FROM main.{table} WHERE org_id = ? ORDER BY rowid', (org_id,)).rowcount
+            conn.execute('CREATE TABLE archive.archive_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.executemany('INSERT INTO archive.archive_meta (key, value) VALUES (?, ?)',
+                             [('header', json.dumps(header, ensure_ascii=False)),
+                              ('counts', json.dumps(counts))])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('DETACH DATABASE archive')
+    except Exception:
+        conn.close()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    conn.close()
+    return counts
+
+
+def _read_ndjson(path: str) -> Iterator[Tuple[str, Dict]]:
+    with gzip.open(path, 'rt', encoding='utf-8') as stream:
+        for number, line in enumerate(stream):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if number == 0:
+                yield 'header', item
+            elif item.get('end'):
+                yield 'end', item
+            else:
+                yield item['table'], item['row']
+
+
+def _read_sqlite(path: str) -> Iterator[Tuple[str, Dict]]:
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        meta = dict(conn.execute('SELECT key, value FROM archive_meta'))
+        header = json.loads(meta['header'])
+        yield 'header', header
+        for table in ARCHIVE_TABLES:
+            yield from ((table, row) for row in _iter_table(conn, table, header['tables'][table], '1', ()))
+        yield 'end', {'end': True, 'counts': json.loads(meta['counts'])}
+    finally:
+        conn.close()
+
+
+def read_archive(path: str) -> Iterator[Tuple[str, Dict]]:
+    """按文件头识别 NDJSON (gzip) 或 SQLite 归档，产出与 iter_organization_rows 相同的序列。"""
+    with open(path, 'rb') as handle:
+        magic = handle.read(len(SQLITE_MAGIC))
+    return _read_sqlite(path) if magic == SQLITE_MAGIC else _read_ndjson(path)
+
+
+class _ArchiveLoader:
+    """把归档行改写 id 后按表攒批写入新组织。"""
+
+    def __init__(self, conn, org_id: str, batch_size: int = CHUNK_ROWS):
+        self._conn = conn
+        self.org_id = org_id
+        self.batch_size = batch_size
+        self.counts = {table: 0 for table in ARCHIVE_TABLES}
+        self._ids: Dict[str, Dict[str, str]] = {}
+        self._columns: Dict[str, List[str]] = {}
+        self._table = None
+        self._rows: List[Tuple] = []
+
+    def _remap(self, kind: str, value):
+        if value is None:
+            return None
+        return self._ids.setdefault(kind, {}).setdefault(value, str(uuid.uuid4()))
+
+    def add(self, table: str, row: Dict) -> None:
+        if table not in _ID_COLUMNS:
+            raise ValueError(f'归档中包含未知的表: {table}')
+        if table != self._table or len(self._rows) >= self.batch_size:
+            self.flush()
+            self._table = table
+        if table not in self._columns:
+            existing = set(_archive_columns(self._conn, table))
+            self._columns[table] = [column for column in row if column in existing]
+        id_columns = _ID_COLUMNS[table]
+        self._rows.append((self.org_id, *(self._remap(id_columns[column], row[column]) if column in id_columns
+                                          else row[column] for column in self._columns[table])))
+        self.counts[table] += 1
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        columns = self._columns[self._table]
+        self._conn.executemany(
+            f"INSERT INTO {self._table} (org_id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+            self._rows)
+        self._rows.clear()
+
+
+def _insert_organization(conn, manager, name: str, admin_password_hash: str) -> Dict:
+    display_name = validate_organization_name(name)
+    slug = generate_organization_slug(display_name, manager.organization_slug_exists)
+    now = get_utc_timestamp()
+    organization = {'org_id': str(uuid.uuid4()), 'slug': slug, 'name': display_name}
+    try:
+        conn.execute('''INSERT INTO organizations
+                        (org_id, slug, name, name_key, admin_password_hash, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (organization['org_id'], slug, display_name, normalize_name(display_name),
+                      admin_password_hash, now, now))
+    except sqlite3.IntegrityError as exc:
+        raise ValueError('组织名称已存在') from exc
+    return organization
+
+
+def import_organization(manager, entries: Iterable[Tuple[str, Dict]], admin_password_hash: str,
+                        name: str = None, batch_size: int = CHUNK_ROWS) -> Dict:
+    """把归档序列载入一个新组织（单个事务），返回新组织、各表行数与耗时。"""
+    if not isinstance(admin_password_hash, str) or not admin_password_hash:
+        raise ValueError('非 EMS 组织必须设置管理员密码哈希')
+    started = time.perf_counter()
+    entries = iter(entries)
+    kind, header = next(entries, (None, None))
+    if kind != 'header' or header.get('format') != ARCHIVE_FORMAT:
+        raise ValueError('不是组织归档文件')
+    if header.get('version', 0) > ARCHIVE_VERSION:
+        raise ValueError(f"归档格式版本 {header['version']} 高于当前支持的 {ARCHIVE_VERSION}")
+    with manager.get_connection() as conn:
+        try:
+            organization = _insert_organization(conn, manager, name or header['organization']['name'],
+                                                admin_password_hash)
+            loader = _ArchiveLoader(conn, organization['org_id'], batch_size)
+            footer = None
+            for kind, payload in entries:
+                if kind == 'end':
+                    footer = payload
+                    break
+                loader.add(kind, payload)
+            loader.flush()
+            expected = {table: count for table, count in (footer or {}).get('counts', {}).items() if count}
+            if footer is None or expected != {table: count for table, count in loader.counts.items() if count}:
+                raise ValueError('归档文件不完整或行数不符')
+            org_id = organization['org_id']
+            for table, source, column in _EPOCH_COLUMNS:
+                conn.execute(f"UPDATE {table} SET {column} = CAST(strftime('%s', {source}) AS INTEGER) "
+                             f"WHERE org_id = ?", (org_id,))
+            cursor = conn.cursor()
+            fill_record_keys(cursor, org_id)
+            rebuild_month_activity(cursor, org_id)
+            rebuild_achievement_counts(cursor, org_id)
+            rebuild_pair_stats(cursor, org_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return {'organization': manager.get_organization_by_id(organization['org_id']), 'counts': loader.counts,
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+def register_archive_routes(bp) -> None:
+    """组织管理员下载本组织的 NDJSON 归档：GET /o/<slug>/admin/export。"""
+    from flask import Response, g
+    from .database import get_db
+    from .security import require_admin_auth
+
+    @bp.route('/admin/export', methods=['GET'])
+    @require_admin_auth
+    def export_archive():
+        organization = g.organization
+        filename = f"{organization['slug']}-{get_utc_timestamp()[:10]}.ndjson.gz"
+        return Response(export_organization(get_db(), organization['org_id']), mimetype='application/gzip',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                                 'Cache-Control': 'no-store'})
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='导出或导入单个组织的数据归档')
+    parser.add_argument('--database', help='SQLite 数据库路径（默认同应用：DATABASE_PATH 或内置位置）')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='导出组织')
+    export_parser.add_argument('org', help='组织 slug')
+    export_parser.add_argument('output', help='输出文件')
+    export_parser.add_argument('--format', choices=('ndjson', 'sqlite'), default='ndjson')
+    import_parser = commands.add_parser('import', help='导入为新组织')
+    import_parser.add_argument('archive', help='归档文件（.ndjson.gz 或 SQLite）')
+    import_parser.add_argument('--name', help='新组织名称（默认沿用归档中的名称）')
+    args = parser.parse_args(argv)
+
+    from .database import DatabaseManager
+
+    manager = DatabaseManager(args.database)
+    if args.command == 'export':
+        organization = manager.get_organization_by_slug(args.org)
+        if organization is None:
+            print(f'组织不存在: {args.org}', file=sys.stderr)
+            return 1
+        started = time.perf_counter()
+        if args.format == 'sqlite':
+            export_organization_sqlite(manager, organization['org_id'], args.output)
+        else:
+            with open(args.output, 'wb') as output:
+                for data in export_organization(manager, organization['org_id']):
+                    output.write(data)
+        print(f'已导出 {organization["slug"]} 到 {args.output}，耗时 {time.perf_counter() - started:.2f}s')
+        return 0
+
+    from werkzeug.security import generate_password_hash
+
+    password = os.environ.get('ORG_ADMIN_PASSWORD')
+    if password is None:
+        import getpass
+        password = getpass.getpass('新组织管理员密码: ')
+    if not 12 <= len(password) <= 128:
+        print('管理员密码长度必须为 12 到 128 个字符', file=sys.stderr)
+        return 1
+    try:
+        result = import_organization(manager, read_archive(args.archive), generate_password_hash(password), args.name)
+    except ValueError as exc:
+        print(f'导入失败: {exc}', file=sys.stderr)
+        return 1
+    rows = sum(result['counts'].values())
+    print(f"已导入为组织 {result['organization']['slug']}：{rows} 行，耗时 {result['seconds']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+组织清除 - 分批删除一个组织的全部数据，不长时间占用 SQLite 写锁
+
+一条 DELETE 删除整个组织的对局记录会在整个删除期间持有写锁，其他组织的计分全部
+排队。清除任务改为：
+1. 在 org_purges 中登记组织：登记后该组织的 slug/名称不再解析，页面返回 404
+2. 按外键安全的顺序逐表删除：赛事对局 → 比赛 → 报名 → 轮次 → 赛事 → 对局记录 →
+   场次玩家 → 场次 → 退役记录 → 派生表 → 玩家；每批 batch_size 行一个短事务，
+   批与批之间暂停，让其他写入插入进来
+3. 最后在一个事务内删除组织行与缓存版本行，登记状态改为 done
+
+每批提交时把已删除行数与当前表写入 org_purges，中断后再次运行从剩余的行继续。
+进程启动时由 resume_pending_purges 在后台继续未完成的清除。命令行用法：
+
+    python -m app.org_purge <slug> [--batch-size 500] [--pause 0.02]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .tenancy import EMS_ORG_ID
+from .utils import get_utc_timestamp
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAUSE = 0.02
+
+# (表, 批量删除时定位行的键)；WITHOUT ROWID 表用主键各列组成的行值
+PURGE_ORDER = (
+    ('tournament_match_games', 'rowid'),
+    ('tournament_matches', 'rowid'),
+    ('tournament_participants', 'rowid'),
+    ('tournament_rounds', 'rowid'),
+    ('tournaments', 'rowid'),
+    ('game_records', 'rowid'),
+    ('session_players', 'rowid'),
+    ('sessions', 'rowid'),
+    ('player_retirement_log', 'rowid'),
+    ('player_month_activity', 'org_id, player_id, month'),
+    ('org_month_activity', 'org_id, month'),
+    ('player_achievement_counts', 'org_id, kind, player_pk'),
+    ('player_pair_stats', 'org_id, player_a_pk, player_b_pk'),
+    ('players', 'rowid'),
+)
+
+
+def request_purge(manager, org_id: str) -> Dict:
+    """登记组织清除并立即隐藏该组织；已登记时返回现有进度。"""
+    if org_id == EMS_ORG_ID:
+        raise ValueError('EMS 组织不能清除')
+    with manager.get_connection() as conn:
+        organization = conn.execute('SELECT slug FROM organizations WHERE org_id = ?', (org_id,)).fetchone()
+        existing = conn.execute('SELECT * FROM org_purges WHERE org_id = ?', (org_id,)).fetchone()
+        if existing is not None:
+            return dict(existing)
+        if organization is None:
+            raise ValueError('组织不存在')
+        now = get_utc_timestamp()
+        conn.execute('''INSERT INTO org_purges (org_id, slug, status, requested_at, updated_at)
+                        VALUES (?, ?, 'pending', ?, ?)''', (org_id, organization['slug'], now, now))
+        conn.commit()
+    return get_purge(manager, org_id)
+
+
+def get_purge(manager, org_id: str) -> Optional[Dict]:
+    with manager.get_connection() as conn:
+        row = conn.execute('SELECT * FROM org_purges WHERE org_id = ?', (org_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def pending_purges(manager) -> List[Dict]:
+    with manager.get_connection() as conn:
+        return [dict(row) for row in conn.execute(
+            "SELECT * FROM org_purges WHERE status != 'done' ORDER BY requested_at")]
+
+
+class OrgPurge:
+    """一个组织的分批清除；manager 提供 db_path、get_connection() 与进程内缓存。"""
+
+    def __init__(self, manager, org_id: str, batch_size: int = DEFAULT_BATCH_SIZE, pause: float = DEFAULT_PAUSE):
+        self._manager = manager
+        self.org_id = org_id
+        self.batch_size = batch_size
+        self.pause = pause
+        self.batches = 0
+
+    def _delete_batch(self, conn, table: str, key: str) -> int:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = conn.execute(f'DELETE FROM {table} WHERE ({key}) IN '
+                                   f'(SELECT {key} FROM {table} WHERE org_id = ? LIMIT ?)',
+                                   (self.org_id, self.batch_size)).rowcount
+            conn.execute('''UPDATE org_purges SET status = 'running', deleted = deleted + ?, current_table = ?,
+                            updated_at = ? WHERE org_id = ?''', (deleted, table, get_utc_timestamp(), self.org_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.batches += 1
+        return deleted
+
+    def _finish(self, conn) -> None:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM organizations WHERE org_id = ?', (self.org_id,))
+            # 删除各表时触发器仍在推进版本，组织行删除后再清理版本行
+            conn.execute('DELETE FROM org_cache_versions WHERE org_id = ?', (self.org_id,))
+            now = get_utc_timestamp()
+            conn.execute('''UPDATE org_purges SET status = 'done', current_table = NULL, updated_at = ?,
+                            finished_at = ? WHERE org_id = ?''', (now, now, self.org_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def run(self, on_progress: Callable[[Dict], None] = None, should_stop: Callable[[], bool] = None) -> Dict:
+        """删除直到完成或 should_stop 返回真，返回 org_purges 中的进度。"""
+        progress = get_purge(self._manager, self.org_id)
+        if progress is None:
+            raise ValueError('组织未登记清除，请先调用 request_purge')
+        if progress['status'] == 'done':
+            return progress
+        conn = sqlite3.connect(self._manager.db_path, isolation_level=None)
+        try:
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.execute('PRAGMA busy_timeout = 5000')
+            for table, key in PURGE_ORDER:
+                while True:
+                    if should_stop and should_stop():
+                        return get_purge(self._manager, self.org_id)
+                    deleted = self._delete_batch(conn, table, key)
+                    if on_progress:
+                        on_progress(get_purge(self._manager, self.org_id))
+                    if deleted < self.batch_size:
+                        break
+                    if self.pause:
+                        time.sleep(self.pause)
+            self._finish(conn)
+        finally:
+            conn.close()
+        self._manager.player_directory.invalidate(self.org_id)
+        self._manager.badges.invalidate(self.org_id)
+        progress = get_purge(self._manager, self.org_id)
+        if on_progress:
+            on_progress(progress)
+        return progress
+
+
+def resume_pending_purges(app, background: bool = True) -> Optional[threading.Thread]:
+    """继续上次中断的清除；ORG_PURGE_RESUME 关闭时（测试默认关闭）不执行。"""
+    enabled = app.config.get('ORG_PURGE_RESUME')
+    if enabled is None:
+        default = 'false' if app.testing else 'true'
+        enabled = os.environ.get('ORG_PURGE_RESUME', default).lower() == 'true'
+    manager = app.extensions['database']
+    if not enabled or not pending_purges(manager):
+        return None
+
+    def run():
+        for purge in pending_purges(manager):
+            try:
+                OrgPurge(manager, purge['org_id']).run()
+                app.logger.info('组织 %s 已清除', purge['slug'])
+            except Exception:
+                app.logger.exception('组织 %s 清除失败，下次启动时继续', purge['slug'])
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='org-purge', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='分批清除一个组织的全部数据（可中断，重新运行即继续）')
+    parser.add_argument('org', help='组织 slug')
+    parser.add_argument('--database', help='SQLite 数据库路径（默认同应用：DATABASE_PATH 或内置位置）')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE, help='批与批之间暂停的秒数')
+    args = parser.parse_args(argv)
+
+    from .database import DatabaseManager
+
+    manager = DatabaseManager(args.database)
+    slug = args.org.strip().lower()
+    with manager.get_connection() as conn:
+        row = conn.execute('SELECT org_id FROM organizations WHERE slug = ?', (slug,)).fetchone()
+        if row is None:
+            row = conn.execute("SELECT org_id FROM org_purges WHERE slug = ? AND status != 'done'", (slug,)).fetchone()
+    if row is None:
+        print(f'组织不存在: {args.org}', file=sys.stderr)
+        return 1
+    try:
+        request_purge(manager, row['org_id'])
+    except ValueError as exc:
+        print(f'无法清除: {exc}', file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    tables = []
+
+    def progress(purge):
+        if purge['current_table'] and purge['current_table'] not in tables:
+            tables.append(purge['current_table'])
+            print(f"  {purge['current_table']}: 累计已删除 {purge['deleted']} 行", file=sys.stderr)
+
+    purge = OrgPurge(manager, row['org_id'], args.batch_size, args.pause).run(progress)
+    print(f"组织 {purge['slug']} 已清除: {purge['deleted']} 行，耗时 {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
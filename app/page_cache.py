@@ -0,0 +1,177 @@
+"""
+页面缓存 - 重型分析页的 stale-while-revalidate 策略
+
+路由以 @stale_while_revalidate(max_staleness=...) 声明可容忍的陈旧秒数。缓存的是
+整页渲染结果，键为 (端点, 组织, 查询参数)，并记录渲染前读到的组织缓存版本：
+
+- 版本未变：直接返回缓存页（X-Cache-Status: HIT）
+- 版本已变但陈旧不超过 max_staleness：立即返回旧页（STALE），同时在后台线程
+  重新渲染；同一页面同时只有一个后台刷新
+- 无缓存或陈旧超限：同步渲染（MISS）
+
+陈旧时长从首次发现版本变化时开始计算。响应携带 Age（距渲染的秒数）与
+X-Cache-Stale-Seconds 头。页面按匿名访客渲染，管理员请求和带待显示闪现消息的
+请求直接绕过缓存，后台刷新也不携带 Cookie，避免把个人内容缓存给他人。
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Hashable
+
+from flask import current_app, g, make_response, request, session
+
+from .database import get_db
+from .security import is_current_org_admin
+
+DEFAULT_MAX_ENTRIES = 256
+# 版本未变时页面也会过期（如“今天”之类的默认日期），过期后按陈旧处理
+DEFAULT_MAX_AGE = 600
+
+
+class _Page:
+    __slots__ = ('body', 'mimetype', 'version', 'rendered_at', 'stale_since')
+
+    def __init__(self, body: bytes, mimetype: str, version: int):
+        self.body, self.mimetype, self.version = body, mimetype, version
+        self.rendered_at = time.time()
+        self.stale_since = None
+
+
+class PageCache:
+    """进程内整页缓存，按条目数上限做 LRU 淘汰。"""
+
+    def __init__(self, enabled: bool = False, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._pages: 'OrderedDict[Hashable, _Page]' = OrderedDict()
+        self._refreshing = set()
+        self._stats = {'hits': 0, 'stale': 0, 'misses': 0, 'bypassed': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self._lock = threading.Condition()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def put(self, key: Hashable, page: _Page) -> None:
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            self._stats[field] += 1
+
+    def start_refresh(self, key: Hashable) -> bool:
+        """登记后台刷新；该页已在刷新时返回 False。"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+            return True
+
+    def finish_refresh(self, key: Hashable) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+            self._lock.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """等待所有后台刷新结束（用于测试与优雅退出）。"""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._refreshing, timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'enabled': self.enabled, 'size': len(self._pages), 'refreshing': len(self._refreshing),
+                    **self._stats}
+
+
+def _cacheable() -> bool:
+    return (request.method == 'GET' and getattr(g, 'organization', None) is not None
+            and not is_current_org_admin() and not session.get('_flashes'))
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        super().__init__(response.status)
+        self.response = response
+
+
+def _render(view, args, kwargs, version: int) -> _Page:
+    response = make_response(view(*args, **kwargs))
+    if response.status_code != 200:
+        raise _Uncacheable(response)
+    return _Page(response.get_data(), response.mimetype, version)
+
+
+def _refresh_in_background(view, args, kwargs, key, org_id):
+    app = current_app._get_current_object()
+    cache = app.extensions['page_cache']
+    environ = {k: v for k, v in request.environ.items() if k != 'HTTP_COOKIE'}
+    organization = g.organization
+
+    def run():
+        try:
+            with app.request_context(environ):
+                g.organization = organization
+                cache.put(key, _render(view, args, kwargs, get_db().org_version(org_id)))
+        except Exception:
+            cache.count('refresh_errors')
+            app.logger.exception('页面后台刷新失败: %s', key[0])
+        finally:
+            cache.finish_refresh(key)
+
+    threading.Thread(target=run, name=f'page-refresh-{key[0]}', daemon=True).start()
+
+
+def _respond(page: _Page, status: str, now: float):
+    response = current_app.response_class(page.body, mimetype=page.mimetype)
+    response.headers['X-Cache-Status'] = status
+    response.headers['Age'] = str(int(now - page.rendered_at))
+    response.headers['X-Cache-Stale-Seconds'] = str(int(now - page.stale_since) if page.stale_since else 0)
+    return response
+
+
+def stale_while_revalidate(max_staleness: float):
+    """路由装饰器：允许在写入后最多 max_staleness 秒内返回旧页并在后台重新渲染。"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('page_cache')
+            if cache is None or not cache.enabled:
+                return view(*args, **kwargs)
+            if not _cacheable():
+                cache.count('bypassed')
+                return view(*args, **kwargs)
+            org_id = g.organization['org_id']
+            key = (request.endpoint, org_id, tuple(sorted(request.args.items(multi=True))))
+            version = get_db().org_version(org_id)
+            page, now = cache.get(key), time.time()
+            if page is not None and page.version == version and now - page.rendered_at <= cache.max_age:
+                cache.count('hits')
+                return _respond(page, 'HIT', now)
+            if page is not None:
+                if page.stale_since is None:
+                    page.stale_since = now
+                if now - page.stale_since <= max_staleness:
+                    cache.count('stale')
+                    if cache.start_refresh(key):
+                        _refresh_in_background(view, args, kwargs, key, org_id)
+                    return _respond(page, 'STALE', now)
+            cache.count('misses')
+            try:
+                page = _render(view, args, kwargs, version)
+            except _Uncacheable as uncacheable:
+                return uncacheable.response
+            cache.put(key, page)
+            return _respond(page, 'MISS', now)
+        return wrapper
+    return decorator
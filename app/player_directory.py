@@ -0,0 +1,75 @@
+"""
+组织玩家目录 - 进程内的 id <-> 姓名 <-> name_key 映射与退役标记
+
+玩家身份查找（按名查 id、按 id 查名、是否退役等）几乎每个页面都要做多次。
+目录按组织懒加载一次该组织全部玩家，之后这些查找都是字典查询。
+
+目录记住加载时的 players_version（players 表上的触发器在新建、改名、退役、
+复出等任何写入时推进），版本变化即整体重新加载，因此其他 worker 的写入同样
+可见；对局写入不影响 players_version，不会使目录失效。
+"""
+import threading
+from typing import Dict, Optional
+
+PLAYER_FIELDS = ('player_pk', 'player_id', 'name', 'name_key', 'created_at', 'updated_at', 'is_retired')
+
+
+class PlayerEntry:
+    __slots__ = PLAYER_FIELDS
+
+    def __init__(self, row):
+        for field in PLAYER_FIELDS:
+            setattr(self, field, row[field])
+
+    def as_dict(self, org_id: str) -> Dict:
+        player = {field: getattr(self, field) for field in PLAYER_FIELDS}
+        player['org_id'] = org_id
+        return player
+
+
+class OrgPlayers:
+    """一个组织的玩家目录快照。"""
+
+    __slots__ = ('players_version', 'by_id', 'by_key', 'retired_ids')
+
+    def __init__(self, players_version: int, rows):
+        self.players_version = players_version
+        self.by_id: Dict[str, PlayerEntry] = {}
+        self.by_key: Dict[str, PlayerEntry] = {}
+        for row in rows:
+            entry = PlayerEntry(row)
+            self.by_id[entry.player_id] = entry
+            self.by_key[entry.name_key] = entry
+        self.retired_ids = frozenset(pid for pid, entry in self.by_id.items() if entry.is_retired)
+
+
+class PlayerDirectory:
+    """按组织缓存 OrgPlayers；manager 提供 org_versions() 与 get_connection()。"""
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._orgs: Dict[str, OrgPlayers] = {}
+        self._lock = threading.Lock()
+
+    def get(self, org_id: str) -> OrgPlayers:
+        players_version = self._manager.org_versions(org_id)[1]
+        directory = self._orgs.get(org_id)
+        if directory is not None and directory.players_version == players_version:
+            return directory
+        with self._manager.get_connection() as conn:
+            rows = conn.execute(f"SELECT {', '.join(PLAYER_FIELDS)} FROM players WHERE org_id = ?",
+                                (org_id,)).fetchall()
+        directory = OrgPlayers(players_version, rows)
+        with self._lock:
+            self._orgs[org_id] = directory
+        return directory
+
+    def find(self, org_id: str, player_id: str) -> Optional[PlayerEntry]:
+        return self.get(org_id).by_id.get(player_id)
+
+    def invalidate(self, org_id: str = None) -> None:
+        with self._lock:
+            if org_id is None:
+                self._orgs.clear()
+            else:
+                self._orgs.pop(org_id, None)
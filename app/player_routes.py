@@ -2,62 +2,44 @@
 玩家相关路由模块 - 玩家详情、重命名等
 """
 import datetime
-import calendar
-from collections import defaultdict
-from flask import abort, g, render_template, request, redirect, url_for, flash
+from flask import abort, g, render_template, request, redirect, url_for, flash, jsonify
 from .models import (save_data,
                      get_player_by_name, get_player_name, get_or_create_player,
-                     update_player_name, get_player_by_id, get_player_records,
-                     get_player_stats, get_player_special_wins, get_players_special_wins_batch,
+                     update_player_name, get_player_by_id, get_player_records_page,
+                     get_player_record_summary, get_player_score_trend,
+                     get_player_stats,
                      get_available_months_for_player,
                      get_player_tournament_history,
-                     retire_player, comeback_player, is_player_retired, get_retired_player_ids)
+                     retire_player, comeback_player, is_player_retired)
+from .loaders import request_loader
+from .utils import resolve_date_range
 from .security import require_admin_auth, require_csrf_protection
 from . import APP_VERSION
 
-
-def _resolve_player_date_range(selected_month, custom_start_date, custom_end_date):
-    """根据筛选参数返回 (start_date, end_date) 字符串元组，用于 DB 查询。
-    返回 (None, None) 表示不限时段。"""
-    if not selected_month or selected_month == 'all':
-        return None, None
-
-    if selected_month == 'custom':
-        if not (custom_start_date and custom_end_date):
-            return None, None
-        try:
-            start_dt = datetime.datetime.fromisoformat(custom_start_date.replace('T', ' '))
-            end_dt = datetime.datetime.fromisoformat(custom_end_date.replace('T', ' '))
-            return (start_dt.strftime('%Y-%m-%d %H:%M:%S'),
-                    end_dt.strftime('%Y-%m-%d %H:%M:%S'))
-        except ValueError:
-            return None, None
-
-    # 月份格式 YYYY-MM
-    try:
-        year, month = map(int, selected_month.split('-'))
-    except ValueError:
-        return None, None
-    last_day = calendar.monthrange(year, month)[1]
-    return (f"{selected_month}-01 00:00:00",
-            f"{selected_month}-{last_day:02d} 23:59:59")
+RECORDS_PAGE_SIZE = 50
 
 
 def _org_id():
     return g.organization['org_id']
 
 
+def _cursor_payload(cursor):
+    """把 (created_at, record_id) 游标转换为前端回传的查询参数。"""
+    if not cursor:
+        return None
+    return {'before_time': cursor[0], 'before_id': cursor[1]}
+
+
 def register_player_routes(bp):
     """注册玩家相关路由"""
 
     @bp.route('/player/<player_id>')
     def player_detail(player_id):
         """玩家详情页面"""
-        if not get_player_by_id(_org_id(), player_id):
+        player = request_loader().player(player_id)
+        if not player:
             abort(404)
 
-        player = get_player_by_id(_org_id(), player_id)
-
         # 时间范围筛选参数（与 /history 协议一致）
         # 默认全时段（month=all），用户可切月份/自定义
         selected_month = request.args.get('month', '').strip() or 'all'
@@ -89,154 +71,46 @@ def register_player_routes(bp):
             display_end_date = custom_end_date.split('T')[0] if 'T' in custom_end_date else custom_end_date[:10]
 
         # 解析时间范围
-        start_date, end_date = _resolve_player_date_range(
+        start_date, end_date = resolve_date_range(
             selected_month, custom_start_date, custom_end_date)
 
-        # 获取（已按时间筛选的）玩家所有对战记录
-        player_records = get_player_records(_org_id(), player_id, start_date, end_date)
+        # 第一页对战记录（其余通过 /api/player/<id>/records 游标分页加载）
+        player_records, next_cursor = get_player_records_page(
+            _org_id(), player_id, start_date, end_date, limit=RECORDS_PAGE_SIZE)
 
-        # 顶部姓名高亮使用全时段身份徽章（小金/大金光环）
-        special_wins = get_player_special_wins(_org_id(), player_id)
-
-        # 在筛选区间内统计特殊胜利次数
+        # 筛选区间内的汇总统计由数据库聚合，不再遍历全部记录
+        summary = get_player_record_summary(_org_id(), player_id, start_date, end_date)
         special_wins_counts = {
-            'small_gold_count': 0,
-            'big_gold_count': 0
-        }
-        for record in player_records:
-            if record['is_winner'] and record.get('special_score'):
-                if record['special_score'] == '小金':
-                    special_wins_counts['small_gold_count'] += 1
-                elif record['special_score'] == '大金':
-                    special_wins_counts['big_gold_count'] += 1
-
-        # 将记录分为1分记录和非1分记录
-        one_point_records = [r for r in player_records if r['score'] == 1]
-        non_one_point_records = [r for r in player_records if r['score'] != 1]
-
-        # 在筛选区间内重新计算 stats（不再调用 get_player_stats，确保时间范围生效）
-        wins = sum(1 for r in player_records if r['is_winner'])
-        losses = sum(1 for r in player_records if not r['is_winner'])
-        total_score = 0
-        for r in player_records:
-            if r['is_winner']:
-                total_score += r['score']
-            else:
-                total_score -= r['score']
-        stats = {
-            'total_games': len(player_records),
-            'wins': wins,
-            'losses': losses,
-            'total_score': total_score,
+            'small_gold_count': summary['small_gold_count'],
+            'big_gold_count': summary['big_gold_count'],
         }
-
-        # 计算不包含1分记录的胜负统计
-        competitive_wins = len([r for r in non_one_point_records if r['is_winner']])
-        competitive_losses = len([r for r in non_one_point_records if not r['is_winner']])
-        competitive_games = len(non_one_point_records)
-
-        stats['competitive_wins'] = competitive_wins
-        stats['competitive_losses'] = competitive_losses
-        stats['competitive_games'] = competitive_games
-        stats['one_point_given'] = len([r for r in one_point_records if not r['is_winner']])
-        stats['one_point_received'] = len([r for r in one_point_records if r['is_winner']])
+        stats = {key: summary[key] for key in (
+            'total_games', 'wins', 'losses', 'total_score',
+            'competitive_wins', 'competitive_losses', 'competitive_games',
+            'one_point_given', 'one_point_received')}
         stats['one_point_profit'] = stats['one_point_received'] - stats['one_point_given']
-        stats['competitive_win_rate'] = (competitive_wins / competitive_games * 100) if competitive_games > 0 else 0
+        competitive_games = stats['competitive_games']
+        stats['competitive_win_rate'] = (stats['competitive_wins'] / competitive_games * 100) if competitive_games > 0 else 0
 
         # 对手统计（胜负统计排除1分记录，但总分差包含所有记录）
-        opponent_stats = defaultdict(lambda: {'wins': 0, 'losses': 0, 'total_score': 0})
-
-        # 计算胜负统计（排除1分记录）
-        for record in non_one_point_records:
-            opponent_id = record['opponent_id']
-            # 处理多个对手的情况
-            if isinstance(opponent_id, list):
-                # 如果是多个对手，为每个对手单独统计（但分数要分摊）
-                for single_opponent_id in opponent_id:
-                    if single_opponent_id:
-                        if record['is_winner']:
-                            opponent_stats[single_opponent_id]['wins'] += 1
-                        else:
-                            opponent_stats[single_opponent_id]['losses'] += 1
-            else:
-                # 单个对手的情况
-                if opponent_id:
-                    if record['is_winner']:
-                        opponent_stats[opponent_id]['wins'] += 1
-                    else:
-                        opponent_stats[opponent_id]['losses'] += 1
-
-        # 计算总分差（包含所有记录，包括1分记录）
-        for record in player_records:
-            opponent_id = record['opponent_id']
-            # 处理多个对手的情况
-            if isinstance(opponent_id, list):
-                # 如果是多个对手，分数要分摊（使用整数除法）
-                score_per_opponent = record['score'] // len(opponent_id)
-                for single_opponent_id in opponent_id:
-                    if single_opponent_id:
-                        if record['is_winner']:
-                            opponent_stats[single_opponent_id]['total_score'] += score_per_opponent
-                        else:
-                            opponent_stats[single_opponent_id]['total_score'] -= score_per_opponent
-            else:
-                # 单个对手的情况
-                if opponent_id:
-                    if record['is_winner']:
-                        opponent_stats[opponent_id]['total_score'] += record['score']
-                    else:
-                        opponent_stats[opponent_id]['total_score'] -= record['score']
-
-        # 转换对手统计为列表，包含名字
         opponent_list = []
-        opponent_ids = []  # 收集所有对手ID
-        for opponent_id, stat in opponent_stats.items():
-            opponent_ids.append(opponent_id)
+        for opponent in summary['opponents']:
+            total_games = opponent['wins'] + opponent['losses']
             opponent_list.append({
-                'id': opponent_id,
-                'name': get_player_name(_org_id(), opponent_id),
-                'wins': stat['wins'],
-                'losses': stat['losses'],
-                'total_games': stat['wins'] + stat['losses'],
-                'win_rate': (stat['wins'] / (stat['wins'] + stat['losses']) * 100) if (stat['wins'] + stat['losses']) > 0 else 0,
-                'total_score': stat['total_score']
+                'id': opponent['id'],
+                'name': opponent['name'],
+                'wins': opponent['wins'],
+                'losses': opponent['losses'],
+                'total_games': total_games,
+                'win_rate': (opponent['wins'] / total_games * 100) if total_games > 0 else 0,
+                'total_score': opponent['total_score']
             })
 
-        # 获取所有对手的特殊胜利记录
-        if opponent_ids:
-            opponents_special_wins = get_players_special_wins_batch(_org_id(), opponent_ids)
-            # 将特殊胜利记录添加到对手信息中
-            for opponent in opponent_list:
-                if opponent['id'] in opponents_special_wins:
-                    opponent.update(opponents_special_wins[opponent['id']])
-                else:
-                    opponent.update({'has_small_gold': False, 'has_big_gold': False})
-
         # 按总对局数排序
         opponent_list.sort(key=lambda x: x['total_games'], reverse=True)
 
-        # 准备分数趋势图表数据（基于筛选后的记录，从筛选区间内的 0 开始累计）
-        score_trend_data = []
-        cumulative_score = 0
-
-        # 按时间排序所有记录（最早的在前）
-        sorted_records = sorted(player_records, key=lambda x: x['timestamp'])
-
-        for i, record in enumerate(sorted_records):
-            if record['is_winner']:
-                cumulative_score += record['score']
-            else:
-                cumulative_score -= record['score']
-
-            score_trend_data.append({
-                'game_index': i + 1,  # 第几场比赛
-                'score': cumulative_score,
-                'timestamp': record['timestamp'],
-                'opponent_name': record['opponent_name'],
-                'session_name': record['session_name'],
-                'record_score': record['score'],
-                'is_winner': record['is_winner']
-            })
+        # 分数趋势图表数据（基于筛选区间，从 0 开始累计）
+        score_trend_data = get_player_score_trend(_org_id(), player_id, start_date, end_date)
 
         # 杯赛战绩（始终全时段，与时间筛选解耦——杯赛是离散活动）
         tournament_history = get_player_tournament_history(_org_id(), player_id)
@@ -246,10 +120,10 @@ def register_player_routes(bp):
             player=player,
             player_id=player_id,
             stats=stats,
-            records=player_records[:50],
+            records=player_records,
+            next_cursor=_cursor_payload(next_cursor),
             opponents=opponent_list,
             score_trend_data=score_trend_data,
-            special_wins=special_wins,
             special_wins_counts=special_wins_counts,
             available_months=available_months,
             selected_month=selected_month,
@@ -262,10 +136,41 @@ def register_player_routes(bp):
             all_sessions_total=all_sessions_total,
             tournament_history=tournament_history,
             is_retired=is_player_retired(_org_id(), player_id),
-            retired_player_ids=get_retired_player_ids(_org_id()),
             app_version=APP_VERSION
         )
 
+    @bp.route('/api/player/<player_id>/records')
+    def player_records_page(player_id):
+        """API接口：按游标加载玩家的更多对战记录"""
+        if not get_player_by_id(_org_id(), player_id):
+            abort(404)
+
+        start_date, end_date = resolve_date_range(
+            request.args.get('month', '').strip() or 'all',
+            request.args.get('start_date', '').strip(),
+            request.args.get('end_date', '').strip())
+
+        before = None
+        before_time = request.args.get('before_time', '').strip()
+        if before_time:
+            try:
+                before = (before_time, int(request.args.get('before_id', '')))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        try:
+            limit = min(max(int(request.args.get('limit', RECORDS_PAGE_SIZE)), 1), RECORDS_PAGE_SIZE)
+        except ValueError:
+            limit = RECORDS_PAGE_SIZE
+
+        records, next_cursor = get_player_records_page(
+            _org_id(), player_id, start_date, end_date, before=before, limit=limit)
+        return jsonify({
+            'records': records,
+            'next_cursor': _cursor_payload(next_cursor),
+            'has_more': next_cursor is not None
+        })
+
     @bp.route('/player/<player_id>/rename', methods=['POST'])
     @require_admin_auth
     @require_csrf_protection
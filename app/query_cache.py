@@ -0,0 +1,259 @@
+"""
+查询结果缓存 - DatabaseManager 读方法的读穿缓存
+
+缓存键为 (方法名, org_id, 参数, 组织版本)。组织版本保存在数据库的
+org_cache_versions 表中，由源表上的触发器在每次写入时推进，因此同一数据库文件
+上的所有进程（多个 gunicorn worker、多个 App Service 实例）看到的是同一个版本：
+任何一方写入后，旧键在所有进程中都不再命中，随后按 LRU 被淘汰。
+
+每个请求对每个组织最多读取一次版本（一次主键查询），请求内的写路径会丢弃
+已记住的版本，使同一请求中随后的读取看到自己的写入。
+
+- 进程内一级缓存：按条目数上限约束的 LRU，每个方法可声明自己的 TTL
+- 可选的共享二级缓存：一个独立的 SQLite 文件，同一主机上的进程共享计算结果
+- 并发的相同未命中合并为一次计算（single-flight），其余线程等待同一结果
+- 按方法统计命中/未命中/合并次数，命中时返回结果的副本，调用方修改返回值不会污染缓存
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+
+
+def _clone(value):
+    """复制 list/dict/set 结构（元素为标量），使缓存结果与调用方互不影响。"""
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+class _Flight:
+    """一次进行中的计算，等待者阻塞到计算者给出结果或异常。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SharedCacheTier:
+    """同一主机上多个进程共享的 SQLite 文件缓存。
+
+    文件只由本应用读写（值以 pickle 保存），不得指向不受信任的位置。
+    写入新版本的结果时顺带清理该组织的旧版本条目和过期条目。
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES * 8):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries (
+                                cache_key TEXT PRIMARY KEY,
+                                org_id TEXT NOT NULL,
+                                version INTEGER NOT NULL,
+                                expires_at REAL NOT NULL,
+                                value BLOB NOT NULL
+                            ) WITHOUT ROWID''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_org ON cache_entries (org_id, version)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=1)
+        conn.isolation_level = None
+        return conn
+
+    @staticmethod
+    def _digest(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key: Hashable) -> Tuple[bool, object, float]:
+        """返回 (是否命中, 值, 剩余秒数)。"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT expires_at, value FROM cache_entries WHERE cache_key = ?',
+                               (self._digest(key),)).fetchone()
+        finally:
+            conn.close()
+        remaining = row[0] - time.time() if row else 0
+        if remaining <= 0:
+            return False, None, 0
+        return True, pickle.loads(row[1]), remaining
+
+    def put(self, key: Hashable, org_id: str, version: int, value, ttl: float) -> None:
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM cache_entries WHERE org_id = ? AND version < ?', (org_id, version))
+            conn.execute('''INSERT OR REPLACE INTO cache_entries (cache_key, org_id, version, expires_at, value)
+                            VALUES (?, ?, ?, ?, ?)''',
+                         (self._digest(key), org_id, version, now + ttl, pickle.dumps(value)))
+            overflow = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute('''DELETE FROM cache_entries WHERE cache_key IN (
+                                    SELECT cache_key FROM cache_entries ORDER BY expires_at LIMIT ?)''',
+                             (overflow,))
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+
+class QueryCache:
+    """按组织版本失效的有界 LRU 缓存，可叠加共享二级缓存。"""
+
+    def __init__(self, enabled: bool = False, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 default_ttl: float = DEFAULT_TTL, shared: Optional[SharedCacheTier] = None):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.shared = shared
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = None, max_entries: int = None, default_ttl: float = None,
+                  shared_path: str = None) -> None:
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if default_ttl is not None:
+                self.default_ttl = default_ttl
+            if shared_path is not None:
+                self.shared = SharedCacheTier(shared_path) if shared_path else None
+            self._entries.clear()
+
+    def _counters(self, name: str) -> Dict[str, int]:
+        return self._stats.setdefault(name, {'hits': 0, 'shared_hits': 0, 'misses': 0, 'coalesced': 0})
+
+    def _store(self, key: Hashable, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def fetch(self, name: str, org_id: str, version: int, key_args: tuple, compute: Callable,
+              ttl: Optional[float] = None):
+        """依次查进程内缓存、共享缓存，都未命中则调用 compute() 并写回两级缓存。
+
+        同一键的并发未命中只有第一个线程计算，其余线程等待它的结果（single-flight），
+        计算失败时等待者收到同一个异常。version 须在 compute() 之前读取：计算期间
+        发生的写入会推进版本，以旧版本保存的结果不会再被任何进程查到。
+        """
+        if not self.enabled:
+            return compute()
+        key = (name, org_id, key_args, version)
+        with self._lock:
+            counters = self._counters(name)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                counters['hits'] += 1
+                return _clone(entry[1])
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                counters['coalesced'] += 1
+        if not leader:
+            return _clone(flight.wait())
+        try:
+            flight.value = self._load(key, org_id, version, compute,
+                                      self.default_ttl if ttl is None else ttl, counters)
+            return _clone(flight.value)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _load(self, key: Hashable, org_id: str, version: int, compute: Callable, ttl: float, counters):
+        if self.shared is not None:
+            try:
+                hit, value, remaining = self.shared.get(key)
+            except sqlite3.Error:
+                hit = False
+            if hit:
+                self._store(key, value, remaining)
+                with self._lock:
+                    counters['shared_hits'] += 1
+                return value
+        with self._lock:
+            counters['misses'] += 1
+        value = compute()
+        self._store(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, org_id, version, value, ttl)
+            except sqlite3.Error:
+                pass  # 共享缓存只是加速层，写入失败（如锁超时）不影响本次读取
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            methods = {name: dict(counters) for name, counters in self._stats.items()}
+            totals = {field: sum(c[field] for c in methods.values())
+                      for field in ('hits', 'shared_hits', 'misses', 'coalesced')}
+            return {'enabled': self.enabled, 'shared': self.shared is not None, 'size': len(self._entries),
+                    'max_entries': self.max_entries, 'evictions': self._evictions, 'inflight': len(self._inflight),
+                    'methods': methods, **totals}
+
+
+def cached_query(ttl: Optional[float] = None):
+    """DatabaseManager 读方法装饰器，方法的第一个参数须为 org_id。"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, org_id, *args, **kwargs):
+            key_args = (args, tuple(sorted(kwargs.items())))
+            return self.cached_call(method.__name__, org_id, key_args,
+                                    lambda: method(self, org_id, *args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+
+def invalidates_org(method):
+    """DatabaseManager 写方法装饰器：完成后丢弃本请求记住的 org_id 版本。"""
+    @functools.wraps(method)
+    def wrapper(self, org_id, *args, **kwargs):
+        try:
+            return method(self, org_id, *args, **kwargs)
+        finally:
+            self.forget_org_version(org_id)
+    return wrapper
@@ -4,9 +4,10 @@ import os
 import secrets
 from functools import wraps
 
-from flask import abort, flash, g, redirect, render_template, request, session, url_for
+from flask import abort, current_app, flash, g, jsonify, redirect, render_template, request, session, url_for
 from werkzeug.security import check_password_hash
 
+from .database import get_db
 from .tenancy import EMS_ORG_ID
 
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
@@ -132,6 +133,16 @@ def register_security_routes(bp):
         flash('已退出管理员模式', 'success')
         return redirect(_tenant_index_url())
 
+    @bp.route('/admin/cache-stats', methods=['GET'])
+    def cache_stats():
+        """Process-wide query cache counters, including single-flight coalescing, plus page and fragment caches."""
+        if not is_super_admin_authenticated():
+            abort(403)
+        page_cache = current_app.extensions.get('page_cache')
+        fragment_stats = getattr(current_app.jinja_env.fragment_cache, 'stats', None)
+        return jsonify({**get_db().query_cache.stats(), 'pages': page_cache.stats() if page_cache else None,
+                        'fragments': fragment_stats() if fragment_stats else None})
+
 
 def register_security_globals(app):
     @app.template_global()
@@ -0,0 +1,36 @@
+"""
+启动耗时报告 - 记录导入与 create_app 各阶段的耗时
+
+create_app 把每个阶段包在 report.phase(name) 中，结束后写入日志，并随 /ready 的
+响应一起返回，便于对比 App Service 冷启动与测试导入的开销。
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StartupReport:
+    def __init__(self, imports: Optional[float] = None):
+        self.imports = imports
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - started, 4)
+
+    @property
+    def boot(self) -> float:
+        return round(sum(self.phases.values()), 4)
+
+    def as_dict(self) -> Dict:
+        return {'imports': None if self.imports is None else round(self.imports, 4),
+                'boot': self.boot, 'phases': dict(self.phases)}
+
+    def summary(self) -> str:
+        phases = ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in self.phases.items())
+        imports = '' if self.imports is None else f'导入 {self.imports * 1000:.0f}ms, '
+        return f'{imports}启动 {self.boot * 1000:.0f}ms ({phases})'
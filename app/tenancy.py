@@ -1,17 +1,38 @@
 """Organization tenancy schema, validation, and legacy migration helpers."""
+import os
 import re
 import secrets
 import sqlite3
 import unicodedata
 import uuid
+from contextlib import contextmanager
 from typing import Callable
 
-from pypinyin import Style, lazy_pinyin
+try:
+    import fcntl
+except ImportError:  # Windows development machines: only the SQLite write lock applies
+    fcntl = None
 
+from .achievement_rules import PAIR_COUNTERS, rebuild_achievement_counts, rebuild_pair_stats
 from .utils import get_utc_timestamp
 
 
 TENANCY_MIGRATION_VERSION = "20260808_multi_organization_tenancy"
+MONTH_ACTIVITY_MIGRATION_VERSION = "20261019_month_activity_index"
+EPOCH_COLUMNS_MIGRATION_VERSION = "20261019_epoch_range_columns"
+INTEGER_KEYS_MIGRATION_VERSION = "20261019_integer_surrogate_keys"
+ACHIEVEMENT_LEDGER_MIGRATION_VERSION = "20261019_player_achievement_counts"
+SPECIAL_SCORE_INDEX_MIGRATION_VERSION = "20261019_special_score_index"
+PAIR_STATS_MIGRATION_VERSION = "20261019_player_pair_stats"
+CACHE_VERSIONS_MIGRATION_VERSION = "20261019_org_cache_versions"
+PLAYERS_VERSION_MIGRATION_VERSION = "20261019_org_players_version"
+BADGES_VERSION_MIGRATION_VERSION = "20261019_org_badges_version"
+ROUND_NAMES_MIGRATION_VERSION = "20261019_legacy_round_names"
+SPLIT_SPECIAL_RECORDS_MIGRATION_VERSION = "20261019_merge_split_special_records"
+ORG_PURGES_MIGRATION_VERSION = "20261019_org_purges"
+DROP_ORG_PK_MIGRATION_VERSION = "20261019_drop_unused_org_pk"
+# Workers waiting for another worker's migration block on the SQLite lock this long.
+MIGRATION_BUSY_TIMEOUT_MS = 10 * 60 * 1000
 EMS_ORG_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "https://emspool.app/organizations/ems"))
 EMS_ORG_SLUG = "ems"
 _RESERVED_SLUGS = {
@@ -38,6 +59,9 @@ def validate_organization_name(name: str) -> str:
 
 
 def _slug_base(name: str) -> str:
+    # pypinyin loads large dictionaries; import it only when an organization is created.
+    from pypinyin import Style, lazy_pinyin
+
     transliterated = "".join(
         lazy_pinyin(name, style=Style.NORMAL, errors="default")
     ).lower()
@@ -433,7 +457,7 @@ def migrate_legacy_database(db_path: str) -> None:
     """Migrate a normalized single-organization database to the tenant schema."""
     conn = sqlite3.connect(db_path)
     try:
-        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT_MS}")
         conn.execute("PRAGMA foreign_keys = OFF")
         cursor = conn.cursor()
         cursor.execute("""
@@ -492,12 +516,556 @@ def migrate_legacy_database(db_path: str) -> None:
         conn.close()
 
 
+def _create_month_activity_tables(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS org_month_activity (
+            org_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            game_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (org_id, month),
+            FOREIGN KEY (org_id) REFERENCES organizations (org_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS player_month_activity (
+            org_id TEXT NOT NULL,
+            player_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            game_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (org_id, player_id, month),
+            FOREIGN KEY (org_id, player_id)
+                REFERENCES players (org_id, player_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+
+def rebuild_month_activity(cursor: sqlite3.Cursor, org_id: str = None) -> None:
+    """Recompute the monthly activity index from sessions and game records.
+
+    Months are keyed by the session's ``created_at`` so a session (and all of
+    its games) belongs to exactly one month. Pass ``org_id`` to limit the
+    rebuild to one organization.
+    """
+    scope, params = ("WHERE s.org_id = ?", (org_id,)) if org_id else ("", ())
+    for table in ("org_month_activity", "player_month_activity"):
+        cursor.execute(
+            f"DELETE FROM {table}" + (" WHERE org_id = ?" if org_id else ""),
+            params,
+        )
+    cursor.execute(f"""
+        INSERT INTO org_month_activity (org_id, month, session_count, game_count)
+        SELECT s.org_id, substr(s.created_at, 1, 7) AS month,
+               COUNT(DISTINCT s.session_id), COUNT(gr.record_id)
+        FROM sessions s
+        LEFT JOIN game_records gr
+            ON gr.org_id = s.org_id AND gr.session_id = s.session_id
+        {scope}
+        GROUP BY s.org_id, month
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO player_month_activity
+            (org_id, player_id, month, session_count, game_count)
+        SELECT s.org_id, p.player_id, substr(s.created_at, 1, 7) AS month,
+               COUNT(DISTINCT s.session_id), COUNT(DISTINCT p.record_id)
+        FROM (
+            SELECT org_id, session_id, record_id, winner_id AS player_id FROM game_records
+            UNION ALL
+            SELECT org_id, session_id, record_id, winner_id2 FROM game_records
+            WHERE winner_id2 IS NOT NULL
+            UNION ALL
+            SELECT org_id, session_id, record_id, loser_id FROM game_records
+            UNION ALL
+            SELECT org_id, session_id, record_id, loser_id2 FROM game_records
+            WHERE loser_id2 IS NOT NULL
+        ) p
+        JOIN sessions s ON s.org_id = p.org_id AND s.session_id = p.session_id
+        {scope}
+        GROUP BY s.org_id, p.player_id, month
+    """, params)
+
+
+def _upgrade_month_activity(cursor: sqlite3.Cursor) -> None:
+    _create_month_activity_tables(cursor)
+    rebuild_month_activity(cursor)
+
+
+def _upgrade_epoch_columns(cursor: sqlite3.Cursor) -> None:
+    """Add integer UTC epoch columns so time-range filters can use composite indexes."""
+    for table, source, column in (
+        ("sessions", "created_at", "created_epoch"),
+        ("game_records", "created_at", "created_epoch"),
+        ("tournament_matches", "finished_at", "finished_epoch"),
+    ):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+        cursor.execute(
+            f"UPDATE {table} SET {column} = CAST(strftime('%s', {source}) AS INTEGER)"
+        )
+    # The text-keyed player indexes are superseded by the epoch-keyed ones.
+    for column in ("winner", "winner2", "loser", "loser2"):
+        cursor.execute(f"DROP INDEX IF EXISTS idx_game_records_org_{column}")
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_epoch ON game_records (org_id, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_winner_epoch ON game_records (org_id, winner_id, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_winner2_epoch ON game_records (org_id, winner_id2, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_loser_epoch ON game_records (org_id, loser_id, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_loser2_epoch ON game_records (org_id, loser_id2, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_org_epoch ON sessions (org_id, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_tournament_matches_org_finished ON tournament_matches (org_id, finished_epoch)",
+    ):
+        cursor.execute(statement)
+
+
+# Rebuilt definitions for the tables that gain an INTEGER PRIMARY KEY alias.
+# UUID columns stay unique and remain the external identifiers. Organizations keep
+# their text org_id key: see _upgrade_drop_org_pk.
+_KEYED_TABLES = (
+    ("players", "player_pk", """
+        CREATE TABLE players__keyed (
+            player_pk INTEGER PRIMARY KEY,
+            player_id TEXT NOT NULL UNIQUE,
+            org_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            is_retired INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (org_id, player_id),
+            UNIQUE (org_id, name_key),
+            FOREIGN KEY (org_id) REFERENCES organizations (org_id)
+        )
+    """, (
+        "CREATE INDEX idx_players_org_name ON players (org_id, name_key)",
+        "CREATE INDEX idx_players_org_retired ON players (org_id, is_retired, name)",
+    )),
+    ("sessions", "session_pk", """
+        CREATE TABLE sessions__keyed (
+            session_pk INTEGER PRIMARY KEY,
+            session_id TEXT NOT NULL UNIQUE,
+            org_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            end_time TEXT,
+            created_epoch INTEGER,
+            UNIQUE (org_id, session_id),
+            FOREIGN KEY (org_id) REFERENCES organizations (org_id)
+        )
+    """, (
+        "CREATE INDEX idx_sessions_org_active ON sessions (org_id, active, created_at DESC)",
+        "CREATE INDEX idx_sessions_org_ended ON sessions (org_id, active, end_time DESC, updated_at DESC)",
+        "CREATE INDEX idx_sessions_org_epoch ON sessions (org_id, created_epoch)",
+    )),
+)
+
+# (game_records column, parent table, parent key, parent UUID column, game_records UUID column)
+_RECORD_KEY_COLUMNS = (
+    ("session_pk", "sessions", "session_pk", "session_id", "session_id"),
+    ("winner_pk", "players", "player_pk", "player_id", "winner_id"),
+    ("winner2_pk", "players", "player_pk", "player_id", "winner_id2"),
+    ("loser_pk", "players", "player_pk", "player_id", "loser_id"),
+    ("loser2_pk", "players", "player_pk", "player_id", "loser_id2"),
+)
+
+
+def fill_record_keys(cursor: sqlite3.Cursor, org_id: str = None) -> None:
+    """Resolve the integer session/player keys of game records that lack them."""
+    assignments = ",\n".join(
+        f"{column} = (SELECT t.{key} FROM {table} t WHERE t.org_id = game_records.org_id "
+        f"AND t.{id_column} = game_records.{source})"
+        for column, table, key, id_column, source in _RECORD_KEY_COLUMNS
+    )
+    scope, params = (" AND org_id = ?", (org_id,)) if org_id else ("", ())
+    cursor.execute(
+        f"UPDATE game_records SET {assignments} WHERE session_pk IS NULL{scope}",
+        params,
+    )
+
+
+def _upgrade_integer_keys(cursor: sqlite3.Cursor) -> None:
+    """Give players and sessions INTEGER keys and key game records by them.
+
+    Tables are rebuilt with the usual create-copy-drop-rename sequence (foreign
+    keys are off on the upgrade connection); existing rowids become the new keys.
+    """
+    for table, key, ddl, indexes in _KEYED_TABLES:
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall()]
+        if key in columns:
+            continue
+        column_list = ", ".join(columns)
+        cursor.execute(ddl)
+        cursor.execute(
+            f"INSERT INTO {table}__keyed ({key}, {column_list}) "
+            f"SELECT rowid, {column_list} FROM {table}"
+        )
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}__keyed RENAME TO {table}")
+        for statement in indexes:
+            cursor.execute(statement)
+
+    cursor.execute("PRAGMA table_info(game_records)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, table, key, _, _ in _RECORD_KEY_COLUMNS:
+        if column not in existing:
+            cursor.execute(
+                f"ALTER TABLE game_records ADD COLUMN {column} INTEGER REFERENCES {table} ({key})"
+            )
+    fill_record_keys(cursor)
+    # UUID-keyed record indexes are replaced by integer-keyed ones; a player or
+    # session key already implies the organization.
+    for name in ("org_session", "org_winner_epoch", "org_winner2_epoch",
+                 "org_loser_epoch", "org_loser2_epoch"):
+        cursor.execute(f"DROP INDEX IF EXISTS idx_game_records_{name}")
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_game_records_session_pk ON game_records (session_pk, record_id)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_winner_pk ON game_records (winner_pk, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_winner2_pk ON game_records (winner2_pk, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_loser_pk ON game_records (loser_pk, created_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_game_records_loser2_pk ON game_records (loser2_pk, created_epoch)",
+    ):
+        cursor.execute(statement)
+
+
+def _create_achievement_counts_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS player_achievement_counts (
+            org_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            player_pk INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            first_at TEXT NOT NULL,
+            last_at TEXT NOT NULL,
+            PRIMARY KEY (org_id, kind, player_pk),
+            FOREIGN KEY (org_id) REFERENCES organizations (org_id) ON DELETE CASCADE,
+            FOREIGN KEY (player_pk) REFERENCES players (player_pk) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+
+
+def _upgrade_achievement_counts(cursor: sqlite3.Cursor) -> None:
+    _create_achievement_counts_table(cursor)
+    rebuild_achievement_counts(cursor)
+
+
+def _upgrade_special_score_index(cursor: sqlite3.Cursor) -> None:
+    """Cover the special-score slice of game_records for achievement aggregations.
+
+    The index is partial, so ordinary records add nothing to its size.
+    """
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_game_records_org_special "
+        "ON game_records (org_id, special_score, created_at, winner_pk, loser_pk, loser2_pk) "
+        "WHERE special_score IS NOT NULL"
+    )
+
+
+def _upgrade_pair_stats(cursor: sqlite3.Cursor) -> None:
+    """Create and backfill per-pair counters, keyed by the canonical (lower, higher) player key."""
+    counters = ",\n".join(f"            {name} INTEGER NOT NULL DEFAULT 0" for name in PAIR_COUNTERS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS player_pair_stats (
+            org_id TEXT NOT NULL,
+            player_a_pk INTEGER NOT NULL,
+            player_b_pk INTEGER NOT NULL,
+{counters},
+            PRIMARY KEY (org_id, player_a_pk, player_b_pk),
+            CHECK (player_a_pk < player_b_pk),
+            FOREIGN KEY (org_id) REFERENCES organizations (org_id) ON DELETE CASCADE,
+            FOREIGN KEY (player_a_pk) REFERENCES players (player_pk) ON DELETE CASCADE,
+            FOREIGN KEY (player_b_pk) REFERENCES players (player_pk) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    """)
+    rebuild_pair_stats(cursor)
+
+
+# Source tables whose writes invalidate an organization's cached reads. Derived tables
+# (month activity, ledgers) are only written in the same transactions as these.
+CACHE_VERSIONED_TABLES = (
+    'players', 'sessions', 'session_players', 'game_records', 'tournaments',
+    'tournament_rounds', 'tournament_participants', 'tournament_matches', 'tournament_match_games',
+)
+
+
+def _upgrade_cache_versions(cursor: sqlite3.Cursor) -> None:
+    """Keep one version row per organization, advanced by triggers on every source-table write.
+
+    Triggers also see writes from other processes and raw SQL, so every worker can check
+    freshness with a single primary-key read. The table has no foreign key: cascaded child
+    deletes fire the triggers after the organization row is already gone.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS org_cache_versions (
+            org_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    for table in CACHE_VERSIONED_TABLES:
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_cache_version
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO org_cache_versions (org_id, version) VALUES ({row}.org_id, 1)
+                    ON CONFLICT (org_id) DO UPDATE SET version = version + 1;
+                END
+            """)
+
+
+def _upgrade_players_version(cursor: sqlite3.Cursor) -> None:
+    """Track player-table writes separately so the in-memory player directory survives game writes."""
+    cursor.execute("ALTER TABLE org_cache_versions ADD COLUMN players_version INTEGER NOT NULL DEFAULT 0")
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        trigger = f"trg_players_{event.lower()}_cache_version"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"""
+            CREATE TRIGGER {trigger}
+            AFTER {event} ON players
+            BEGIN
+                INSERT INTO org_cache_versions (org_id, version, players_version) VALUES ({row}.org_id, 1, 1)
+                ON CONFLICT (org_id) DO UPDATE SET version = version + 1, players_version = players_version + 1;
+            END
+        """)
+
+
+def _upgrade_badges_version(cursor: sqlite3.Cursor) -> None:
+    """Track gold-ledger writes so the badge map survives games that award no gold."""
+    cursor.execute("ALTER TABLE org_cache_versions ADD COLUMN badges_version INTEGER NOT NULL DEFAULT 0")
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_player_achievement_counts_{event.lower()}_badges_version
+            AFTER {event} ON player_achievement_counts
+            WHEN {row}.kind IN ('small_gold', 'big_gold')
+            BEGIN
+                INSERT INTO org_cache_versions (org_id, version, badges_version) VALUES ({row}.org_id, 1, 1)
+                ON CONFLICT (org_id) DO UPDATE SET badges_version = badges_version + 1;
+            END
+        """)
+
+
+def _upgrade_round_names(cursor: sqlite3.Cursor) -> None:
+    """Rename pre-v1.9 round names ('1/8 决赛' -> '16进8', '1/4 决赛' -> '8进4')."""
+    for old, new in (('1/8 决赛', '16进8'), ('1/4 决赛', '8进4')):
+        cursor.execute("UPDATE tournament_rounds SET round_name = ? WHERE round_name = ?", (new, old))
+
+
+_SPLIT_PART_RE = re.compile(r"^1/2 \(总分(\d+)\)$")
+
+
+def _upgrade_split_special_records(cursor: sqlite3.Cursor) -> None:
+    """Merge legacy two-row special scores ('1/2 (总分N)' + '2/2 (总分N)') into one record.
+
+    The pair becomes a single multi-loser record worth N, as the pre-tenancy upgrade did;
+    derived tables of the affected organizations are rebuilt afterwards. Only single-winner,
+    single-loser rows take part, so records that were already merged (or entered with a second
+    loser) keep their marker and are never rewritten; malformed markers are left untouched too.
+    """
+    cursor.execute("""
+        SELECT record_id, org_id, session_id, winner_id, loser_id, loser_pk, special_score_part
+        FROM game_records
+        WHERE special_score_part LIKE '_/2 (总分%' AND loser_id2 IS NULL AND winner_id2 IS NULL
+        ORDER BY org_id, session_id, created_at, record_id
+    """)
+    rows = cursor.fetchall()
+    orgs, index = set(), 0
+    while index + 1 < len(rows):
+        first, second = rows[index], rows[index + 1]
+        index += 1
+        match = _SPLIT_PART_RE.match(first[6])
+        if not match or first[1:4] != second[1:4]:
+            continue
+        total = int(match.group(1))
+        if second[6] != f"2/2 (总分{total})":
+            continue
+        cursor.execute(
+            """UPDATE game_records SET loser_id2 = ?, loser2_pk = ?, score = ?, special_score = ?,
+                   special_score_part = NULL WHERE record_id = ?""",
+            (second[4], second[5], total, '大金' if total == 20 else '双吃', first[0]),
+        )
+        cursor.execute("DELETE FROM game_records WHERE record_id = ?", (second[0],))
+        orgs.add(first[1])
+        index += 1
+    for org_id in orgs:
+        rebuild_month_activity(cursor, org_id)
+        rebuild_achievement_counts(cursor, org_id)
+        rebuild_pair_stats(cursor, org_id)
+
+
+def _upgrade_org_purges(cursor: sqlite3.Cursor) -> None:
+    """Record organization purges; a listed organization is hidden while its rows are deleted.
+
+    Rows outlive the organization as an audit trail, so there is no foreign key.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS org_purges (
+            org_id TEXT PRIMARY KEY,
+            slug TEXT NOT NULL,
+            status TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            current_table TEXT,
+            requested_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    """)
+
+
+def _upgrade_drop_org_pk(cursor: sqlite3.Cursor) -> None:
+    """Drop the organizations.org_pk alias that earlier integer-key upgrades added but nothing read.
+
+    Every org-scoped index and lookup leads with the text org_id, and the org_id prefix is
+    shared by all rows of one organization, so an integer org key would only save bytes in
+    the index prefix while forcing every query through an extra org_id -> org_pk lookup.
+    The table is rebuilt to its tenant baseline definition; there are no triggers on it.
+    """
+    cursor.execute("PRAGMA table_info(organizations)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if "org_pk" not in columns:
+        return
+    kept = ", ".join(column for column in columns if column != "org_pk")
+    cursor.execute("""
+        CREATE TABLE organizations__plain (
+            org_id TEXT PRIMARY KEY,
+            slug TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL UNIQUE,
+            admin_password_hash TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute(f"INSERT INTO organizations__plain ({kept}) SELECT {kept} FROM organizations")
+    cursor.execute("DROP TABLE organizations")
+    cursor.execute("ALTER TABLE organizations__plain RENAME TO organizations")
+
+
+# Ordered schema migrations applied after the tenant baseline, once per database.
+# Migration #1 is the tenant baseline itself (TENANCY_MIGRATION_VERSION); the
+# entries below are #2, #3, ... in order. Append only, never reorder.
+_SCHEMA_UPGRADES = (
+    (MONTH_ACTIVITY_MIGRATION_VERSION, _upgrade_month_activity),
+    (EPOCH_COLUMNS_MIGRATION_VERSION, _upgrade_epoch_columns),
+    (INTEGER_KEYS_MIGRATION_VERSION, _upgrade_integer_keys),
+    (ACHIEVEMENT_LEDGER_MIGRATION_VERSION, _upgrade_achievement_counts),
+    (SPECIAL_SCORE_INDEX_MIGRATION_VERSION, _upgrade_special_score_index),
+    (PAIR_STATS_MIGRATION_VERSION, _upgrade_pair_stats),
+    (CACHE_VERSIONS_MIGRATION_VERSION, _upgrade_cache_versions),
+    (PLAYERS_VERSION_MIGRATION_VERSION, _upgrade_players_version),
+    (BADGES_VERSION_MIGRATION_VERSION, _upgrade_badges_version),
+    (ROUND_NAMES_MIGRATION_VERSION, _upgrade_round_names),
+    (SPLIT_SPECIAL_RECORDS_MIGRATION_VERSION, _upgrade_split_special_records),
+    (ORG_PURGES_MIGRATION_VERSION, _upgrade_org_purges),
+    (DROP_ORG_PK_MIGRATION_VERSION, _upgrade_drop_org_pk),
+)
+
+
+def _apply_schema_upgrades(db_path: str, announce: bool = True) -> None:
+    """Apply pending upgrades in one transaction; with announce, print one summary line if any ran."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT_MS}")
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TEXT NOT NULL
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        if all(version in applied for version, _ in _SCHEMA_UPGRADES):
+            return
+        # Table rebuilds drop and rename parents, so constraints are checked once at the end.
+        conn.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        ran = []
+        for number, (version, upgrade) in enumerate(_SCHEMA_UPGRADES, start=2):
+            if version in applied:
+                continue
+            upgrade(cursor)
+            ran.append(number)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)",
+                (version, get_utc_timestamp()),
+            )
+        cursor.execute("PRAGMA foreign_key_check")
+        violations = cursor.fetchall()
+        if violations:
+            raise RuntimeError(f"结构升级后的外键检查失败：{violations[:5]}")
+        conn.commit()
+        if announce and ran:
+            print(f"已应用 {len(ran)} 项数据库迁移 (#{ran[0]}-#{ran[-1]})")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _schema_is_current(db_path: str) -> bool:
+    """Whether every known migration is recorded, checked with a single read."""
+    versions = [TENANCY_MIGRATION_VERSION] + [version for version, _ in _SCHEMA_UPGRADES]
+    conn = sqlite3.connect(db_path)
+    try:
+        applied = conn.execute(
+            f"SELECT COUNT(*) FROM schema_migrations WHERE version IN ({','.join('?' * len(versions))})",
+            versions,
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+    return applied == len(versions)
+
+
+@contextmanager
+def _migration_lock(db_path: str):
+    """Let one worker on this host migrate while the others wait.
+
+    Workers on other hosts sharing the file are held off by the migration's
+    BEGIN IMMEDIATE transaction and MIGRATION_BUSY_TIMEOUT_MS.
+    """
+    if fcntl is None:
+        yield
+        return
+    directory = os.path.dirname(os.path.abspath(db_path))
+    with open(os.path.join(directory, os.path.basename(db_path) + ".migrate.lock"), "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
 def initialize_database(db_path: str) -> None:
-    """Create target tables for a new database, or upgrade a legacy one once."""
+    """Create or upgrade the tenant schema, then apply pending schema upgrades.
+
+    A current database boots with one read of schema_migrations. Otherwise the
+    migrations run under _migration_lock, and the check is repeated once the lock
+    is held, so workers that waited skip the work another worker already did.
+    """
+    if _schema_is_current(db_path):
+        return
+    with _migration_lock(db_path):
+        if _schema_is_current(db_path):
+            return
+        created = _initialize_tenant_schema(db_path)
+        # A new database runs every upgrade on empty tables; only upgrades of existing data are announced
+        _apply_schema_upgrades(db_path, announce=not created)
+
+
+def _initialize_tenant_schema(db_path: str) -> bool:
+    """Create target tables for a new database, or upgrade a legacy one once; True when created."""
     conn = sqlite3.connect(db_path)
     try:
         conn.execute("PRAGMA foreign_keys = ON")
-        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT_MS}")
         cursor = conn.cursor()
         cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'players'")
         has_players = cursor.fetchone() is not None
@@ -508,7 +1076,7 @@ def initialize_database(db_path: str) -> None:
                 conn.close()
                 conn = None
                 migrate_legacy_database(db_path)
-                return
+                return False
             cursor.execute("SELECT 1 FROM organizations WHERE org_id = ?", (EMS_ORG_ID,))
             if not cursor.fetchone():
                 now = get_utc_timestamp()
@@ -519,7 +1087,7 @@ def initialize_database(db_path: str) -> None:
                     (EMS_ORG_ID, EMS_ORG_SLUG, 'EMS Pool', normalize_name('EMS Pool'), now, now),
                 )
             conn.commit()
-            return
+            return False
 
         cursor.execute('BEGIN IMMEDIATE')
         _create_target_tables(cursor)
@@ -537,6 +1105,7 @@ def initialize_database(db_path: str) -> None:
         cursor.execute('INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)',
                        (TENANCY_MIGRATION_VERSION, now))
         conn.commit()
+        return True
     except Exception:
         if conn:
             conn.rollback()
@@ -13,6 +13,7 @@ Tournament 模块 - 杯赛系统（v1.10）
 公开函数（供 routes 调用）通过 models.py 风格的薄 wrapper 暴露。
 """
 
+import functools
 import uuid
 import math
 import random
@@ -21,7 +22,7 @@ import sqlite3
 from typing import List, Dict, Optional, Tuple
 
 from .database import db
-from .utils import get_utc_timestamp
+from .utils import get_utc_timestamp, timestamp_to_epoch
 
 
 # ===== 状态枚举 =====
@@ -37,8 +38,20 @@ def games_needed_to_win(best_of: int) -> int:
     return (best_of // 2) + 1
 
 
+def _invalidates_org(func):
+    """写函数装饰器：本模块直接写库，完成后丢弃本请求记住的组织缓存版本。"""
+    @functools.wraps(func)
+    def wrapper(org_id, *args, **kwargs):
+        try:
+            return func(org_id, *args, **kwargs)
+        finally:
+            db.forget_org_version(org_id)
+    return wrapper
+
+
 # ===== 创建 / 查询 tournaments =====
 
+@_invalidates_org
 def create_tournament(org_id: str, name: str, rounds_config: List[Dict]) -> str:
     """
     创建一个新赛事。
@@ -73,6 +86,10 @@ def create_tournament(org_id: str, name: str, rounds_config: List[Dict]) -> str:
 
 def list_tournaments(org_id: str) -> List[Dict]:
     """按创建时间倒序列出所有赛事，附带参赛人数。"""
+    return db.cached_call('list_tournaments', org_id, (), lambda: _list_tournaments(org_id))
+
+
+def _list_tournaments(org_id: str) -> List[Dict]:
     with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
@@ -119,6 +136,7 @@ def get_tournament(org_id: str, tournament_id: str) -> Optional[Dict]:
         return tournament
 
 
+@_invalidates_org
 def update_tournament_status(org_id: str, tournament_id: str, status: str) -> bool:
     if status not in VALID_STATUSES:
         return False
@@ -140,6 +158,7 @@ def update_tournament_status(org_id: str, tournament_id: str, status: str) -> bo
         return cursor.rowcount > 0
 
 
+@_invalidates_org
 def delete_tournament(org_id: str, tournament_id: str) -> bool:
     """硬删除整个赛事（含所有 rounds / participants / matches / match_games）。"""
     with db.get_connection() as conn:
@@ -158,6 +177,7 @@ def delete_tournament(org_id: str, tournament_id: str) -> bool:
 
 # ===== 参赛者管理（#3 用） =====
 
+@_invalidates_org
 def add_participant(org_id: str, tournament_id: str, player_id: str, seed: Optional[int] = None) -> bool:
     """添加参赛者；如果已存在或不属于当前组织则返回 False。"""
     with db.get_connection() as conn:
@@ -185,6 +205,7 @@ def add_participant(org_id: str, tournament_id: str, player_id: str, seed: Optio
         return cursor.rowcount > 0
 
 
+@_invalidates_org
 def remove_participant(org_id: str, tournament_id: str, player_id: str) -> bool:
     with db.get_connection() as conn:
         cursor = conn.cursor()
@@ -196,6 +217,7 @@ def remove_participant(org_id: str, tournament_id: str, player_id: str) -> bool:
         return cursor.rowcount > 0
 
 
+@_invalidates_org
 def set_participant_seed(org_id: str, tournament_id: str, player_id: str, seed: Optional[int]) -> bool:
     """设置或清除参赛者的种子号；seed 应为 1-4 或 None。"""
     if seed is not None and (not isinstance(seed, int) or seed < 1 or seed > 4):
@@ -442,6 +464,7 @@ def preview_bracket_layout(org_id: str, tournament_id: str,
     return {'bracket_size': bracket_size, 'slots': payload_slots}, ''
 
 
+@_invalidates_org
 def generate_bracket(org_id: str, tournament_id: str,
                      manual_slots: Optional[Dict[int, str]] = None
                      ) -> Tuple[bool, str]:
@@ -519,12 +542,13 @@ def generate_bracket(org_id: str, tournament_id: str,
                         (match_id, org_id, tournament_id, round_index, slot_index,
                          player1_id, player2_id, is_bye, winner_id,
                          player1_games_won, player2_games_won,
-                         started_at, finished_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?)
+                         started_at, finished_at, finished_epoch)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?)
                     ''', (match_id, org_id, tournament_id, round_index, slot_index,
                           p1, p2, is_bye, winner_id,
                           now if winner_id else None,
-                          now if winner_id else None))
+                          now if winner_id else None,
+                          timestamp_to_epoch(now) if winner_id else None))
                 else:
                     cursor.execute('''
                         INSERT INTO tournament_matches
@@ -718,6 +742,7 @@ def get_match(org_id: str, match_id: str) -> Optional[Dict]:
 
 # ===== 录入比分 / 撤销（#4） =====
 
+@_invalidates_org
 def record_match_game(org_id: str, match_id: str, winner_side: int) -> Tuple[bool, str]:
     """记录某场对阵的下一局结果。
 
@@ -768,10 +793,10 @@ def record_match_game(org_id: str, match_id: str, winner_side: int) -> Tuple[boo
             cursor.execute('''
                 UPDATE tournament_matches
                 SET player1_games_won = ?, player2_games_won = ?,
-                    winner_id = ?, finished_at = ?,
+                    winner_id = ?, finished_at = ?, finished_epoch = ?,
                     started_at = COALESCE(started_at, ?)
                 WHERE org_id = ? AND match_id = ?
-            ''', (new_p1, new_p2, match_winner_id, now, now, org_id, match_id))
+            ''', (new_p1, new_p2, match_winner_id, now, timestamp_to_epoch(now), now, org_id, match_id))
             # 晋级
             _propagate_winner_to_next_round(
                 cursor, org_id, match['tournament_id'],
@@ -799,6 +824,7 @@ def record_match_game(org_id: str, match_id: str, winner_side: int) -> Tuple[boo
     return True, '已记录'
 
 
+@_invalidates_org
 def record_match_result(org_id: str, match_id: str, p1_games: int, p2_games: int) -> Tuple[bool, str]:
     """直接录入整场比赛的总比分（覆盖式，用于一次性输入最终结果）。
 
@@ -834,10 +860,10 @@ def record_match_result(org_id: str, match_id: str, p1_games: int, p2_games: int
         cursor.execute('''
             UPDATE tournament_matches
             SET player1_games_won = ?, player2_games_won = ?,
-                winner_id = ?, finished_at = ?,
+                winner_id = ?, finished_at = ?, finished_epoch = ?,
                 started_at = COALESCE(started_at, ?)
             WHERE org_id = ? AND match_id = ?
-        ''', (p1_games, p2_games, winner_id, now, now, org_id, match_id))
+        ''', (p1_games, p2_games, winner_id, now, timestamp_to_epoch(now), now, org_id, match_id))
 
         _propagate_winner_to_next_round(
             cursor, org_id, match['tournament_id'],
@@ -859,6 +885,7 @@ def record_match_result(org_id: str, match_id: str, p1_games: int, p2_games: int
     return True, '已记录'
 
 
+@_invalidates_org
 def set_match_video_url(org_id: str, match_id: str, video_url: str) -> Tuple[bool, str]:
     """更新某场对阵的视频 iframe src；传空字符串则清除。
     只接受白名单域的 https URL，防止 XSS / 任意嵌套。"""
@@ -917,6 +944,7 @@ def _validate_iframe_src(url: str) -> Tuple[bool, str]:
     return True, url
 
 
+@_invalidates_org
 def reset_match(org_id: str, match_id: str) -> Tuple[bool, str]:
     """撤销一场 match 的录入：清空 winner_id / 比分 / 逐局记录，
     并把下一轮对应 slot 的 player1/player2 字段清掉（否则会显示错误的对手）。
@@ -959,7 +987,7 @@ def reset_match(org_id: str, match_id: str) -> Tuple[bool, str]:
         cursor.execute('''
             UPDATE tournament_matches
             SET winner_id = NULL, player1_games_won = 0, player2_games_won = 0,
-                finished_at = NULL
+                finished_at = NULL, finished_epoch = NULL
             WHERE org_id = ? AND match_id = ?
         ''', (org_id, match_id))
 
@@ -974,6 +1002,7 @@ def reset_match(org_id: str, match_id: str) -> Tuple[bool, str]:
     return True, '已撤销'
 
 
+@_invalidates_org
 def undo_last_game(org_id: str, match_id: str) -> Tuple[bool, str]:
     """撤回某场对阵的最后一局。
 
@@ -1035,7 +1064,7 @@ def undo_last_game(org_id: str, match_id: str) -> Tuple[bool, str]:
             cursor.execute('''
                 UPDATE tournament_matches
                 SET player1_games_won = ?, player2_games_won = ?,
-                    winner_id = NULL, finished_at = NULL
+                    winner_id = NULL, finished_at = NULL, finished_epoch = NULL
                 WHERE org_id = ? AND match_id = ?
             ''', (new_p1, new_p2, org_id, match_id))
 
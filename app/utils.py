@@ -1,6 +1,7 @@
 """
 时间处理和工具函数模块
 """
+import calendar
 import datetime
 from collections import defaultdict
 
@@ -58,6 +59,52 @@ def get_utc_timestamp():
     return datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
 
+def timestamp_to_epoch(timestamp):
+    """
+    把存储用的UTC时间字符串转换为整数epoch秒，用于范围筛选列
+    :param timestamp: 'YYYY-MM-DD HH:MM:SS' 或 ISO 8601 字符串（无时区视为UTC）
+    :return: epoch秒，无法解析时返回None
+    """
+    if not timestamp:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+def resolve_date_range(selected_month, custom_start_date=None, custom_end_date=None):
+    """
+    根据筛选参数（month=all/custom/YYYY-MM + 自定义起止时间）返回 (start_date, end_date)
+    :return: 'YYYY-MM-DD HH:MM:SS' 字符串元组，(None, None) 表示不限时段
+    """
+    if not selected_month or selected_month == 'all':
+        return None, None
+
+    if selected_month == 'custom':
+        if not (custom_start_date and custom_end_date):
+            return None, None
+        try:
+            start_dt = datetime.datetime.fromisoformat(custom_start_date.replace('T', ' '))
+            end_dt = datetime.datetime.fromisoformat(custom_end_date.replace('T', ' '))
+        except ValueError:
+            return None, None
+        return (start_dt.strftime('%Y-%m-%d %H:%M:%S'),
+                end_dt.strftime('%Y-%m-%d %H:%M:%S'))
+
+    # 月份格式 YYYY-MM
+    try:
+        year, month = map(int, selected_month.split('-'))
+        last_day = calendar.monthrange(year, month)[1]
+    except ValueError:
+        return None, None
+    return (f"{year:04d}-{month:02d}-01 00:00:00",
+            f"{year:04d}-{month:02d}-{last_day:02d} 23:59:59")
+
+
 def get_utc_iso_timestamp():
     """
     获取ISO格式的UTC时间戳，便于前端处理
@@ -0,0 +1,138 @@
+"""
+启动预热 - worker 启动后在后台线程中预热模板、组织缓存与 SQLite 页面
+
+App Service 重启或扩容后，新 worker 的第一批访客会同时承担 Jinja 编译、冷缓存和
+冷 SQLite 页面的开销。create_app 之后调用 start_warmup(app)，后台线程依次：
+- 编译最常访问的模板（同时写入磁盘字节码缓存）
+- 按最近活跃程度选出组织，加载玩家目录、徽章表与进行中场次
+
+整个过程受时间预算约束，超出预算即停止剩余步骤。GET /ready 在预热结束前返回 503，
+结束（完成、预算用尽或出错）后返回 200，并附带各步骤耗时，平台健康检查据此决定
+何时把流量导入该实例。预热只是加速，失败不会让实例一直处于未就绪状态。
+
+gunicorn 使用 --preload 时线程不会跨 fork 保留，应在每个 worker 中调用 start_warmup。
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+from flask import jsonify
+
+HOT_TEMPLATES = ('index.html', 'game.html', 'history.html', 'session_detail.html',
+                 'player_detail.html', 'achievements.html')
+DEFAULT_BUDGET = 20.0
+DEFAULT_ORG_LIMIT = 20
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class Warmup:
+    """一次预热的状态：pending / running / ready / timeout / failed / skipped。"""
+
+    def __init__(self, budget: float = DEFAULT_BUDGET, org_limit: int = DEFAULT_ORG_LIMIT):
+        self.budget = budget
+        self.org_limit = org_limit
+        self.status = 'pending'
+        self.error = None
+        self.orgs = 0
+        self.steps: List[Dict] = []
+        self.started_at = None
+        self.finished_at = None
+        self._deadline = None
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def finish(self, status: str, error: str = None) -> None:
+        self.status, self.error = status, error
+        self.finished_at = time.time()
+        self._done.set()
+
+    def _step(self, name: str, action: Callable):
+        if time.monotonic() >= self._deadline:
+            raise _BudgetExceeded(name)
+        started = time.perf_counter()
+        result = action()
+        self.steps.append({'step': name, 'seconds': round(time.perf_counter() - started, 4)})
+        return result
+
+    def run(self, app) -> None:
+        self.status, self.started_at = 'running', time.time()
+        self._deadline = time.monotonic() + self.budget
+        try:
+            with app.app_context():
+                database = app.extensions['database']
+                for name in HOT_TEMPLATES:
+                    self._step(f'template:{name}', lambda name=name: app.jinja_env.get_template(name))
+                org_ids = self._step('orgs', lambda: database.get_recently_active_org_ids(self.org_limit))
+                for org_id in org_ids:
+                    self._step(f'org:{org_id}', lambda org_id=org_id: _warm_organization(database, org_id))
+                    self.orgs += 1
+        except _BudgetExceeded as exceeded:
+            app.logger.warning('启动预热超出 %.1f 秒预算，跳过 %s 及之后的步骤', self.budget, exceeded)
+            self.finish('timeout')
+        except Exception as error:
+            app.logger.exception('启动预热失败')
+            self.finish('failed', str(error))
+        else:
+            self.finish('ready')
+
+    def report(self) -> Dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 4)
+        return {'ready': self.ready, 'status': self.status, 'error': self.error, 'budget': self.budget,
+                'elapsed': elapsed, 'orgs': self.orgs, 'steps': list(self.steps)}
+
+
+def _warm_organization(database, org_id: str) -> None:
+    database.player_directory.get(org_id)
+    database.badges.get(org_id)
+    for session in database.get_active_sessions(org_id):
+        database.get_session_with_players(org_id, session['session_id'])
+
+
+def register_warmup(app) -> Warmup:
+    """创建应用的 Warmup 状态并注册就绪探针 GET /ready。"""
+    warmup = Warmup(float(app.config.get('WARMUP_BUDGET_SECONDS')
+                          or os.environ.get('WARMUP_BUDGET_SECONDS', DEFAULT_BUDGET)),
+                    int(app.config.get('WARMUP_ORG_LIMIT') or os.environ.get('WARMUP_ORG_LIMIT', DEFAULT_ORG_LIMIT)))
+    app.extensions['warmup'] = warmup
+
+    @app.route('/ready')
+    def readiness():
+        report = app.extensions['warmup'].report()
+        report['startup'] = app.extensions['startup'].as_dict() if 'startup' in app.extensions else None
+        migrator = app.extensions.get('online_migrations')
+        report['migrations'] = migrator.report() if migrator is not None else None
+        backups = app.extensions.get('backups')
+        report['backups'] = backups.report() if backups is not None else None
+        replica = app.extensions.get('local_replica')
+        report['replica'] = replica.report() if replica is not None else None
+        return jsonify(report), 200 if report['ready'] else 503
+
+    return warmup
+
+
+def start_warmup(app, background: bool = True) -> Warmup:
+    """启动预热；WARMUP_ENABLED 关闭时（测试默认关闭）直接标记为就绪。"""
+    warmup = app.extensions['warmup']
+    enabled = app.config.get('WARMUP_ENABLED')
+    if enabled is None:
+        default = 'false' if app.testing else 'true'
+        enabled = os.environ.get('WARMUP_ENABLED', default).lower() == 'true'
+    if not enabled:
+        warmup.finish('skipped')
+    elif background:
+        threading.Thread(target=warmup.run, args=(app,), name='startup-warmup', daemon=True).start()
+    else:
+        warmup.run(app)
+    return warmup
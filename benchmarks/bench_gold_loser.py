@@ -0,0 +1,80 @@
+"""
+大吃一金"被谁痛击最多"：逐玩家按名字匹配 vs 单条窗口函数聚合
+
+用法:
+    python benchmarks/bench_gold_loser.py [--players 200] [--sessions 3000] [--records 60]
+
+旧实现对每个大吃一金玩家遍历全部大小金记录并按名字匹配（O(玩家 × 记录)），
+新实现由 DatabaseManager.get_negative_achievement_players 一次 SQL 聚合给出。
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.database import DatabaseManager  # noqa: E402
+from synthetic import populate_org  # noqa: E402
+
+
+def legacy_gold_loser_players(manager, org_id):
+    """重构前 models.get_negative_achievement_players 的名字匹配循环。"""
+    players = [{'name': p['name'], 'defeat_count': p['achievement_count']}
+               for p in manager._ledger_players(org_id, 'gold_loser')]
+    records = manager.get_negative_achievement_records(org_id, 'gold_loser')
+    for player in players:
+        opponent_counts = {}
+        for record in records:
+            if (record.get('loser_name') == player['name'] or
+                    record.get('loser2_name') == player['name']):
+                winner = record['winner_name']
+                opponent_counts[winner] = opponent_counts.get(winner, 0) + 1
+        if opponent_counts:
+            most_defeated_by = max(opponent_counts.items(), key=lambda x: x[1])
+            player['most_defeated_by'], player['most_defeated_count'] = most_defeated_by
+        else:
+            player['most_defeated_by'], player['most_defeated_count'] = None, 0
+    return players
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=3000)
+    parser.add_argument('--records', type=int, default=60, help='每个场次的对局数')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ems-bench-gold-loser-') as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        manager = DatabaseManager(path)
+        org_id, _, _ = populate_org(path, players=args.players, sessions=args.sessions,
+                                    records_per_session=args.records)
+        legacy = legacy_gold_loser_players(manager, org_id)
+        current = manager.get_negative_achievement_players(org_id, 'gold_loser')
+        mismatched = sum(1 for old, new in zip(legacy, current)
+                         if old['most_defeated_count'] != new['most_defeated_count'])
+        legacy_ms = _median_ms(lambda: legacy_gold_loser_players(manager, org_id), args.repeat)
+        current_ms = _median_ms(lambda: manager.get_negative_achievement_players(org_id, 'gold_loser'), args.repeat)
+
+    print(f"合成组织: {args.players} 玩家, {args.sessions} 场次, {args.sessions * args.records} 条对局")
+    print(f"大吃一金玩家: {len(current)}，痛击次数不一致: {mismatched}")
+    print(f"{'名字匹配循环 (ms)':24}{legacy_ms:>12.1f}")
+    print(f"{'窗口函数聚合 (ms)':24}{current_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
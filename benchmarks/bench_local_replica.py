@@ -0,0 +1,157 @@
+"""
+计分写入延迟：直接在慢速共享盘上运行 vs 本地工作副本定时同步
+
+用法:
+    python benchmarks/bench_local_replica.py [--writes 300] [--latency-ms 8] [--interval 1]
+
+共享盘（Azure /home 的 SMB）用延迟模型模拟：每次打开连接（取共享锁）付出一次往返，
+每次提交付出 --commit-trips 次往返（加锁、日志写入与 fsync、数据写入与 fsync、删除
+日志）；本地工作副本从共享盘恢复或写回共享盘时，在线备份每一步付出一次往返，写回另加
+一次提交。
+两种模式执行相同的计分写入，比较单次写入延迟、同步次数与耗时，以及持久性窗口上限。
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.backup import online_copy  # noqa: E402
+from app.database import DatabaseManager  # noqa: E402
+from app.local_replica import LocalReplica  # noqa: E402
+from synthetic import populate_org  # noqa: E402
+
+
+class SlowShare:
+    latency = 0.0
+    commit_trips = 4
+
+
+class SlowConnection(sqlite3.Connection):
+    def commit(self):
+        if self.in_transaction:
+            time.sleep(SlowShare.latency * SlowShare.commit_trips)
+        super().commit()
+
+
+class SlowShareManager(DatabaseManager):
+    """数据库文件位于模拟共享盘上的 DatabaseManager。"""
+
+    @contextmanager
+    def get_connection(self):
+        time.sleep(SlowShare.latency)
+        conn = sqlite3.connect(self.db_path, factory=SlowConnection)
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+class SlowShareReplica(LocalReplica):
+    """从模拟共享盘恢复、写回模拟共享盘的本地工作副本。"""
+
+    def _copy_from_durable(self, target):
+        time.sleep(SlowShare.latency)
+        online_copy(self.durable_path, target, self.pages, 0,
+                    progress=lambda remaining, total: time.sleep(SlowShare.latency))
+
+    def _copy_to_durable(self, source):
+        online_copy(source, self.durable_path, self.pages, 0,
+                    progress=lambda remaining, total: time.sleep(SlowShare.latency))
+        time.sleep(SlowShare.latency * SlowShare.commit_trips)
+
+
+def _seed(path, args):
+    manager = DatabaseManager(path)
+    org_id, player_ids, _ = populate_org(path, players=args.players, sessions=args.sessions,
+                                         records_per_session=args.records)
+    session_id = manager.create_session(org_id, 'Bench live session')
+    for player_id in player_ids[:4]:
+        manager.add_player_to_session(org_id, session_id, player_id)
+    return org_id, session_id, player_ids[:4]
+
+
+def _score(manager, org_id, session_id, players, writes):
+    samples = []
+    for index in range(writes):
+        winner, loser = players[index % 4], players[(index + 1) % 4]
+        started = time.perf_counter()
+        manager.add_game_record(org_id, session_id, winner, loser, 1 + index % 7)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--records', type=int, default=40, help='每个场次的对局数')
+    parser.add_argument('--writes', type=int, default=300, help='计分写入次数')
+    parser.add_argument('--latency-ms', type=float, default=8.0, help='共享盘每次往返的延迟')
+    parser.add_argument('--commit-trips', type=int, default=4, help='每次提交的共享盘往返次数')
+    parser.add_argument('--interval', type=float, default=1.0, help='本地副本同步间隔（持久性窗口）')
+    parser.add_argument('--pages', type=int, default=256, help='写回时每步复制的页数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ems-bench-replica-') as tmp:
+        seed = os.path.join(tmp, 'seed.db')
+        org_id, session_id, players = _seed(seed, args)
+        direct_path = os.path.join(tmp, 'share-direct', 'ems.db')
+        replica_path = os.path.join(tmp, 'share-replica', 'ems.db')
+        for path in (direct_path, replica_path):
+            os.makedirs(os.path.dirname(path))
+            shutil.copyfile(seed, path)
+        SlowShare.latency, SlowShare.commit_trips = args.latency_ms / 1000, args.commit_trips
+
+        started = time.perf_counter()
+        direct = _score(SlowShareManager(direct_path), org_id, session_id, players, args.writes)
+        direct_seconds = time.perf_counter() - started
+
+        replica = SlowShareReplica(replica_path, os.path.join(tmp, 'local'), args.interval, args.pages)
+        started = time.perf_counter()
+        replica.prepare()
+        boot_seconds = time.perf_counter() - started
+        manager = DatabaseManager(replica.local_path)
+        replica.start()
+        started = time.perf_counter()
+        local = _score(manager, org_id, session_id, players, args.writes)
+        local_seconds = time.perf_counter() - started
+        periodic = replica.syncs
+        started = time.perf_counter()
+        replica.shutdown()
+        shutdown_seconds = time.perf_counter() - started
+        sync_seconds = (replica.last or {}).get('seconds', 0.0)
+        size = os.path.getsize(replica_path)
+        with sqlite3.connect(replica_path) as conn:
+            durable_records = conn.execute('SELECT COUNT(*) FROM game_records WHERE session_id = ?',
+                                           (session_id,)).fetchone()[0]
+
+    print(f"合成组织: {args.players} 玩家, {args.sessions} 场次, 数据库 {size / 2**20:.1f} MiB")
+    print(f"共享盘模型: 每次往返 {args.latency_ms:.1f}ms, 每次提交 {args.commit_trips} 次往返")
+    print(f"{'':24}{'直接共享盘':>14}{'本地工作副本':>14}")
+    print(f"{'写入 p50 (ms)':24}{statistics.median(direct):>14.2f}{statistics.median(local):>14.2f}")
+    print(f"{'写入 p95 (ms)':24}{_percentile(direct, 0.95):>14.2f}{_percentile(local, 0.95):>14.2f}")
+    print(f"{args.writes}{' 次写入总耗时 (s)':21}{direct_seconds:>14.2f}{local_seconds:>14.2f}")
+    print(f"启动恢复耗时: {boot_seconds:.2f}s; 写入期间定时同步 {periodic} 次, "
+          f"退出同步 {shutdown_seconds:.2f}s (最后一次写回 {sync_seconds:.2f}s)")
+    print(f"持久性窗口上限: 同步间隔 {args.interval:.1f}s + 写回耗时 {sync_seconds:.2f}s; "
+          f"退出后共享盘上的本场次记录 {durable_records}/{args.writes}")
+
+
+if __name__ == '__main__':
+    main()
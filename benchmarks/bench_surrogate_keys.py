@@ -0,0 +1,157 @@
+"""
+整数代理键迁移前后的体积与查询延迟对比
+
+用法:
+    python benchmarks/bench_surrogate_keys.py [--players 200] [--sessions 3000] [--records 60]
+
+先以不含整数键升级的结构生成合成组织（UUID 关联），复制一份后执行一次性迁移，
+分别 VACUUM 后比较文件体积、game_records 索引体积，以及典型读路径的中位延迟。
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import tenancy  # noqa: E402
+from synthetic import BASE_EPOCH, populate_org  # noqa: E402
+
+MONTH = 30 * 86400
+
+BEFORE_QUERIES = {
+    'player_history_page': ('''
+        SELECT gr.*, s.name, pw.name, pl1.name, pl2.name FROM game_records gr
+        JOIN sessions s ON s.org_id = gr.org_id AND s.session_id = gr.session_id
+        JOIN players pw ON pw.org_id = gr.org_id AND pw.player_id = gr.winner_id
+        JOIN players pl1 ON pl1.org_id = gr.org_id AND pl1.player_id = gr.loser_id
+        LEFT JOIN players pl2 ON pl2.org_id = gr.org_id AND pl2.player_id = gr.loser_id2
+        WHERE gr.org_id = :org AND (gr.winner_id = :player OR gr.winner_id2 = :player
+              OR gr.loser_id = :player OR gr.loser_id2 = :player)
+        ORDER BY gr.created_at DESC LIMIT 50'''),
+    'player_month_rows': ('''
+        SELECT winner_id, winner_id2, loser_id, loser_id2, score FROM game_records
+        WHERE org_id = :org AND (winner_id = :player OR winner_id2 = :player
+              OR loser_id = :player OR loser_id2 = :player)
+          AND created_epoch >= :start AND created_epoch <= :end'''),
+    'session_records': ('''
+        SELECT gr.*, pw.name, pl1.name, pl2.name FROM game_records gr
+        JOIN players pw ON pw.org_id = gr.org_id AND pw.player_id = gr.winner_id
+        JOIN players pl1 ON pl1.org_id = gr.org_id AND pl1.player_id = gr.loser_id
+        LEFT JOIN players pl2 ON pl2.org_id = gr.org_id AND pl2.player_id = gr.loser_id2
+        WHERE gr.org_id = :org AND gr.session_id = :session ORDER BY gr.record_id DESC'''),
+}
+
+AFTER_QUERIES = {
+    'player_history_page': ('''
+        SELECT gr.*, s.name, pw.name, pl1.name, pl2.name FROM game_records gr
+        JOIN sessions s ON s.session_pk = gr.session_pk
+        JOIN players pw ON pw.player_pk = gr.winner_pk
+        JOIN players pl1 ON pl1.player_pk = gr.loser_pk
+        LEFT JOIN players pl2 ON pl2.player_pk = gr.loser2_pk
+        WHERE (gr.winner_pk = :pk OR gr.winner2_pk = :pk OR gr.loser_pk = :pk OR gr.loser2_pk = :pk)
+        ORDER BY gr.created_at DESC LIMIT 50'''),
+    'player_month_rows': ('''
+        SELECT winner_id, winner_id2, loser_id, loser_id2, score FROM game_records
+        WHERE (winner_pk = :pk OR winner2_pk = :pk OR loser_pk = :pk OR loser2_pk = :pk)
+          AND created_epoch >= :start AND created_epoch <= :end'''),
+    'session_records': ('''
+        SELECT gr.*, pw.name, pl1.name, pl2.name FROM game_records gr
+        JOIN players pw ON pw.player_pk = gr.winner_pk
+        JOIN players pl1 ON pl1.player_pk = gr.loser_pk
+        LEFT JOIN players pl2 ON pl2.player_pk = gr.loser2_pk
+        WHERE gr.session_pk = (SELECT session_pk FROM sessions WHERE org_id = :org AND session_id = :session)
+        ORDER BY gr.record_id DESC'''),
+}
+
+
+def _build_before(path, args):
+    upgrades = tenancy._SCHEMA_UPGRADES
+    versions = [version for version, _ in upgrades]
+    tenancy._SCHEMA_UPGRADES = upgrades[:versions.index(tenancy.INTEGER_KEYS_MIGRATION_VERSION)]
+    try:
+        tenancy.initialize_database(path)
+    finally:
+        tenancy._SCHEMA_UPGRADES = upgrades
+    return populate_org(path, players=args.players, sessions=args.sessions,
+                        records_per_session=args.records)
+
+
+def _index_bytes(conn):
+    try:
+        rows = conn.execute('''SELECT SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+                               WHERE m.type = 'index' AND m.tbl_name = 'game_records' ''').fetchone()
+        return rows[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def _measure(path, queries, params_list, repeat):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('ANALYZE')
+        results = {}
+        for name, sql in queries.items():
+            samples = []
+            for params in params_list[:repeat]:
+                started = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(samples)
+        return results, os.path.getsize(path), _index_bytes(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=3000)
+    parser.add_argument('--records', type=int, default=60, help='每个场次的对局数')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ems-bench-keys-') as tmp:
+        before, after = os.path.join(tmp, 'before.db'), os.path.join(tmp, 'after.db')
+        org_id, player_ids, session_ids = _build_before(before, args)
+        shutil.copyfile(before, after)
+
+        started = time.perf_counter()
+        tenancy._apply_schema_upgrades(after)
+        migration_seconds = time.perf_counter() - started
+        for path in (before, after):
+            with sqlite3.connect(path) as conn:
+                conn.execute('VACUUM')
+
+        rng = random.Random(7)
+        with sqlite3.connect(after) as conn:
+            pks = dict(conn.execute('SELECT player_id, player_pk FROM players WHERE org_id = ?', (org_id,)))
+        params_list = []
+        for _ in range(args.repeat):
+            player = rng.choice(player_ids)
+            start = BASE_EPOCH + rng.randrange(args.sessions * 6 * 3600)
+            params_list.append({'org': org_id, 'player': player, 'pk': pks[player],
+                                'session': rng.choice(session_ids), 'start': start, 'end': start + MONTH})
+
+        before_ms, before_size, before_idx = _measure(before, BEFORE_QUERIES, params_list, args.repeat)
+        after_ms, after_size, after_idx = _measure(after, AFTER_QUERIES, params_list, args.repeat)
+
+    records = args.sessions * args.records
+    print(f"合成组织: {args.players} 玩家, {args.sessions} 场次, {records} 条对局")
+    print(f"一次性迁移耗时: {migration_seconds:.2f}s")
+    print(f"{'':24}{'UUID 关联':>14}{'整数主键':>14}")
+    print(f"{'数据库文件 (MiB)':24}{before_size / 2**20:>14.1f}{after_size / 2**20:>14.1f}")
+    if before_idx is not None:
+        print(f"{'game_records 索引 (MiB)':24}{before_idx / 2**20:>14.1f}{after_idx / 2**20:>14.1f}")
+    for name in BEFORE_QUERIES:
+        print(f"{name + ' (ms)':24}{before_ms[name]:>14.3f}{after_ms[name]:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
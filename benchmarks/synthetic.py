@@ -0,0 +1,97 @@
+"""
+基准测试用的合成组织数据生成器
+
+直接以批量 SQL 写入（不经过 DatabaseManager 的逐条写路径），
+以便在几秒内生成数十万条对局记录。
+"""
+import random
+import sqlite3
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.achievement_rules import rebuild_achievement_counts, rebuild_pair_stats  # noqa: E402
+from app.tenancy import fill_record_keys, normalize_name, rebuild_month_activity  # noqa: E402
+
+BASE_EPOCH = 1735689600  # 2025-01-01 00:00:00 UTC
+SPECIAL_SCORES = (None,) * 17 + ('小金', '大金', '双吃')
+
+
+def _timestamp(epoch):
+    import datetime
+    return datetime.datetime.utcfromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def populate_org(db_path, name='Bench Org', players=200, sessions=2000,
+                 records_per_session=60, seed=20261019):
+    """在 db_path 中创建一个合成组织并写入对局数据，返回 (org_id, player_ids, session_ids)。"""
+    rng = random.Random(seed)
+    org_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    now = _timestamp(BASE_EPOCH)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''INSERT INTO organizations (org_id, slug, name, name_key, admin_password_hash, created_at, updated_at)
+                        VALUES (?, ?, ?, ?, NULL, ?, ?)''',
+                     (org_id, f"bench-{org_id[:8]}", name, normalize_name(name), now, now))
+        player_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(players)]
+        conn.executemany('''INSERT INTO players (player_id, org_id, name, name_key, created_at, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         [(pid, org_id, f"Player {i:04d}", f"player {i:04d}", now, now)
+                          for i, pid in enumerate(player_ids)])
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        has_epoch = 'created_epoch' in columns
+        session_ids, session_rows, member_rows, record_rows = [], [], [], []
+        for index in range(sessions):
+            session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            epoch = BASE_EPOCH + index * 6 * 3600
+            created_at = _timestamp(epoch)
+            session_ids.append(session_id)
+            session_rows.append((session_id, org_id, f"Session {index}", created_at, created_at, epoch))
+            members = rng.sample(player_ids, 6)
+            scores = dict.fromkeys(members, 0)
+            for offset in range(records_per_session):
+                winner, loser, other = rng.sample(members, 3)
+                score = rng.choice((1, 1, 2, 3, 5, 7, 10, 14, 20))
+                special = rng.choice(SPECIAL_SCORES)
+                loser2 = other if special in ('大金', '双吃') else None
+                scores[winner] += score
+                if loser2:
+                    scores[loser] -= score // 2
+                    scores[loser2] -= score // 2
+                else:
+                    scores[loser] -= score
+                record_epoch = epoch + offset * 60
+                record_rows.append((org_id, session_id, winner, loser, loser2, score,
+                                    _timestamp(record_epoch), special, record_epoch))
+            member_rows.extend((org_id, session_id, pid, score) for pid, score in scores.items())
+        if has_epoch:
+            conn.executemany('''INSERT INTO sessions (session_id, org_id, name, active, created_at, updated_at, created_epoch)
+                                VALUES (?, ?, ?, 0, ?, ?, ?)''', session_rows)
+        else:
+            conn.executemany('''INSERT INTO sessions (session_id, org_id, name, active, created_at, updated_at)
+                                VALUES (?, ?, ?, 0, ?, ?)''', [row[:5] for row in session_rows])
+        conn.executemany('''INSERT INTO session_players (org_id, session_id, player_id, score)
+                            VALUES (?, ?, ?, ?)''', member_rows)
+        if has_epoch:
+            conn.executemany('''INSERT INTO game_records (org_id, session_id, winner_id, loser_id, loser_id2, score,
+                                                          created_at, special_score, created_epoch)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', record_rows)
+        else:
+            conn.executemany('''INSERT INTO game_records (org_id, session_id, winner_id, loser_id, loser_id2, score,
+                                                          created_at, special_score)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', [row[:8] for row in record_rows])
+        cursor = conn.cursor()
+        if 'session_pk' in {row[1] for row in conn.execute('PRAGMA table_info(game_records)')}:
+            fill_record_keys(cursor, org_id)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'org_month_activity'").fetchone():
+            rebuild_month_activity(cursor, org_id)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'player_achievement_counts'").fetchone():
+            rebuild_achievement_counts(cursor, org_id)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'player_pair_stats'").fetchone():
+            rebuild_pair_stats(cursor, org_id)
+        conn.commit()
+    finally:
+        conn.close()
+    return org_id, player_ids, session_ids
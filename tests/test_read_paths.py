@@ -0,0 +1,1474 @@
+"""Regression coverage for paginated, aggregated, and cached read paths.
+
+Like test_multi_org, a private DATABASE_PATH is selected before app.py is loaded.
+"""
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+IMPORT_DIR = tempfile.TemporaryDirectory(prefix="ems-pool-read-paths-import-")
+os.environ.setdefault("DATABASE_PATH", str(Path(IMPORT_DIR.name) / "bootstrap.db"))
+sys.path.insert(0, str(ROOT))
+
+from flask import g
+
+from app.achievement_rules import rebuild_pair_stats
+from app.database import DatabaseManager, db
+from app.fragment_cache import MemoryFragmentBackend
+from app.loaders import request_loader
+from app.tenancy import fill_record_keys
+from app import backup, json_import, local_replica, online_migrations, org_archive, org_purge, tournament
+from app.warmup import HOT_TEMPLATES, start_warmup
+
+_wsgi_spec = importlib.util.spec_from_file_location("ems_pool_wsgi_read_paths", ROOT / "app.py")
+wsgi = importlib.util.module_from_spec(_wsgi_spec)
+_wsgi_spec.loader.exec_module(wsgi)
+
+
+class ReadPathCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix="ems-pool-read-paths-")
+        self.path = str(Path(self.tmp.name) / "reads.db")
+        self.original_global_path = db.db_path
+        db.db_path = self.path
+        self.app = wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path, 'SECRET_KEY': 'test'})
+        self.client = self.app.test_client()
+        self.manager = self.app.extensions['database']
+        self.org = self.manager.create_organization('Read Paths', 'pbkdf2:sha256:600000$test$hash')
+        self.org_id = self.org['org_id']
+
+    def tearDown(self):
+        db.db_path = self.original_global_path
+        self.tmp.cleanup()
+
+    def seed_games(self, names=("Alice", "Bob", "Carol", "Dan"), rounds=12):
+        ids = {name: self.manager.create_player(self.org_id, name) for name in names}
+        session_id = self.manager.create_session(self.org_id, "Read paths session")
+        for player_id in ids.values():
+            self.manager.add_player_to_session(self.org_id, session_id, player_id)
+        a, b, c, d = (ids[n] for n in names)
+        for i in range(rounds):
+            self.manager.add_game_record(self.org_id, session_id, a, b, 1 + i % 7, '小金' if i % 7 == 6 else None)
+            self.manager.add_game_record(self.org_id, session_id, b, a, 1)
+            self.manager.add_game_record(self.org_id, session_id, a, b, 20, '大金', loser_id2=c)
+            self.manager.add_game_record(self.org_id, session_id, c, a, 2, winner_id2=d)
+        return session_id, ids
+
+    def seed_org(self):
+        session_id, ids = self.seed_games(rounds=2)
+        with self.app.app_context():
+            tournament_id = tournament.create_tournament(self.org_id, 'Cup', [{'name': '半决赛', 'best_of': 3},
+                                                                             {'name': '决赛', 'best_of': 3}])
+            for player_id in ids.values():
+                tournament.add_participant(self.org_id, tournament_id, player_id)
+            self.assertTrue(tournament.generate_bracket(self.org_id, tournament_id)[0])
+            match_id = tournament.get_bracket(self.org_id, tournament_id)[0][0]['match_id']
+            self.assertTrue(tournament.record_match_game(self.org_id, match_id, 1)[0])
+        self.manager.retire_player(self.org_id, ids['Dan'])
+        return session_id, ids
+
+
+class PlayerRecordPaginationTests(ReadPathCase):
+    def test_cursor_pages_cover_every_record_once_in_order(self):
+        _, ids = self.seed_games()
+        expected = self.manager.get_player_records(self.org_id, ids['Alice'])
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.manager.get_player_records_page(self.org_id, ids['Alice'], before=cursor, limit=7)
+            seen.extend(page)
+            if cursor is None:
+                break
+        self.assertEqual([r['record_id'] for r in seen],
+                         [r['record_id'] for r in sorted(expected, key=lambda r: (r['created_at'], r['record_id']), reverse=True)])
+        self.assertEqual({r['record_id']: r['score'] for r in seen}, {r['record_id']: r['score'] for r in expected})
+
+    def test_summary_rollup_matches_record_list_arithmetic(self):
+        _, ids = self.seed_games()
+        records = self.manager.get_player_records(self.org_id, ids['Alice'])
+        summary = self.manager.get_player_record_summary(self.org_id, ids['Alice'])
+        self.assertEqual(summary['total_games'], len(records))
+        self.assertEqual(summary['wins'], sum(r['is_winner'] for r in records))
+        self.assertEqual(summary['total_score'], sum(r['score'] if r['is_winner'] else -r['score'] for r in records))
+        self.assertEqual(summary['one_point_given'], sum(1 for r in records if r['score'] == 1 and not r['is_winner']))
+        self.assertEqual(summary['small_gold_count'], sum(1 for r in records if r['is_winner'] and r['special_score'] == '小金'))
+        opponents = {o['id']: o for o in summary['opponents']}
+        self.assertEqual(set(opponents), {ids['Bob'], ids['Carol'], ids['Dan']})
+        self.assertEqual(opponents[ids['Dan']]['total_score'], -12)
+        trend = self.manager.get_player_score_trend(self.org_id, ids['Alice'])
+        self.assertEqual(len(trend), len(records))
+        self.assertEqual(trend[-1]['score'], summary['total_score'])
+
+    def test_records_api_pages_and_rejects_foreign_players(self):
+        _, ids = self.seed_games(rounds=15)
+        page = self.client.get(f"/o/{self.org['slug']}/player/{ids['Alice']}")
+        self.assertEqual(page.status_code, 200)
+        self.assertIn('load-more-records-btn', page.get_data(as_text=True))
+        first, cursor = self.manager.get_player_records_page(self.org_id, ids['Alice'])
+        response = self.client.get(f"/o/{self.org['slug']}/api/player/{ids['Alice']}/records",
+                                   query_string={'before_time': cursor[0], 'before_id': cursor[1]})
+        payload = response.get_json()
+        self.assertEqual(len(first) + len(payload['records']), 60)
+        self.assertFalse(payload['has_more'])
+        other = self.manager.create_organization('Other Reads', 'pbkdf2:sha256:600000$test$hash')
+        self.assertEqual(self.client.get(f"/o/{other['slug']}/api/player/{ids['Alice']}/records").status_code, 404)
+
+
+class MonthActivityIndexTests(ReadPathCase):
+    def scan_months(self, player_id=None):
+        """The pre-index GROUP BY queries, used as the oracle."""
+        sql = '''SELECT strftime('%Y-%m', s.created_at) AS key, COUNT(DISTINCT s.session_id) AS count
+                   FROM sessions s WHERE s.org_id = ?'''
+        params = [self.org_id]
+        if player_id:
+            sql += ''' AND EXISTS (SELECT 1 FROM game_records gr WHERE gr.org_id = s.org_id
+                        AND gr.session_id = s.session_id AND ? IN (gr.winner_id, gr.winner_id2, gr.loser_id, gr.loser_id2))'''
+            params.append(player_id)
+        with self.manager.get_connection() as conn:
+            rows = conn.execute(sql + ' GROUP BY key ORDER BY key DESC', params).fetchall()
+        return [(r['key'], r['count']) for r in rows]
+
+    def index_months(self, player_id=None):
+        months = (self.manager.get_available_months_for_player(self.org_id, player_id) if player_id
+                  else self.manager.get_available_months(self.org_id))
+        return [(m['key'], m['count']) for m in months]
+
+    def assert_index_matches(self, ids):
+        self.assertEqual(self.index_months(), self.scan_months())
+        for player_id in ids.values():
+            self.assertEqual(self.index_months(player_id), self.scan_months(player_id))
+
+    def test_write_paths_keep_month_index_in_sync(self):
+        session_id, ids = self.seed_games(rounds=2)
+        with self.manager.get_connection() as conn:
+            conn.execute("UPDATE sessions SET created_at = '2025-11-30 23:00:00' WHERE session_id = ?", (session_id,))
+            conn.commit()
+        tenancy = sys.modules['app.tenancy']
+        with self.manager.get_connection() as conn:
+            tenancy.rebuild_month_activity(conn.cursor(), self.org_id)
+            conn.commit()
+        empty_session = self.manager.create_session(self.org_id, "No games yet")
+        self.assert_index_matches(ids)
+        self.assertEqual(self.manager.get_available_months(self.org_id)[-1],
+                         {'key': '2025-11', 'name': '2025年11月', 'count': 1})
+
+        second = self.manager.create_session(self.org_id, "Second")
+        for name in ('Alice', 'Dan'):
+            self.manager.add_player_to_session(self.org_id, second, ids[name])
+        record_id = self.manager.add_game_record(self.org_id, second, ids['Dan'], ids['Alice'], 3)
+        self.assert_index_matches(ids)
+        self.manager.delete_game_record(self.org_id, record_id)
+        self.assert_index_matches(ids)
+        self.assertEqual(self.manager.get_available_months_for_player(self.org_id, ids['Dan'])[0]['key'], '2025-11')
+
+        self.manager.delete_session(self.org_id, session_id)
+        self.manager.delete_session(self.org_id, empty_session)
+        self.assert_index_matches(ids)
+        self.assertEqual(self.manager.get_available_months_for_player(self.org_id, ids['Alice']), [])
+
+    def test_record_deletes_drop_players_only_after_their_last_session_record(self):
+        session_id, ids = self.seed_games(rounds=1)
+        for record in self.manager.get_session_records(self.org_id, session_id):
+            self.manager.delete_game_record(self.org_id, record['record_id'])
+            self.assert_index_matches(ids)
+        self.assertEqual(self.manager.get_available_months_for_player(self.org_id, ids['Carol']), [])
+
+    def test_upgrade_backfills_existing_database(self):
+        _, ids = self.seed_games(rounds=3)
+        with self.manager.get_connection() as conn:
+            conn.execute('DROP TABLE player_month_activity')
+            conn.execute('DROP TABLE org_month_activity')
+            conn.execute("DELETE FROM schema_migrations WHERE version = '20261019_month_activity_index'")
+            conn.commit()
+        self.manager = DatabaseManager(self.path)
+        self.assert_index_matches(ids)
+        self.assertEqual(self.index_months()[0][1], 1)
+
+
+class EpochRangeFilterTests(ReadPathCase):
+    def backdate(self, session_id, created_at):
+        """Move a session and its records to another time, keeping the epoch columns in step."""
+        with self.manager.get_connection() as conn:
+            for table in ('sessions', 'game_records'):
+                conn.execute(f"""UPDATE {table} SET created_at = ?, created_epoch = CAST(strftime('%s', ?) AS INTEGER)
+                                 WHERE org_id = ? AND session_id = ?""", (created_at, created_at, self.org_id, session_id))
+            conn.commit()
+
+    def test_write_paths_store_epoch_and_upgrade_backfills(self):
+        session_id, ids = self.seed_games(rounds=1)
+        with self.manager.get_connection() as conn:
+            rows = conn.execute("""SELECT created_epoch = CAST(strftime('%s', created_at) AS INTEGER) AS ok
+                                   FROM game_records UNION ALL
+                                   SELECT created_epoch = CAST(strftime('%s', created_at) AS INTEGER) FROM sessions""").fetchall()
+            self.assertTrue(rows and all(r['ok'] for r in rows))
+            conn.execute('UPDATE game_records SET created_epoch = NULL')
+            conn.execute("DELETE FROM schema_migrations WHERE version = '20261019_epoch_range_columns'")
+            conn.commit()
+        self.manager = DatabaseManager(self.path)
+        self.assertEqual(len(self.manager.get_player_records(self.org_id, ids['Alice'], '2000-01-01', '2999-12-31')), 4)
+
+    def test_date_only_end_covers_whole_day_and_history_filters_sessions(self):
+        early, ids = self.seed_games(rounds=1)
+        late = self.manager.create_session(self.org_id, "Later session")
+        for name in ('Alice', 'Bob'):
+            self.manager.add_player_to_session(self.org_id, late, ids[name])
+        self.manager.add_game_record(self.org_id, late, ids['Bob'], ids['Alice'], 5)
+        self.backdate(early, '2025-03-31 22:30:00')
+        self.backdate(late, '2025-04-01 00:00:00')
+
+        march = self.manager.get_global_leaderboard(self.org_id, '2025-03-01', '2025-03-31')
+        self.assertEqual(sum(p['total_games'] for p in march if p['name'] == 'Alice'), 4)
+        self.assertEqual([s['session_id'] for s in self.manager.get_all_sessions(self.org_id, '2025-04-01 00:00:00', '2025-04-30 23:59:59')],
+                         [late])
+        self.assertEqual(self.manager.get_earliest_session_date(self.org_id), '2025-03-31')
+
+        response = self.client.get(f"/o/{self.org['slug']}/api/load_more_sessions",
+                                   query_string={'month': '2025-03', 'offset': 0})
+        self.assertEqual([s['session_id'] for s in response.get_json()['sessions']], [early])
+        response = self.client.get(f"/o/{self.org['slug']}/api/load_more_sessions",
+                                   query_string={'month': 'custom', 'start_date': '2025-03-31T23:00',
+                                                 'end_date': '2025-04-01T00:00', 'offset': 0})
+        self.assertEqual([s['session_id'] for s in response.get_json()['sessions']], [late])
+
+
+class IntegerKeyTests(ReadPathCase):
+    def test_write_paths_and_json_import_fill_integer_keys(self):
+        session_id, ids = self.seed_games(rounds=1)
+        imported = self.manager.create_organization('Imported Keys', 'pbkdf2:sha256:600000$test$hash')
+        self.manager.migrate_from_json({
+            'players': {'p-1': {'name': 'Eve', 'created_at': '2025-01-01 00:00:00', 'updated_at': '2025-01-01 00:00:00'},
+                        'p-2': {'name': 'Finn', 'created_at': '2025-01-01 00:00:00', 'updated_at': '2025-01-01 00:00:00'}},
+            'sessions': {'s-1': {'name': 'Old', 'timestamp': '2025-01-02 10:00:00', 'player_ids': ['p-1', 'p-2'],
+                                 'records': [{'winner_id': 'p-1', 'loser_id': 'p-2', 'score': 4,
+                                              'timestamp': '2025-01-02 10:05:00'}]}},
+        }, imported['org_id'])
+        with self.manager.get_connection() as conn:
+            mismatched = conn.execute('''SELECT COUNT(*) FROM game_records gr
+                JOIN sessions s ON s.session_pk = gr.session_pk
+                JOIN players w ON w.player_pk = gr.winner_pk JOIN players l ON l.player_pk = gr.loser_pk
+                WHERE s.session_id != gr.session_id OR w.player_id != gr.winner_id OR l.player_id != gr.loser_id
+                   OR IFNULL((SELECT player_id FROM players WHERE player_pk = gr.loser2_pk), '') != IFNULL(gr.loser_id2, '')''').fetchone()[0]
+            self.assertEqual(mismatched, 0)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM game_records WHERE session_pk IS NULL').fetchone()[0], 0)
+        self.assertEqual(self.manager.get_player_stats(imported['org_id'], 'p-1')['total_score'], 4)
+        self.assertEqual(self.manager.get_player_stats(self.org_id, 'p-1')['total_games'], 0)
+
+    def test_upgrade_rebuilds_uuid_keyed_database(self):
+        tenancy = sys.modules['app.tenancy']
+        legacy_path = str(Path(self.tmp.name) / "uuid-keyed.db")
+        upgrades = tenancy._SCHEMA_UPGRADES
+        versions = [version for version, _ in upgrades]
+        tenancy._SCHEMA_UPGRADES = upgrades[:versions.index(tenancy.INTEGER_KEYS_MIGRATION_VERSION)]
+        try:
+            old = DatabaseManager(legacy_path)
+        finally:
+            tenancy._SCHEMA_UPGRADES = upgrades
+        org = old.create_organization('Before Keys', 'pbkdf2:sha256:600000$test$hash')
+        now = '2025-05-05 12:00:00'
+        with old.get_connection() as conn:
+            conn.executemany('INSERT INTO players (player_id, org_id, name, name_key, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                             [(pid, org['org_id'], pid, pid.lower(), now, now) for pid in ('Gil', 'Hal')])
+            conn.execute('INSERT INTO sessions (session_id, org_id, name, created_at, updated_at, created_epoch) VALUES (?, ?, ?, ?, ?, ?)',
+                         ('old-session', org['org_id'], 'Old', now, now, 1746446400))
+            conn.executemany('INSERT INTO session_players (org_id, session_id, player_id) VALUES (?, ?, ?)',
+                             [(org['org_id'], 'old-session', pid) for pid in ('Gil', 'Hal')])
+            conn.execute('''INSERT INTO game_records (org_id, session_id, winner_id, loser_id, score, created_at, created_epoch)
+                            VALUES (?, 'old-session', 'Gil', 'Hal', 6, ?, 1746446400)''', (org['org_id'], now))
+            conn.commit()
+            rowids = dict(conn.execute('SELECT player_id, rowid FROM players WHERE org_id = ?', (org['org_id'],)).fetchall())
+
+        upgraded = DatabaseManager(legacy_path)
+        with upgraded.get_connection() as conn:
+            self.assertEqual(dict(conn.execute('SELECT player_id, player_pk FROM players WHERE org_id = ?',
+                                               (org['org_id'],)).fetchall()), rowids)
+            self.assertEqual(conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        records = upgraded.get_player_records(org['org_id'], 'Hal')
+        self.assertEqual([(r['opponent_name'], r['session_name'], r['is_winner']) for r in records], [('Gil', 'Old', False)])
+        self.assertEqual(upgraded.get_session_records(org['org_id'], 'old-session')[0]['winner_name'], 'Gil')
+
+
+
+class AchievementLedgerTests(ReadPathCase):
+    def scan_ledger(self):
+        """Group special-score records directly, used as the oracle."""
+        with self.manager.get_connection() as conn:
+            rows = conn.execute('''SELECT kind, player_id, COUNT(*), MIN(created_at), MAX(created_at) FROM (
+                    SELECT CASE special_score WHEN '小金' THEN 'small_gold' ELSE 'big_gold' END AS kind,
+                           winner_id AS player_id, created_at FROM game_records
+                    WHERE org_id = ? AND special_score IN ('小金', '大金')
+                    UNION ALL SELECT 'gold_loser', loser_id, created_at FROM game_records
+                    WHERE org_id = ? AND special_score IN ('小金', '大金')
+                    UNION ALL SELECT 'gold_loser', loser_id2, created_at FROM game_records
+                    WHERE org_id = ? AND special_score IN ('小金', '大金') AND loser_id2 IS NOT NULL)
+                GROUP BY kind, player_id''', (self.org_id,) * 3).fetchall()
+        return {(r[0], r[1]): tuple(r[2:]) for r in rows}
+
+    def ledger(self):
+        with self.manager.get_connection() as conn:
+            rows = conn.execute('''SELECT c.kind, p.player_id, c.count, c.first_at, c.last_at
+                FROM player_achievement_counts c JOIN players p ON p.player_pk = c.player_pk
+                WHERE c.org_id = ?''', (self.org_id,)).fetchall()
+        return {(r[0], r[1]): tuple(r[2:]) for r in rows}
+
+    def test_write_paths_keep_ledger_and_tiers_in_sync(self):
+        session_id, ids = self.seed_games(rounds=14)
+        self.assertEqual(self.ledger(), self.scan_ledger())
+        stats = self.manager.get_achievement_stats(self.org_id)
+        self.assertEqual((stats['big_gold_players'], stats['big_gold_masters'], stats['big_gold_legends']), (1, 1, 1))
+        self.assertEqual((stats['small_gold_players'], stats['small_gold_masters'], stats['gold_loser_players']), (1, 0, 2))
+        self.assertEqual(stats['big_gold_records'], 14)
+        self.assertEqual([p['achievement_count'] for p in
+                          self.manager.get_achievement_approaching_players(self.org_id, 'small_gold_master')], [2])
+
+        with self.manager.get_connection() as conn:
+            first, last = conn.execute('''SELECT MIN(record_id), MAX(record_id) FROM game_records
+                                          WHERE org_id = ? AND special_score = '大金' ''', (self.org_id,)).fetchone()
+            conn.execute("UPDATE game_records SET created_at = '2025-01-01 00:00:00' WHERE record_id = ?", (first,))
+            conn.execute('DELETE FROM player_achievement_counts')
+            sys.modules['app.achievement_rules'].rebuild_achievement_counts(conn.cursor(), self.org_id)
+            conn.commit()
+        for record_id in (first, last):
+            self.manager.delete_game_record(self.org_id, record_id)
+            self.assertEqual(self.ledger(), self.scan_ledger())
+        masters = self.manager.get_achievement_master_players(self.org_id, 'big_gold_legend')
+        self.assertEqual([(p['name'], p['achievement_count']) for p in masters], [('Alice', 12)])
+        self.assertEqual(self.manager.get_negative_achievement_players(self.org_id, 'gold_loser')[0]['defeat_count'], 14)
+
+        self.manager.delete_session(self.org_id, session_id)
+        self.assertEqual(self.ledger(), {})
+        self.assertEqual(self.manager.get_achievement_stats(self.org_id)['small_gold_players'], 0)
+
+    def test_upgrade_backfills_ledger_and_pages_render(self):
+        self.seed_games(rounds=3)
+        with self.manager.get_connection() as conn:
+            conn.execute('DROP TABLE player_achievement_counts')
+            conn.execute("DELETE FROM schema_migrations WHERE version = '20261019_player_achievement_counts'")
+            conn.commit()
+        self.manager = DatabaseManager(self.path)
+        self.assertEqual(self.ledger(), self.scan_ledger())
+        slug = self.org['slug']
+        for page in ('achievements', 'achievement/small_gold', 'achievement/big_gold_master',
+                     'achievement/small_gold_master', 'achievement/big_gold_legend', 'achievement/gold_loser'):
+            self.assertEqual(self.client.get(f'/o/{slug}/{page}').status_code, 200, page)
+        self.assertIn('Alice（3/5）', self.client.get(f'/o/{slug}/achievement/big_gold_master').get_data(as_text=True))
+
+    def test_declared_rule_is_backfilled_and_maintained_incrementally(self):
+        rules = sys.modules['app.achievement_rules']
+        session_id, ids = self.seed_games(rounds=2)
+        rules.RULES['double_eater'] = {'special_scores': ('大金',), 'roles': ('loser2_pk',)}
+        try:
+            with self.manager.get_connection() as conn:
+                rules.rebuild_achievement_counts(conn.cursor(), self.org_id)
+                conn.commit()
+            self.assertEqual(self.manager.get_achievement_stats(self.org_id)['double_eater_players'], 1)
+            self.manager.add_game_record(self.org_id, session_id, ids['Bob'], ids['Alice'], 20, '大金', loser_id2=ids['Dan'])
+            players = self.manager.get_achievement_players(self.org_id, 'double_eater')
+            self.assertEqual([(p['name'], p['achievement_count']) for p in players], [('Carol', 2), ('Dan', 1)])
+            self.assertEqual(len(self.manager.get_achievement_records(self.org_id, 'double_eater', ids['Carol'])), 2)
+        finally:
+            del rules.RULES['double_eater']
+
+    def test_catalog_routes_render_and_unknown_ids_redirect(self):
+        self.seed_games(rounds=1)
+        slug = self.org['slug']
+        routes = sys.modules['app.achievement_routes']
+        for achievement in routes.ACHIEVEMENTS:
+            response = self.client.get(f"/o/{slug}/achievement/{achievement['id']}")
+            self.assertEqual(response.status_code, 200, achievement['id'])
+        self.assertEqual(self.client.get(f'/o/{slug}/achievement/nope').status_code, 302)
+
+    def test_gold_loser_top_opponent_is_keyed_by_player_id(self):
+        ids = {name: self.manager.create_player(self.org_id, name) for name in ('Ann', 'Ben', 'Cid', 'Dee')}
+        session_id = self.manager.create_session(self.org_id, "Gold session")
+        for player_id in ids.values():
+            self.manager.add_player_to_session(self.org_id, session_id, player_id)
+        self.manager.add_game_record(self.org_id, session_id, ids['Ann'], ids['Ben'], 10, '小金')
+        self.manager.add_game_record(self.org_id, session_id, ids['Ann'], ids['Ben'], 10, '小金')
+        self.manager.add_game_record(self.org_id, session_id, ids['Cid'], ids['Ben'], 10, '大金', loser_id2=ids['Dee'])
+        self.manager.add_game_record(self.org_id, session_id, ids['Ann'], ids['Dee'], 10, '小金')
+        self.manager.update_player_name(self.org_id, ids['Ann'], 'Ann Renamed')
+        players = {p['name']: p for p in self.manager.get_negative_achievement_players(self.org_id, 'gold_loser')}
+        self.assertEqual((players['Ben']['defeat_count'], players['Ben']['most_defeated_by'],
+                          players['Ben']['most_defeated_by_id'], players['Ben']['most_defeated_count']),
+                         (3, 'Ann Renamed', ids['Ann'], 2))
+        self.assertEqual((players['Dee']['most_defeated_by_id'], players['Dee']['most_defeated_count']), (ids['Ann'], 1))
+        self.assertIn('被 Ann Renamed 痛击 2 次',
+                      self.client.get(f"/o/{self.org['slug']}/achievement/gold_loser").get_data(as_text=True))
+
+
+class PairStatsTests(ReadPathCase):
+    def scan_pairs(self):
+        """Fold raw game_records into canonical pair counters, used as the oracle."""
+        pairs = {}
+
+        def bump(x, y, counter_x, counter_y=None):
+            if x == y:
+                return
+            a, b = sorted((x, y))
+            entry = pairs.setdefault((a, b), dict.fromkeys(
+                ('gifts_to_a', 'gifts_to_b', 'shared_losses', 'shared_wins', 'a_wins', 'b_wins'), 0))
+            entry[counter_x if a == x or counter_y is None else counter_y] += 1
+
+        with self.manager.get_connection() as conn:
+            rows = conn.execute('SELECT * FROM game_records WHERE org_id = ?', (self.org_id,)).fetchall()
+        for r in rows:
+            winners = [pk for pk in (r['winner_pk'], r['winner2_pk']) if pk]
+            losers = [pk for pk in (r['loser_pk'], r['loser2_pk']) if pk]
+            for w in winners:
+                for l in losers:
+                    bump(w, l, 'a_wins', 'b_wins')
+            if r['score'] == 1:
+                bump(r['winner_pk'], r['loser_pk'], 'gifts_to_a', 'gifts_to_b')
+            if len(winners) == 2:
+                bump(*winners, 'shared_wins')
+            if len(losers) == 2:
+                bump(*losers, 'shared_losses')
+        return pairs
+
+    def stored_pairs(self):
+        with self.manager.get_connection() as conn:
+            rows = conn.execute('SELECT * FROM player_pair_stats WHERE org_id = ?', (self.org_id,)).fetchall()
+        return {(r['player_a_pk'], r['player_b_pk']): {k: r[k] for k in r.keys()
+                                                       if k not in ('org_id', 'player_a_pk', 'player_b_pk')}
+                for r in rows}
+
+    def test_write_paths_keep_pair_counters_in_sync(self):
+        session_id, ids = self.seed_games(rounds=3)
+        self.assertEqual(self.stored_pairs(), self.scan_pairs())
+        buddies = {r['player_name']: (r['buddy_name'], r['gift_count']) for r in self.manager.get_best_buddy_stats(self.org_id)}
+        self.assertEqual(buddies, {'Alice': ('Bob', 1), 'Bob': ('Alice', 3)})
+        duos = self.manager.get_duo_loser_stats(self.org_id)
+        self.assertEqual([({d['player1_name'], d['player2_name']}, d['duo_count']) for d in duos], [({'Bob', 'Carol'}, 3)])
+
+        for record in self.manager.get_session_records(self.org_id, session_id)[:5]:
+            self.manager.delete_game_record(self.org_id, record['record_id'])
+            self.assertEqual(self.stored_pairs(), self.scan_pairs())
+        self.manager.delete_session(self.org_id, session_id)
+        self.assertEqual(self.stored_pairs(), {})
+        self.assertEqual(self.manager.get_best_buddy_stats(self.org_id), [])
+
+    def test_duplicate_players_are_rejected_and_never_paired_with_themselves(self):
+        session_id, ids = self.seed_games(rounds=1)
+        a, b = ids['Alice'], ids['Bob']
+        self.assertIsNone(self.manager.add_game_record(self.org_id, session_id, a, b, 20, '大金', loser_id2=b))
+        self.assertIsNone(self.manager.add_game_record(self.org_id, session_id, a, b, 8, winner_id2=a))
+        self.assertEqual(self.stored_pairs(), self.scan_pairs())
+
+        # Legacy rows written before the check can still name the same loser twice.
+        with self.manager.get_connection() as conn:
+            conn.execute('''INSERT INTO game_records (org_id, session_id, winner_id, loser_id, loser_id2, score,
+                                                     special_score, created_at, created_epoch)
+                            VALUES (?, ?, ?, ?, ?, 20, '大金', '2026-01-01T00:00:00Z', 0)''',
+                         (self.org_id, session_id, a, b, b))
+            fill_record_keys(conn.cursor())
+            rebuild_pair_stats(conn.cursor(), self.org_id)
+            conn.commit()
+            record_id = conn.execute('SELECT MAX(record_id) FROM game_records').fetchone()[0]
+        self.assertEqual(self.stored_pairs(), self.scan_pairs())
+        self.manager.delete_game_record(self.org_id, record_id)
+        self.assertEqual(self.stored_pairs(), self.scan_pairs())
+
+    def test_upgrade_backfills_pair_counters(self):
+        self.seed_games(rounds=2)
+        with self.manager.get_connection() as conn:
+            conn.execute('DROP TABLE player_pair_stats')
+            conn.execute("DELETE FROM schema_migrations WHERE version = '20261019_player_pair_stats'")
+            conn.commit()
+        self.manager = DatabaseManager(self.path)
+        self.assertEqual(self.stored_pairs(), self.scan_pairs())
+        for page in ('best_buddy', 'duo_loser'):
+            self.assertEqual(self.client.get(f"/o/{self.org['slug']}/achievement/{page}").status_code, 200)
+
+
+class QueryCacheTests(ReadPathCase):
+    def enable_cache(self, **options):
+        self.manager.query_cache.configure(enabled=True, **options)
+        return self.manager.query_cache
+
+    def test_cache_is_disabled_under_testing_by_default(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('QUERY_CACHE_ENABLED', None)
+            manager = wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path}).extensions['database']
+        self.assertFalse(manager.query_cache.enabled)
+        self.seed_games(rounds=2)
+        manager.get_achievement_stats(self.org_id)
+        self.assertEqual(manager.query_cache.stats()['size'], 0)
+
+    def test_writes_advance_org_version_and_results_are_copies(self):
+        cache = self.enable_cache()
+        session_id, ids = self.seed_games(rounds=7)
+        board = self.manager.get_global_leaderboard(self.org_id)
+        board[0]['name'] = 'mutated'
+        self.assertEqual(self.manager.get_global_leaderboard(self.org_id)[0]['name'], 'Alice')
+        stats = self.manager.get_achievement_stats(self.org_id)
+        self.assertEqual(self.manager.get_achievement_stats(self.org_id), stats)
+        self.assertEqual(cache.stats()['methods']['get_global_leaderboard'], {'hits': 1, 'shared_hits': 0, 'misses': 1, 'coalesced': 0})
+        self.assertEqual(cache.stats()['methods']['get_achievement_stats'], {'hits': 1, 'shared_hits': 0, 'misses': 1, 'coalesced': 0})
+
+        self.manager.add_game_record(self.org_id, session_id, ids['Bob'], ids['Alice'], 20, '大金')
+        self.assertEqual(self.manager.get_achievement_stats(self.org_id)['big_gold_records'],
+                         stats['big_gold_records'] + 1)
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), set())
+        self.manager.retire_player(self.org_id, ids['Dan'])
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), {ids['Dan']})
+
+        other = self.manager.create_organization('Other Org', 'pbkdf2:sha256:600000$test$hash')
+        self.manager.get_achievement_stats(self.org_id)
+        self.manager.create_player(other['org_id'], 'Eve')
+        self.manager.get_achievement_stats(self.org_id)
+        self.assertEqual(cache.stats()['methods']['get_achievement_stats']['hits'], 2)
+
+    def test_tournament_writes_invalidate_cached_listing(self):
+        self.enable_cache()
+        rounds = [{'name': '决赛', 'best_of': 3}]
+        with self.app.app_context():
+            self.assertEqual(tournament.list_tournaments(self.org_id), [])
+            tid = tournament.create_tournament(self.org_id, 'Cup', rounds)
+            self.assertEqual([t['tournament_id'] for t in tournament.list_tournaments(self.org_id)], [tid])
+            tournament.delete_tournament(self.org_id, tid)
+            self.assertEqual(tournament.list_tournaments(self.org_id), [])
+        self.assertEqual(self.manager.query_cache.stats()['methods']['list_tournaments']['hits'], 0)
+
+    def test_writes_through_other_managers_and_raw_sql_are_seen(self):
+        cache = self.enable_cache()
+        _, ids = self.seed_games(rounds=1)
+        worker = DatabaseManager(self.path)
+        worker.query_cache.configure(enabled=True)
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), set())
+        self.assertEqual(worker.get_retired_player_ids(self.org_id), set())
+        worker.retire_player(self.org_id, ids['Dan'])
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), {ids['Dan']})
+        with self.manager.get_connection() as conn:
+            conn.execute('UPDATE players SET is_retired = 0 WHERE player_id = ?', (ids['Dan'],))
+            conn.commit()
+        self.assertEqual(worker.get_retired_player_ids(self.org_id), set())
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_version_is_read_once_per_request_and_forgotten_after_writes(self):
+        self.enable_cache()
+        _, ids = self.seed_games(rounds=1)
+        with self.app.test_request_context():
+            version = self.manager.org_version(self.org_id)
+            with self.manager.get_connection() as conn:
+                conn.execute('UPDATE players SET is_retired = 1 WHERE player_id = ?', (ids['Dan'],))
+                conn.commit()
+            self.assertEqual(self.manager.org_version(self.org_id), version)
+            self.manager.comeback_player(self.org_id, ids['Dan'])
+            self.assertEqual(self.manager.org_version(self.org_id), version + 2)
+
+    def test_shared_tier_serves_other_workers(self):
+        shared_path = str(Path(self.tmp.name) / "shared-cache.db")
+        self.enable_cache(shared_path=shared_path)
+        self.seed_games(rounds=3)
+        worker = DatabaseManager(self.path)
+        worker.query_cache.configure(enabled=True, shared_path=shared_path)
+        expected = self.manager.get_honor_roll_stats(self.org_id)
+        self.assertEqual(worker.get_honor_roll_stats(self.org_id), expected)
+        self.assertEqual(worker.query_cache.stats()['methods']['get_honor_roll_stats'],
+                         {'hits': 0, 'shared_hits': 1, 'misses': 0, 'coalesced': 0})
+        self.manager.create_player(self.org_id, 'Eve')
+        worker.get_honor_roll_stats(self.org_id)
+        self.assertEqual(worker.query_cache.stats()['methods']['get_honor_roll_stats']['misses'], 1)
+
+    def test_concurrent_misses_share_one_computation(self):
+        cache = self.enable_cache()
+        release, calls, results = threading.Event(), [], []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'board': [1, 2, 3]}
+
+        def reader():
+            results.append(cache.fetch('heavy', self.org_id, 1, (), compute))
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['coalesced'] < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'board': [1, 2, 3]}] * 4)
+        self.assertEqual(len({id(result) for result in results}), 4)
+        self.assertEqual(cache.stats()['methods']['heavy'],
+                         {'hits': 0, 'shared_hits': 0, 'misses': 1, 'coalesced': 3})
+        self.assertEqual(cache.stats()['inflight'], 0)
+
+        def failing():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            cache.fetch('heavy', self.org_id, 2, (), failing)
+        self.assertEqual(cache.fetch('heavy', self.org_id, 2, (), lambda: 'ok'), 'ok')
+
+    def test_cache_stats_endpoint_requires_super_admin(self):
+        url = f"/o/{self.org['slug']}/admin/cache-stats"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.client.session_transaction() as sess:
+            sess['super_admin_authenticated'] = True
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('coalesced', response.get_json())
+
+    def test_lru_bound_and_ttl_expiry(self):
+        cache = self.enable_cache(max_entries=2, default_ttl=0)
+        self.seed_games(rounds=1)
+        for kind in ('small_gold', 'big_gold', 'gold_loser'):
+            self.manager.get_achievement_players(self.org_id, kind)
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.manager.get_achievement_players(self.org_id, 'gold_loser')
+        self.assertEqual(cache.stats()['methods']['get_achievement_players'], {'hits': 0, 'shared_hits': 0, 'misses': 4, 'coalesced': 0})
+        cache.configure(default_ttl=300)
+        self.manager.get_achievement_players(self.org_id, 'gold_loser')
+        self.manager.get_achievement_players(self.org_id, 'gold_loser')
+        self.assertEqual(cache.stats()['methods']['get_achievement_players']['hits'], 1)
+
+
+class PageCacheTests(ReadPathCase):
+    def setUp(self):
+        super().setUp()
+        self.pages = self.app.extensions['page_cache']
+        self.pages.enabled = True
+
+    def get(self, path):
+        return self.client.get(f"/o/{self.org['slug']}{path}")
+
+    def test_stale_page_is_served_then_refreshed_in_background(self):
+        session_id, ids = self.seed_games(rounds=2)
+        first = self.get('/history')
+        self.assertEqual(first.headers['X-Cache-Status'], 'MISS')
+        self.assertEqual(self.get('/history').headers['X-Cache-Status'], 'HIT')
+        self.manager.create_player(self.org_id, 'Zed')
+        self.manager.add_game_record(self.org_id, session_id, ids['Carol'], ids['Bob'], 3)
+        stale = self.get('/history')
+        self.assertEqual(stale.headers['X-Cache-Status'], 'STALE')
+        self.assertEqual(stale.get_data(), first.get_data())
+        self.assertIn('X-Cache-Stale-Seconds', stale.headers)
+        self.assertTrue(self.pages.wait_idle(5))
+        fresh = self.get('/history')
+        self.assertEqual(fresh.headers['X-Cache-Status'], 'HIT')
+        self.assertNotEqual(fresh.get_data(), first.get_data())
+        self.assertEqual(self.pages.stats()['refreshes'], 1)
+
+    def test_staleness_limit_admins_and_query_args(self):
+        self.seed_games(rounds=1)
+        self.assertEqual(self.get('/achievements').headers['X-Cache-Status'], 'MISS')
+        self.assertEqual(self.get('/achievement/honor_roll').headers['X-Cache-Status'], 'MISS')
+        self.assertEqual(self.get('/history?month=2000-01').headers['X-Cache-Status'], 'MISS')
+        self.manager.create_player(self.org_id, 'Zed')
+        key = next(key for key in self.pages._pages if key[0] == 'tenant.achievements')
+        self.pages._pages[key].stale_since = 0
+        self.assertEqual(self.get('/achievements').headers['X-Cache-Status'], 'MISS')
+        with self.client.session_transaction() as sess:
+            sess['organization_admin_org_id'] = self.org_id
+        response = self.get('/achievements')
+        self.assertNotIn('X-Cache-Status', response.headers)
+        self.assertEqual(self.pages.stats()['bypassed'], 1)
+
+
+class FragmentCacheTests(ReadPathCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = MemoryFragmentBackend(max_bytes=256 * 1024)
+        self.bytecode_dir = str(Path(self.tmp.name) / "jinja-bytecode")
+        self.app = wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path, 'SECRET_KEY': 'test',
+                                    'FRAGMENT_CACHE_BACKEND': self.backend,
+                                    'JINJA_BYTECODE_CACHE_DIR': self.bytecode_dir})
+        self.client = self.app.test_client()
+
+    def get(self, path, org=None):
+        return self.client.get(f"/o/{(org or self.org)['slug']}{path}").get_data(as_text=True)
+
+    def test_session_cards_and_leaderboard_are_reused_until_a_write(self):
+        session_id, ids = self.seed_games(rounds=2)
+        first = self.get('/history')
+        misses = self.backend.stats()['misses']
+        self.assertGreaterEqual(misses, 2)
+        self.assertEqual(self.get('/history'), first)
+        self.assertEqual(self.backend.stats()['hits'], misses)
+        self.manager.update_player_name(self.org_id, ids['Alice'], 'Alicia')
+        fresh = self.get('/history')
+        self.assertIn('Alicia', fresh)
+        self.assertNotIn('>Alice<', fresh)
+        self.get('/')
+        self.assertTrue(any(name.endswith('.cache') for name in os.listdir(self.bytecode_dir)))
+
+    def test_fragments_are_isolated_per_organization(self):
+        self.seed_games(rounds=1)
+        other = self.manager.create_organization('Other Org', 'pbkdf2:sha256:600000$test$hash')
+        self.assertIn('Alice', self.get('/history'))
+        self.assertNotIn('Alice', self.get('/history', other))
+
+    def test_bracket_fragment_follows_match_results(self):
+        names = ('Alice', 'Bob', 'Carol', 'Dan')
+        ids = [self.manager.create_player(self.org_id, name) for name in names]
+        with self.app.app_context():
+            tid = tournament.create_tournament(self.org_id, 'Cup', [{'name': '半决赛', 'best_of': 1},
+                                                                    {'name': '决赛', 'best_of': 1}])
+            for player_id in ids:
+                tournament.add_participant(self.org_id, tid, player_id)
+            tournament.generate_bracket(self.org_id, tid)
+            match_id = tournament.get_bracket(self.org_id, tid)[0][0]['match_id']
+        before = self.get(f'/tournament/{tid}')
+        self.assertEqual(self.get(f'/tournament/{tid}'), before)
+        with self.app.app_context():
+            tournament.record_match_game(self.org_id, match_id, 1)
+        self.assertIn('1/2', self.get(f'/tournament/{tid}'))
+        self.assertNotIn('1/2', before)
+
+
+class RequestLoaderTests(ReadPathCase):
+    def test_lookups_are_memoized_batched_and_dropped_after_writes(self):
+        session_id, ids = self.seed_games(rounds=1)
+        loose = [self.manager.create_player(self.org_id, name) for name in ('Eve', 'Finn', 'Gus')]
+        with mock.patch.object(self.manager, 'get_session_with_players',
+                               wraps=self.manager.get_session_with_players) as sessions, \
+             mock.patch.object(self.manager, 'get_player_names', wraps=self.manager.get_player_names) as names, \
+             self.app.test_request_context():
+            g.organization = self.org
+            loader = request_loader()
+            self.assertIs(loader.session(session_id), loader.session(session_id))
+            self.assertEqual(loader.player_id('Alice'), ids['Alice'])
+            self.assertEqual(loader.player_name(ids['Bob']), 'Bob')
+            loader.player_names.defer(*loose)
+            self.assertEqual(loader.player_name(loose[0]), 'Eve')
+            self.assertEqual(loader.player_names.load_many(loose), ['Eve', 'Finn', 'Gus'])
+            self.assertEqual((sessions.call_count, names.call_count), (1, 1))
+            self.manager.update_player_name(self.org_id, ids['Alice'], 'Alicia')
+            self.assertEqual(loader.session(session_id)['players_with_ids'][0]['name'], 'Alicia')
+            self.assertEqual(sessions.call_count, 2)
+            self.assertIsNone(loader.player_id('Nobody'))
+
+    def test_game_and_session_pages_load_the_session_once(self):
+        session_id, ids = self.seed_games(rounds=1)
+        slug = self.org['slug']
+        with mock.patch.object(self.manager, 'get_session_with_players',
+                               wraps=self.manager.get_session_with_players) as sessions, \
+             mock.patch.object(self.manager, 'get_player_by_name', wraps=self.manager.get_player_by_name) as by_name:
+            self.assertEqual(self.client.get(f"/o/{slug}/game/{session_id}").status_code, 200)
+            self.assertEqual(self.client.get(f"/o/{slug}/session_detail/{session_id}").status_code, 200)
+            response = self.client.post(f"/o/{slug}/add_score/{session_id}",
+                                        data={'winner': 'Alice', 'loser': 'Bob', 'score': '3'})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(sessions.call_count, 3)
+        self.assertEqual(by_name.call_count, 0)
+        self.assertEqual(self.client.get(f"/o/{slug}/player/{ids['Alice']}").status_code, 200)
+        self.assertEqual(self.client.get(f"/o/{slug}/player/missing").status_code, 404)
+
+
+class PlayerDirectoryTests(ReadPathCase):
+    def test_identity_lookups_follow_player_writes_from_any_manager(self):
+        session_id, ids = self.seed_games(rounds=1)
+        directory = self.manager.player_directory
+        snapshot = directory.get(self.org_id)
+        self.assertEqual(self.manager.get_player_by_name(self.org_id, ' alice '), ids['Alice'])
+        self.assertEqual(self.manager.get_player_name(self.org_id, ids['Bob']), 'Bob')
+        self.assertEqual(self.manager.get_player_by_id(self.org_id, ids['Carol'])['name'], 'Carol')
+        self.assertIsNone(self.manager.get_player_by_id(self.org_id, 'missing'))
+
+        self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Bob'], 2)
+        self.assertIs(directory.get(self.org_id), snapshot)
+
+        worker = DatabaseManager(self.path)
+        worker.update_player_name(self.org_id, ids['Alice'], 'Alicia')
+        worker.retire_player(self.org_id, ids['Dan'])
+        self.assertIsNone(self.manager.get_player_by_name(self.org_id, 'Alice'))
+        self.assertEqual(self.manager.get_player_by_name(self.org_id, 'alicia'), ids['Alice'])
+        self.assertTrue(self.manager.is_player_retired(self.org_id, ids['Dan']))
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), {ids['Dan']})
+        worker.comeback_player(self.org_id, ids['Dan'])
+        eve = worker.create_player(self.org_id, 'Eve')
+        self.assertEqual(self.manager.get_retired_player_ids(self.org_id), set())
+        self.assertEqual(self.manager.get_player_names(self.org_id, [eve, 'missing']), {eve: 'Eve'})
+
+    def test_directory_is_loaded_once_per_request(self):
+        _, ids = self.seed_games(rounds=1)
+        with self.app.test_request_context(), \
+             mock.patch.object(self.manager, 'get_connection', wraps=self.manager.get_connection) as connections:
+            for name in ('Alice', 'Bob', 'Carol', 'Dan'):
+                self.manager.get_player_by_name(self.org_id, name)
+                self.manager.is_player_retired(self.org_id, ids[name])
+            self.assertEqual(connections.call_count, 2)
+
+
+class BadgeServiceTests(ReadPathCase):
+    def test_badge_map_follows_gold_records_and_retirement(self):
+        session_id, ids = self.seed_games(rounds=1)
+        service = self.manager.badges
+        snapshot = service.get(self.org_id)
+        self.assertEqual(snapshot.css_class(ids['Alice']), ' has-big-gold')
+        self.assertEqual(snapshot.css_class(ids['Bob']), '')
+        self.assertIsNone(snapshot.of(ids['Alice'])['rank'])
+
+        self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Bob'], 2)
+        self.assertIs(service.get(self.org_id), snapshot)
+
+        worker = DatabaseManager(self.path)
+        worker.add_game_record(self.org_id, session_id, ids['Bob'], ids['Carol'], 5, '小金')
+        worker.retire_player(self.org_id, ids['Alice'])
+        self.assertEqual(service.get(self.org_id).css_class(ids['Bob']), ' has-small-gold')
+        self.assertEqual(service.get(self.org_id).of(ids['Alice']),
+                         {'has_small_gold': False, 'has_big_gold': True, 'is_retired': True, 'rank': None})
+        self.assertEqual(self.manager.get_players_special_wins_batch(self.org_id, [ids['Bob'], ids['Dan']]),
+                         {ids['Bob']: {'has_small_gold': True, 'has_big_gold': False},
+                          ids['Dan']: {'has_small_gold': False, 'has_big_gold': False}})
+
+        for _ in range(4):
+            worker.add_game_record(self.org_id, session_id, ids['Alice'], ids['Dan'], 10, '大金')
+        self.assertEqual(service.get(self.org_id).of(ids['Alice'])['rank'], 'big_gold_master')
+
+    def test_second_winner_of_gold_record_gets_badge_but_no_ledger_count(self):
+        session_id, ids = self.seed_games(rounds=1)
+        service = self.manager.badges
+        self.assertEqual(service.get(self.org_id).css_class(ids['Dan']), '')
+        record_id = self.manager.add_game_record(self.org_id, session_id, ids['Carol'], ids['Alice'], 8, '小金',
+                                                 winner_id2=ids['Dan'])
+        self.assertEqual(service.get(self.org_id).css_class(ids['Dan']), ' has-small-gold')
+        self.assertEqual(self.manager.get_players_special_wins_batch(self.org_id, [ids['Dan']]),
+                         {ids['Dan']: {'has_small_gold': True, 'has_big_gold': False}})
+        with self.manager.get_connection() as conn:
+            kinds = conn.execute('''SELECT c.kind FROM player_achievement_counts c
+                                    JOIN players p ON p.player_pk = c.player_pk WHERE p.player_id = ?''',
+                                 (ids['Dan'],)).fetchall()
+        self.assertEqual(kinds, [])
+
+        self.manager.delete_game_record(self.org_id, record_id)
+        self.assertEqual(service.get(self.org_id).css_class(ids['Dan']), '')
+
+    def test_pages_and_load_more_use_badge_map(self):
+        session_id, ids = self.seed_games(rounds=1)
+        self.manager.retire_player(self.org_id, ids['Dan'])
+        page = self.client.get(f"/o/{self.org['slug']}/session_detail/{session_id}").get_data(as_text=True)
+        self.assertIn('class="player-link has-big-gold">Alice</a>', page)
+        self.assertIn('class="player-link retired">Dan</a>', page)
+        payload = self.client.get(f"/o/{self.org['slug']}/api/load_more_sessions?offset=0").get_json()
+        self.assertEqual(payload['badge_classes'], {ids['Alice']: ' has-big-gold', ids['Dan']: ' retired'})
+
+
+class WarmupTests(ReadPathCase):
+    def test_warmup_preloads_active_orgs_and_reports_readiness(self):
+        session_id, ids = self.seed_games(rounds=1)
+        self.assertEqual(self.client.get('/ready').status_code, 503)
+        self.app.config['WARMUP_ENABLED'] = True
+        warmup = start_warmup(self.app)
+        self.assertTrue(warmup.wait(10))
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual(report['status'], 'ready')
+        self.assertEqual(report['orgs'], 1)
+        self.assertEqual([step['step'] for step in report['steps']],
+                         [f'template:{name}' for name in HOT_TEMPLATES] + ['orgs', f'org:{self.org_id}'])
+        with mock.patch.object(self.manager, 'get_connection', wraps=self.manager.get_connection) as connections:
+            self.assertEqual(self.manager.badges.get(self.org_id).css_class(ids['Alice']), ' has-big-gold')
+            self.assertEqual(connections.call_count, 1)
+
+    def test_budget_and_disabled_warmup_still_become_ready(self):
+        self.app.config.update(WARMUP_ENABLED=True)
+        self.app.extensions['warmup'].budget = 0
+        self.assertEqual(start_warmup(self.app, background=False).report()['status'], 'timeout')
+        self.assertEqual(self.client.get('/ready').status_code, 200)
+        self.app.config['WARMUP_ENABLED'] = None
+        self.assertEqual(start_warmup(self.app).status, 'skipped')
+
+
+class StartupTests(ReadPathCase):
+    def test_boot_skips_diagnostic_reads_and_reports_phase_timings(self):
+        with mock.patch.object(DatabaseManager, 'get_all_players', autospec=True) as players:
+            app = wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path, 'SECRET_KEY': 'test'})
+            players.assert_not_called()
+            wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path, 'SECRET_KEY': 'test',
+                             'STARTUP_DIAGNOSTICS': True})
+            players.assert_called()
+        startup = app.test_client().get('/ready').get_json()['startup']
+        self.assertCountEqual(startup['phases'], ['config', 'database', 'caches', 'init_data', 'routes'])
+        self.assertGreaterEqual(startup['imports'], 0)
+
+    def test_importing_the_entry_point_is_lazy(self):
+        script = (
+            "import importlib.util, sys\n"
+            "spec = importlib.util.spec_from_file_location('entry', 'app.py')\n"
+            "module = importlib.util.module_from_spec(spec)\n"
+            "spec.loader.exec_module(module)\n"
+            "assert module._application is None\n"
+            "module.create_app({'TESTING': True, 'DATABASE_PATH': sys.argv[1]})\n"
+            "assert 'pypinyin' not in sys.modules\n"
+        )
+        subprocess.run([sys.executable, '-c', script, str(Path(self.tmp.name) / 'lazy.db')],
+                       cwd=ROOT, check=True, capture_output=True)
+
+
+class MigrationRunnerTests(ReadPathCase):
+    def test_current_database_boots_with_one_read(self):
+        tenancy = sys.modules['app.tenancy']
+        with mock.patch.object(tenancy.sqlite3, 'connect', wraps=tenancy.sqlite3.connect) as connect, \
+             mock.patch.object(tenancy, '_migration_lock') as lock:
+            DatabaseManager(self.path)
+        self.assertEqual(connect.call_count, 1)
+        lock.assert_not_called()
+
+    def test_concurrent_workers_apply_each_migration_once(self):
+        tenancy = sys.modules['app.tenancy']
+        path = str(Path(self.tmp.name) / "fresh.db")
+        errors = []
+
+        def boot():
+            try:
+                tenancy.initialize_database(path)
+            except Exception as error:  # pragma: no cover - reported below
+                errors.append(error)
+
+        workers = [threading.Thread(target=boot) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        with DatabaseManager(path).get_connection() as conn:
+            rows = conn.execute('SELECT version, COUNT(*) FROM schema_migrations GROUP BY version').fetchall()
+        self.assertEqual(len(rows), len(tenancy._SCHEMA_UPGRADES) + 1)
+        self.assertTrue(all(count == 1 for _, count in rows))
+
+    def test_legacy_split_records_and_round_names_are_migrated(self):
+        session_id, ids = self.seed_games(rounds=1)
+        with self.app.app_context():
+            tournament_id = tournament.create_tournament(self.org_id, 'Cup', [{'name': '1/4 决赛', 'best_of': 3}])
+        with self.manager.get_connection() as conn:
+            conn.execute('DELETE FROM game_records WHERE org_id = ?', (self.org_id,))
+            conn.commit()
+        first = self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Bob'], 10)
+        second = self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Carol'], 10)
+        with self.manager.get_connection() as conn:
+            conn.execute("UPDATE game_records SET special_score_part = '1/2 (总分20)' WHERE record_id = ?", (first,))
+            conn.execute("UPDATE game_records SET special_score_part = '2/2 (总分20)' WHERE record_id = ?", (second,))
+            conn.execute('DELETE FROM schema_migrations WHERE version IN (?, ?)',
+                         (sys.modules['app.tenancy'].ROUND_NAMES_MIGRATION_VERSION,
+                          sys.modules['app.tenancy'].SPLIT_SPECIAL_RECORDS_MIGRATION_VERSION))
+            conn.commit()
+        upgraded = DatabaseManager(self.path)
+        records = upgraded.get_session_records(self.org_id, session_id)
+        self.assertEqual([(r['record_id'], r['score'], r['special_score'], r['loser_id2']) for r in records],
+                         [(first, 20, '大金', ids['Carol'])])
+        self.assertEqual(upgraded.get_player_special_wins(self.org_id, ids['Alice']),
+                         {'has_small_gold': False, 'has_big_gold': True})
+        with upgraded.get_connection() as conn:
+            self.assertEqual(conn.execute('SELECT round_name FROM tournament_rounds WHERE tournament_id = ?',
+                                          (tournament_id,)).fetchone()[0], '8进4')
+
+    def test_unused_org_pk_is_dropped_from_existing_databases(self):
+        tenancy = sys.modules['app.tenancy']
+        with self.manager.get_connection() as conn:
+            self.assertNotIn('org_pk', {row[1] for row in conn.execute('PRAGMA table_info(organizations)')})
+        self.seed_games(rounds=1)
+        with self.manager.get_connection() as conn:
+            conn.execute('PRAGMA foreign_keys = OFF')
+            conn.executescript('''
+                CREATE TABLE organizations__keyed (
+                    org_pk INTEGER PRIMARY KEY, org_id TEXT NOT NULL UNIQUE, slug TEXT NOT NULL UNIQUE,
+                    name TEXT NOT NULL, name_key TEXT NOT NULL UNIQUE, admin_password_hash TEXT,
+                    created_at TEXT NOT NULL, updated_at TEXT NOT NULL);
+                INSERT INTO organizations__keyed (org_id, slug, name, name_key, admin_password_hash, created_at,
+                                                  updated_at)
+                    SELECT org_id, slug, name, name_key, admin_password_hash, created_at, updated_at
+                    FROM organizations;
+                DROP TABLE organizations;
+                ALTER TABLE organizations__keyed RENAME TO organizations;
+            ''')
+            conn.execute('DELETE FROM schema_migrations WHERE version = ?', (tenancy.DROP_ORG_PK_MIGRATION_VERSION,))
+            conn.commit()
+        upgraded = DatabaseManager(self.path)
+        with upgraded.get_connection() as conn:
+            self.assertNotIn('org_pk', {row[1] for row in conn.execute('PRAGMA table_info(organizations)')})
+            self.assertEqual(conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual(upgraded.get_organization_by_slug(self.org['slug'])['org_id'], self.org_id)
+        self.assertEqual(len(upgraded.get_all_players(self.org_id)), 4)
+
+    def test_split_record_migration_leaves_merged_records_alone(self):
+        session_id, ids = self.seed_games(rounds=1)
+        with self.manager.get_connection() as conn:
+            conn.execute('DELETE FROM game_records WHERE org_id = ?', (self.org_id,))
+            conn.commit()
+        merged = self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Bob'], 20, '大金',
+                                              loser_id2=ids['Carol'])
+        second = self.manager.add_game_record(self.org_id, session_id, ids['Alice'], ids['Dan'], 10)
+        with self.manager.get_connection() as conn:
+            conn.execute("UPDATE game_records SET special_score_part = '1/2 (总分20)' WHERE record_id = ?", (merged,))
+            conn.execute("UPDATE game_records SET special_score_part = '2/2 (总分20)' WHERE record_id = ?", (second,))
+            conn.execute('DELETE FROM schema_migrations WHERE version = ?',
+                         (sys.modules['app.tenancy'].SPLIT_SPECIAL_RECORDS_MIGRATION_VERSION,))
+            conn.commit()
+        records = DatabaseManager(self.path).get_session_records(self.org_id, session_id)
+        self.assertEqual([(r['record_id'], r['score'], r['loser_id'], r['loser_id2']) for r in records],
+                         [(second, 10, ids['Dan'], None), (merged, 20, ids['Bob'], ids['Carol'])])
+
+    def test_split_record_migration_skips_malformed_markers(self):
+        session_id, ids = self.seed_games(rounds=1)
+        with self.manager.get_connection() as conn:
+            conn.execute('DELETE FROM game_records WHERE org_id = ?', (self.org_id,))
+            conn.commit()
+        parts = ('1/2 (总分abc)', '2/2 (总分abc)', '1/2 (总分20) x', '2/2 (总分20) x')
+        record_ids = [self.manager.add_game_record(self.org_id, session_id, ids['Alice'], loser, 10)
+                      for loser in (ids['Bob'], ids['Carol'], ids['Bob'], ids['Carol'])]
+        with self.manager.get_connection() as conn:
+            conn.executemany('UPDATE game_records SET special_score_part = ? WHERE record_id = ?',
+                             list(zip(parts, record_ids)))
+            conn.execute('DELETE FROM schema_migrations WHERE version = ?',
+                         (sys.modules['app.tenancy'].SPLIT_SPECIAL_RECORDS_MIGRATION_VERSION,))
+            conn.commit()
+        records = DatabaseManager(self.path).get_session_records(self.org_id, session_id)
+        self.assertEqual(sorted((r['record_id'], r['score'], r['loser_id2']) for r in records),
+                         [(record_id, 10, None) for record_id in record_ids])
+
+
+SESSION_PLAYER_KEYS = online_migrations.OnlineMigration(
+    '20261019_test_session_player_keys', 'session_players', 'id',
+    """CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, org_id TEXT NOT NULL, session_id TEXT NOT NULL,
+        player_id TEXT NOT NULL, score INTEGER NOT NULL DEFAULT 0, player_pk INTEGER NOT NULL,
+        UNIQUE (org_id, session_id, player_id),
+        FOREIGN KEY (org_id, session_id) REFERENCES sessions (org_id, session_id) ON DELETE CASCADE,
+        FOREIGN KEY (org_id, player_id) REFERENCES players (org_id, player_id),
+        FOREIGN KEY (player_pk) REFERENCES players (player_pk)
+    )""",
+    ('id', 'org_id', 'session_id', 'player_id', 'score', 'player_pk'),
+    ('id', 'org_id', 'session_id', 'player_id', 'score',
+     '(SELECT p.player_pk FROM players p WHERE p.org_id = session_players.org_id '
+     'AND p.player_id = session_players.player_id)'),
+    indexes=('CREATE INDEX idx_session_players_player_pk ON session_players (player_pk)',),
+)
+
+
+class OnlineMigrationTests(ReadPathCase):
+    def session_players(self, columns='id, session_id, player_id, score'):
+        with self.manager.get_connection() as conn:
+            return [tuple(row) for row in conn.execute(f'SELECT {columns} FROM session_players ORDER BY id')]
+
+    def test_backfill_dual_writes_and_switch_preserve_rows_indexes_and_triggers(self):
+        session_id, ids = self.seed_games(rounds=1)
+        other = self.manager.create_session(self.org_id, 'Second')
+        for player_id in ids.values():
+            self.manager.add_player_to_session(self.org_id, other, player_id)
+        conn = online_migrations._connect(self.path)
+        try:
+            self.assertEqual(online_migrations.prepare(conn, SESSION_PLAYER_KEYS)['total'], 8)
+            progress = online_migrations.copy_chunk(conn, SESSION_PLAYER_KEYS, chunk_size=3)
+            self.assertEqual((progress['status'], progress['copied']), ('backfilling', 3))
+            # 回填中途的计分、新加入与删除经双写触发器进入影子表
+            eve = self.manager.create_player(self.org_id, 'Eve')
+            self.manager.add_player_to_session(self.org_id, session_id, eve)
+            self.manager.add_game_record(self.org_id, session_id, eve, ids['Alice'], 5)
+            self.manager.add_game_record(self.org_id, other, ids['Dan'], ids['Carol'], 3)
+            self.manager.delete_session(self.org_id, other)
+            version = self.manager.org_version(self.org_id)
+        finally:
+            conn.close()
+        expected = self.session_players()
+        self.assertEqual(online_migrations.run_online_migration(self.path, SESSION_PLAYER_KEYS, chunk_size=3)['status'],
+                         'switched')
+        self.assertEqual(self.session_players(), expected)
+        self.assertEqual(self.session_players('player_id, player_pk'),
+                         [(row[2], self.manager.player_directory.find(self.org_id, row[2]).player_pk) for row in expected])
+        with self.manager.get_connection() as conn:
+            names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'session_players'")}
+            self.assertEqual(conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertTrue({'idx_session_players_org_session', 'idx_session_players_player_pk',
+                         'trg_session_players_update_cache_version'} <= names)
+        self.assertFalse(any(name.endswith('_online_copy') for name in names))
+        self.manager.update_player_score(self.org_id, session_id, eve, 1)
+        self.assertGreater(self.manager.org_version(self.org_id), version)
+        self.assertEqual(self.client.get(f"/o/{self.org['slug']}/session_detail/{session_id}").status_code, 200)
+
+    def test_background_runner_resumes_and_reports_progress(self):
+        self.seed_games(rounds=1)
+        stopped = online_migrations.OnlineMigrator(self.path, [SESSION_PLAYER_KEYS], chunk_size=1, pause=0)
+        stopped.stop()
+        stopped.run()
+        self.assertEqual(stopped.status, 'stopped')
+        conn = online_migrations._connect(self.path)
+        try:
+            online_migrations.copy_chunk(conn, SESSION_PLAYER_KEYS, chunk_size=1)
+        finally:
+            conn.close()
+        self.app.config.update(ONLINE_MIGRATIONS_ENABLED=True)
+        migrator = self.app.extensions['online_migrations']
+        migrator.migrations, migrator.chunk_size = (SESSION_PLAYER_KEYS,), 1
+        self.assertTrue(online_migrations.start_online_migrations(self.app).wait(10))
+        report = self.client.get('/ready').get_json()['migrations']
+        self.assertEqual(report['status'], 'done')
+        progress = report['migrations'][SESSION_PLAYER_KEYS.version]
+        self.assertEqual((progress['status'], progress['copied'], progress['total']), ('switched', 4, 4))
+        self.assertEqual([row['status'] for row in online_migrations.migration_progress(self.path)], ['switched'])
+
+
+class JsonImportTests(ReadPathCase):
+    LEGACY = {
+        'version': 3,
+        'players': {f'p-{i}': {'name': name, 'created_at': '2025-01-01 00:00:00', 'updated_at': '2025-01-01 00:00:00'}
+                    for i, name in enumerate(['Alice', 'Bob', 'Carol', '小明'])},
+        'sessions': {
+            's-1': {'name': 'Named', 'timestamp': '2025-01-02 10:00:00', 'active': False,
+                    'players': ['alice', 'Bob', '小明', 'Ghost'],
+                    'records': [{'winner_id': 'p-0', 'loser_id': 'p-1', 'score': 7, 'timestamp': '2025-01-02 10:05:00',
+                                 'special_score_part': '小金'},
+                                {'winner_id': 'p-0', 'loser_id': 'p-1', 'score': 10, 'timestamp': '2025-01-02 10:06:00',
+                                 'special_score_part': '大金 1/2 (总分20)'},
+                                {'winner_id': 'p-0', 'loser_id': 'p-3', 'score': 10, 'timestamp': '2025-01-02 10:06:00',
+                                 'special_score_part': '大金 2/2 (总分20)'}]},
+            's-2': {'name': 'Ids', 'timestamp': '2025-02-03 10:00:00', 'player_ids': ['p-1', 'p-2', 'p-3'],
+                    'records': [{'winner_id': 'p-2', 'winner_id2': 'p-3', 'loser_id': 'p-1', 'score': 4,
+                                 'timestamp': '2025-02-03 10:05:00'}]},
+        },
+        'settings': {'nested': [1, 2.5, None, True, {'x': '}'}]},
+    }
+
+    def test_streaming_reader_matches_json_load_at_any_chunk_size(self):
+        text = json.dumps(self.LEGACY, ensure_ascii=False, indent=1)
+        expected = [(section, key, value) for section in json_import.SECTIONS
+                    for key, value in self.LEGACY[section].items()]
+        for chunk_size in (1, 7, 4096):
+            self.assertEqual(list(json_import.iter_legacy_entries(io.StringIO(text), chunk_size)), expected)
+        with self.assertRaises(ValueError):
+            list(json_import.iter_legacy_entries(io.StringIO(text[:len(text) // 2]), 16))
+
+    def test_file_import_batches_writes_and_cli_targets_an_org(self):
+        path = Path(self.tmp.name) / 'data.json'
+        path.write_text(json.dumps(self.LEGACY, ensure_ascii=False), encoding='utf-8')
+        with mock.patch.object(self.manager, 'get_connection', wraps=self.manager.get_connection) as connections:
+            report = json_import.import_json_file(self.manager, str(path), self.org_id, batch_size=2)
+        self.assertEqual(connections.call_count, 1)
+        self.assertEqual((report['players'], report['sessions'], report['records']), (4, 2, 3))
+        self.assertGreater(report['rows_per_second'], 0)
+        self.assertEqual(self.manager.get_session_with_players(self.org_id, 's-1')['scores'],
+                         {'Alice': 27, 'Bob': -17, '小明': -10})
+        self.assertEqual(self.manager.get_session_with_players(self.org_id, 's-2')['scores'],
+                         {'Bob': -4, 'Carol': 2, '小明': 2})
+        self.assertEqual([(r['score'], r['special_score']) for r in self.manager.get_session_records(self.org_id, 's-1')],
+                         [(20, '大金'), (7, '小金')])
+        self.assertEqual(self.manager.get_player_special_wins(self.org_id, 'p-0'),
+                         {'has_small_gold': True, 'has_big_gold': True})
+
+        other = self.manager.create_organization('Imported CLI', 'pbkdf2:sha256:600000$test$hash')
+        cli_legacy = {'players': {'c-1': dict(self.LEGACY['players']['p-0']), 'c-2': dict(self.LEGACY['players']['p-1'])},
+                      'sessions': {'c-s': {'name': 'CLI', 'timestamp': '2025-03-01 10:00:00', 'players': ['Alice', 'Bob'],
+                                           'records': [{'winner_id': 'c-1', 'loser_id': 'c-2', 'score': 3,
+                                                        'timestamp': '2025-03-01 10:01:00'}]}}}
+        path.write_text(json.dumps(cli_legacy), encoding='utf-8')
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(json_import.main([str(path), '--org', other['slug'], '--database', self.path]), 0)
+        self.assertIn('1 个场次', stdout.getvalue())
+        self.assertEqual(self.manager.get_session_with_players(other['org_id'], 'c-s')['scores'], {'Alice': 3, 'Bob': -3})
+        with mock.patch('sys.stderr', new_callable=io.StringIO):
+            self.assertEqual(json_import.main([str(path), '--org', 'missing-org', '--database', self.path]), 1)
+
+    def test_sessions_before_players_still_resolve_names(self):
+        path = Path(self.tmp.name) / 'data.json'
+        reordered = {'sessions': self.LEGACY['sessions'], 'players': self.LEGACY['players']}
+        path.write_text(json.dumps(reordered, ensure_ascii=False), encoding='utf-8')
+        report = json_import.import_json_file(self.manager, str(path), self.org_id, batch_size=2)
+        self.assertEqual((report['players'], report['sessions'], report['records']), (4, 2, 3))
+        self.assertEqual(self.manager.get_session_with_players(self.org_id, 's-1')['scores'],
+                         {'Alice': 27, 'Bob': -17, '小明': -10})
+
+
+class OrgArchiveTests(ReadPathCase):
+    def snapshot(self, org_id):
+        """Org contents with every UUID replaced by the player name or a stable position."""
+        with self.manager.get_connection() as conn:
+            names = dict(conn.execute('SELECT player_id, name FROM players WHERE org_id = ?', (org_id,)).fetchall())
+            name = lambda value: names.get(value, value)
+            return {
+                'players': sorted(tuple(r) for r in conn.execute('SELECT name, is_retired FROM players WHERE org_id = ?',
+                                                                 (org_id,))),
+                'scores': sorted((name(r[0]), r[1]) for r in conn.execute(
+                    'SELECT player_id, score FROM session_players WHERE org_id = ?', (org_id,))),
+                'records': [tuple(map(name, r)) for r in conn.execute(
+                    '''SELECT winner_id, winner_id2, loser_id, loser_id2, score, special_score, created_epoch
+                       FROM game_records WHERE org_id = ? ORDER BY record_id''', (org_id,))],
+                'retirements': [(name(r[0]), r[1]) for r in conn.execute(
+                    'SELECT player_id, action FROM player_retirement_log WHERE org_id = ? ORDER BY id', (org_id,))],
+                'matches': [tuple(map(name, r)) for r in conn.execute(
+                    '''SELECT round_index, player1_id, player2_id, winner_id, player1_games_won FROM tournament_matches
+                       WHERE org_id = ? ORDER BY round_index, slot_index''', (org_id,))],
+                'games': [name(r[0]) for r in conn.execute(
+                    'SELECT winner_id FROM tournament_match_games WHERE org_id = ?', (org_id,))],
+                'ledger': sorted((r[0], r[1]) for r in conn.execute(
+                    'SELECT kind, count FROM player_achievement_counts WHERE org_id = ?', (org_id,))),
+                'months': [tuple(r) for r in conn.execute('SELECT month, session_count, game_count FROM org_month_activity '
+                                                          'WHERE org_id = ?', (org_id,))],
+                'unkeyed': conn.execute('SELECT COUNT(*) FROM game_records WHERE org_id = ? AND session_pk IS NULL',
+                                        (org_id,)).fetchone()[0],
+            }
+
+    def test_ndjson_export_route_round_trips_into_a_new_org(self):
+        session_id, ids = self.seed_org()
+        url = f"/o/{self.org['slug']}/admin/export"
+        self.assertEqual(self.client.get(url).status_code, 302)
+        with self.client.session_transaction() as sess:
+            sess['super_admin_authenticated'] = True
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment;', response.headers['Content-Disposition'])
+        path = Path(self.tmp.name) / 'org.ndjson.gz'
+        path.write_bytes(response.data)
+        result = org_archive.import_organization(self.manager, org_archive.read_archive(str(path)),
+                                                 'pbkdf2:sha256:600000$test$hash', name='Moved Org')
+        moved = result['organization']
+        self.assertEqual(result['counts']['game_records'], 8)
+        self.assertEqual(self.snapshot(moved['org_id']), self.snapshot(self.org_id))
+        self.assertEqual(self.snapshot(moved['org_id'])['unkeyed'], 0)
+        with self.manager.get_connection() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM players WHERE org_id = ? AND player_id IN (?, ?, ?, ?)',
+                                          (moved['org_id'], *ids.values())).fetchone()[0], 0)
+            self.assertEqual(conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual(self.client.get(f"/o/{moved['slug']}/").status_code, 200)
+
+    def test_sqlite_export_cli_and_incomplete_archives_are_rejected(self):
+        self.seed_org()
+        path = str(Path(self.tmp.name) / 'org.sqlite')
+        with mock.patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(org_archive.main(['--database', self.path, 'export', self.org['slug'], path,
+                                               '--format', 'sqlite']), 0)
+            with mock.patch.dict(os.environ, {'ORG_ADMIN_PASSWORD': 'correct horse battery'}):
+                self.assertEqual(org_archive.main(['--database', self.path, 'import', path, '--name', 'From SQLite']), 0)
+        moved = self.manager.get_organization_by_name_or_slug('From SQLite')
+        self.assertEqual(self.snapshot(moved['org_id']), self.snapshot(self.org_id))
+
+        entries = list(org_archive.iter_organization_rows(self.manager, self.org_id))
+        with self.assertRaises(ValueError):
+            org_archive.import_organization(self.manager, entries[:-1], 'pbkdf2:sha256:600000$test$hash', name='Broken')
+        with self.assertRaises(ValueError):
+            org_archive.import_organization(self.manager, entries, 'pbkdf2:sha256:600000$test$hash', name='Read Paths')
+        self.assertIsNone(self.manager.get_organization_by_name_or_slug('Broken'))
+
+
+class OrgPurgeTests(ReadPathCase):
+    def org_rows(self, org_id):
+        with self.manager.get_connection() as conn:
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+                      if 'org_id' in {column[1] for column in conn.execute(f'PRAGMA table_info({row[0]})')}]
+            counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table} WHERE org_id = ?', (org_id,)).fetchone()[0]
+                      for table in tables if table != 'org_purges'}
+        return {table: count for table, count in counts.items() if count}
+
+    def test_purge_hides_org_deletes_in_batches_and_resumes(self):
+        self.seed_org()
+        other = self.manager.create_organization('Bystander', 'pbkdf2:sha256:600000$test$hash')
+        other_player = self.manager.create_player(other['org_id'], 'Zed')
+        before = self.org_rows(other['org_id'])
+        with self.assertRaises(ValueError):
+            org_purge.request_purge(self.manager, self.manager.get_ems_organization()['org_id'])
+
+        self.assertEqual(org_purge.request_purge(self.manager, self.org_id)['status'], 'pending')
+        self.assertEqual(self.client.get(f"/o/{self.org['slug']}/").status_code, 404)
+        self.assertIsNone(self.manager.get_organization_by_name_or_slug('Read Paths'))
+        self.assertTrue(self.manager.organization_slug_exists(self.org['slug']))
+
+        seen = []
+        purge = org_purge.OrgPurge(self.manager, self.org_id, batch_size=3, pause=0)
+        progress = purge.run(on_progress=seen.append, should_stop=lambda: len(seen) >= 4)
+        self.assertEqual(progress['status'], 'running')
+        self.assertEqual((len(seen), progress['deleted'], progress['current_table']), (4, 7, 'tournament_participants'))
+        self.assertTrue(self.org_rows(self.org_id))
+        # 清除中途其他组织照常写入
+        self.manager.update_player_name(other['org_id'], other_player, 'Zed Two')
+
+        self.app.config['ORG_PURGE_RESUME'] = True
+        org_purge.resume_pending_purges(self.app, background=False)
+        progress = org_purge.get_purge(self.manager, self.org_id)
+        self.assertEqual(progress['status'], 'done')
+        self.assertEqual(self.org_rows(self.org_id), {})
+        self.assertIsNone(self.manager.get_organization_by_id(self.org_id))
+        self.assertEqual(self.org_rows(other['org_id']), before)
+        with self.manager.get_connection() as conn:
+            self.assertEqual(conn.execute('PRAGMA foreign_key_check').fetchall(), [])
+        self.assertEqual(self.manager.create_organization('Read Paths', 'pbkdf2:sha256:600000$test$hash')['slug'],
+                         self.org['slug'])
+
+    def test_cli_purges_by_slug(self):
+        self.seed_games(rounds=1)
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+             mock.patch('sys.stderr', new_callable=io.StringIO):
+            self.assertEqual(org_purge.main([self.org['slug'], '--database', self.path, '--pause', '0']), 0)
+            self.assertEqual(org_purge.main(['missing-org', '--database', self.path]), 1)
+        self.assertIn('已清除', stdout.getvalue())
+        self.assertEqual(self.org_rows(self.org_id), {})
+
+
+class BackupTests(ReadPathCase):
+    def test_snapshot_is_checked_compressed_and_restorable(self):
+        session_id, _ = self.seed_games(rounds=2)
+        directory = os.path.join(self.tmp.name, 'backups')
+        steps = []
+        backup.online_copy(self.path, os.path.join(self.tmp.name, 'copy.db'), pages=2, pause=0,
+                           progress=lambda remaining, total: steps.append(remaining))
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(steps[-1], 0)
+
+        result = backup.create_backup(self.path, directory, pages=2, pause=0)
+        self.assertTrue(result['path'].endswith('.db.gz'))
+        self.assertEqual([snapshot['path'] for snapshot in backup.list_backups(directory)], [result['path']])
+        self.assertEqual(sorted(os.listdir(directory)), [os.path.basename(result['path'])])
+        records = self.manager.get_session_records(self.org_id, session_id)
+
+        self.manager.delete_game_record(self.org_id, records[0]['record_id'])
+        previous = backup.restore_backup(result['path'], self.path)
+        self.assertTrue(os.path.exists(previous))
+        self.assertEqual(len(self.manager.get_session_records(self.org_id, session_id)), len(records))
+
+    def test_restore_keeps_wal_pages_with_the_replaced_database(self):
+        directory = os.path.join(self.tmp.name, 'backups')
+        live = os.path.join(self.tmp.name, 'live.db')
+        with sqlite3.connect(live) as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('CREATE TABLE notes (body TEXT)')
+            conn.execute("INSERT INTO notes VALUES ('in snapshot')")
+        snapshot = backup.create_backup(live, directory, pause=0)['path']
+        # Exit without a checkpoint so the commit only lives in the -wal file
+        subprocess.run([sys.executable, '-c', (
+            "import os, sqlite3\n"
+            f"conn = sqlite3.connect({live!r})\n"
+            "conn.execute('PRAGMA wal_autocheckpoint = 0')\n"
+            "conn.execute(\"INSERT INTO notes VALUES ('only in wal')\")\n"
+            "conn.commit()\n"
+            "os._exit(0)\n")], check=True)
+        self.assertTrue(os.path.exists(live + '-wal'))
+
+        previous = backup.restore_backup(snapshot, live)
+        self.assertFalse(os.path.exists(live + '-wal'))
+        with sqlite3.connect(live) as conn:
+            self.assertEqual(conn.execute('SELECT body FROM notes').fetchall(), [('in snapshot',)])
+        with sqlite3.connect(previous) as conn:
+            self.assertEqual(conn.execute('SELECT body FROM notes ORDER BY rowid').fetchall(),
+                             [('in snapshot',), ('only in wal',)])
+
+    def test_corrupt_copy_is_rejected(self):
+        broken = os.path.join(self.tmp.name, 'broken.db')
+        with open(self.path, 'rb') as source:
+            data = bytearray(source.read())
+        data[4096 * 2:4096 * 3] = b'\xff' * 4096
+        with open(broken, 'wb') as target:
+            target.write(data)
+        with self.assertRaises((backup.BackupError, sqlite3.DatabaseError)):
+            backup.create_backup(broken, os.path.join(self.tmp.name, 'backups'), pause=0)
+        self.assertEqual(backup.list_backups(os.path.join(self.tmp.name, 'backups')), [])
+
+    def test_retention_keeps_recent_and_daily_snapshots(self):
+        directory = os.path.join(self.tmp.name, 'backups')
+        os.makedirs(directory)
+        now = datetime(2026, 10, 19, 12, tzinfo=timezone.utc)
+        for hours in range(0, 24 * 5, 6):
+            taken_at = now - timedelta(hours=hours)
+            Path(directory, f"ems-{taken_at.strftime('%Y%m%dT%H%M%SZ')}.db.gz").write_bytes(b'')
+        removed = backup.prune_backups(directory, keep_last=3, keep_daily=3, now=now)
+        kept = [snapshot['taken_at'] for snapshot in backup.list_backups(directory)]
+        self.assertEqual(len(removed), 20 - len(kept))
+        self.assertEqual(kept, [now, now - timedelta(hours=6), now - timedelta(hours=12),
+                                now - timedelta(hours=18), now - timedelta(hours=42)])
+
+    def test_scheduler_reports_on_ready_and_skips_when_locked(self):
+        directory = os.path.join(self.tmp.name, 'backups')
+        scheduler = self.app.extensions['backups']
+        self.assertEqual(self.client.get('/ready').get_json()['backups']['status'], 'disabled')
+        scheduler.directory, scheduler.pause = directory, 0
+        self.assertIsNotNone(scheduler.run_once())
+        if backup.fcntl is not None:
+            with backup._directory_lock(directory) as acquired:
+                self.assertTrue(acquired)
+                self.assertIsNone(scheduler.run_once())
+        self.assertEqual(len(backup.list_backups(directory)), 1)
+        self.assertEqual(self.client.get('/ready').get_json()['backups']['last']['path'], scheduler.last['path'])
+
+    def test_cli_create_list_restore(self):
+        directory = os.path.join(self.tmp.name, 'backups')
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(backup.main(['--database', self.path, 'create', '--dir', directory, '--pause', '0']), 0)
+            self.assertEqual(backup.main(['list', '--dir', directory]), 0)
+            snapshot = backup.list_backups(directory)[0]['path']
+            self.assertEqual(backup.main(['--database', self.path, 'restore', snapshot]), 0)
+        self.assertIn(os.path.basename(snapshot), stdout.getvalue())
+        self.assertIn('已恢复', stdout.getvalue())
+
+
+class LocalReplicaTests(ReadPathCase):
+    def replica_app(self):
+        app = wsgi.create_app({'TESTING': True, 'DATABASE_PATH': self.path, 'SECRET_KEY': 'test',
+                               'LOCAL_DB_DIR': os.path.join(self.tmp.name, 'local')})
+        return app, app.extensions['database'], app.extensions['local_replica']
+
+    def player_names(self, manager):
+        return sorted(player['name'] for player in manager.get_all_players(self.org_id))
+
+    def test_boot_restores_local_copy_and_sync_writes_back(self):
+        self.seed_games(rounds=1)
+        app, manager, replica = self.replica_app()
+        self.assertEqual(manager.db_path, os.path.join(self.tmp.name, 'local', 'reads.db'))
+        self.assertEqual(replica.prepared, 'restored')
+        self.assertEqual(self.player_names(manager), self.player_names(self.manager))
+
+        manager.create_player(self.org_id, 'Eve')
+        self.assertNotIn('Eve', self.player_names(self.manager))
+        self.assertIsNotNone(replica.sync())
+        self.assertIn('Eve', self.player_names(self.manager))
+        self.assertIsNone(replica.sync())
+        self.assertEqual(app.test_client().get('/ready').get_json()['replica']['syncs'], 1)
+
+        manager.create_player(self.org_id, 'Frank')
+        replica.shutdown()
+        self.assertEqual(replica.status, 'stopped')
+        self.assertIn('Frank', self.player_names(self.manager))
+        self.assertEqual(self.replica_app()[2].prepared, 'local')
+
+    def test_unsynced_local_commits_are_written_back_at_boot(self):
+        _, manager, replica = self.replica_app()
+        replica.sync()
+        manager.create_player(self.org_id, 'Grace')
+        _, manager, replica = self.replica_app()
+        self.assertEqual(replica.prepared, 'recovered')
+        self.assertIn('Grace', self.player_names(self.manager))
+        self.assertIn('Grace', self.player_names(manager))
+
+    def test_externally_replaced_durable_copy_wins_and_local_is_kept_aside(self):
+        _, manager, replica = self.replica_app()
+        replica.sync()
+        manager.create_player(self.org_id, 'Local Only')
+        self.manager.create_player(self.org_id, 'Restored')
+        _, manager, replica = self.replica_app()
+        self.assertEqual(replica.prepared, 'restored')
+        self.assertEqual(self.player_names(manager), ['Restored'])
+        self.assertTrue(any('.conflict-' in name for name in os.listdir(os.path.join(self.tmp.name, 'local'))))
+
+    def test_set_aside_copy_keeps_its_journal(self):
+        _, manager, replica = self.replica_app()
+        replica.sync()
+        manager.create_player(self.org_id, 'Local Only')
+        Path(replica.local_path + '-journal').write_bytes(b'')
+        self.manager.create_player(self.org_id, 'Restored')
+        self.replica_app()
+        names = os.listdir(os.path.join(self.tmp.name, 'local'))
+        conflict = next(name for name in names if '.conflict-' in name and not name.endswith('-journal'))
+        self.assertIn(conflict + '-journal', names)
+        self.assertNotIn('reads.db-journal', names)
+
+    def test_change_counter_tracks_commits(self):
+        before = local_replica.change_counter(self.path)
+        self.manager.create_player(self.org_id, 'Heidi')
+        self.assertNotEqual(local_replica.change_counter(self.path), before)
+        self.assertIsNone(local_replica.change_counter(os.path.join(self.tmp.name, 'missing.db')))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)